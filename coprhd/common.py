@@ -15,6 +15,8 @@
 
 import base64
 import binascii
+import hashlib
+import os
 import random
 import string
 
@@ -23,6 +25,7 @@ from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import encodeutils
 from oslo_utils import excutils
+from oslo_utils import timeutils
 from oslo_utils import units
 import six
 
@@ -38,19 +41,26 @@ from cinder.volume.drivers.coprhd.helpers import (
     consistencygroup as coprhd_cg)
 from cinder.volume.drivers.coprhd.helpers import exportgroup as coprhd_eg
 from cinder.volume.drivers.coprhd.helpers import host as coprhd_host
+from cinder.volume.drivers.coprhd.helpers import project as coprhd_project
 from cinder.volume.drivers.coprhd.helpers import snapshot as coprhd_snap
 from cinder.volume.drivers.coprhd.helpers import tag as coprhd_tag
 
 from cinder.volume.drivers.coprhd.helpers import (
     virtualarray as coprhd_varray)
+from cinder.volume.drivers.coprhd.helpers import (
+    virtualpool as coprhd_vpool)
 from cinder.volume.drivers.coprhd.helpers import volume as coprhd_vol
 from cinder.volume import utils as volume_utils
 from cinder.volume import volume_types
 
 LOG = logging.getLogger(__name__)
 
-MAX_RETRIES = 10
-INTERVAL_10_SEC = 10
+# ceiling of the delay between the checks for the LUN of an attached
+# volume, see coprhd_attach_poll_interval
+ATTACH_POLL_MAX_INTERVAL = 2.0
+
+# refresh intervals after which the volume stats are reported stale
+STATS_STALE_INTERVALS = 3
 
 volume_opts = [
     cfg.StrOpt('coprhd_hostname',
@@ -78,7 +88,133 @@ volume_opts = [
     cfg.BoolOpt('coprhd_emulate_snapshot',
                 default=False,
                 help='True | False to indicate if the storage array '
-                'in CoprHD is VMAX or VPLEX')
+                'in CoprHD is VMAX or VPLEX'),
+    cfg.IntOpt('coprhd_http_pool_size',
+               default=coprhd_utils.DEFAULT_POOL_SIZE,
+               min=1,
+               help='Maximum number of pooled HTTP connections kept open '
+               'to the CoprHD Instance'),
+    cfg.BoolOpt('coprhd_http_coalesce_gets',
+                default=True,
+                help='Send a GET request to the CoprHD Instance only once '
+                'while an identical one is in flight, its response is '
+                'shared'),
+    cfg.IntOpt('coprhd_fanout_concurrency',
+               default=coprhd_utils.DEFAULT_FANOUT_CONCURRENCY,
+               min=1,
+               help='Maximum number of concurrent show requests sent to '
+               'the CoprHD Instance when looking up resources by name'),
+    cfg.BoolOpt('coprhd_http_keepalive',
+                default=True,
+                help='Reuse HTTP connections to the CoprHD Instance '
+                'between REST calls'),
+    cfg.IntOpt('coprhd_http_connect_timeout',
+               default=coprhd_utils.TIMEOUT_SEC,
+               min=1,
+               help='Timeout in seconds for connecting to the CoprHD '
+               'Instance'),
+    cfg.IntOpt('coprhd_http_read_timeout',
+               default=coprhd_utils.DEFAULT_READ_TIMEOUT,
+               min=1,
+               help='Timeout in seconds for reading a REST response from '
+               'the CoprHD Instance'),
+    cfg.IntOpt('coprhd_volume_catalog_refresh_interval',
+               default=300,
+               min=0,
+               help='Interval in seconds between background refreshes of '
+               'the cached index of CoprHD volume names, 0 disables them'),
+    cfg.IntOpt('coprhd_resource_cache_size',
+               default=coprhd_utils.DEFAULT_CACHE_SIZE,
+               min=1,
+               help='Maximum number of Cinder to CoprHD resource mappings '
+               'cached by the driver'),
+    cfg.IntOpt('coprhd_resource_cache_ttl',
+               default=coprhd_utils.DEFAULT_CACHE_TTL,
+               min=0,
+               help='Time in seconds a cached Cinder to CoprHD resource '
+               'mapping is used'),
+    cfg.IntOpt('coprhd_resource_cache_negative_ttl',
+               default=30,
+               min=0,
+               help='Time in seconds a failed lookup of the CoprHD resource '
+               'of a Cinder id is cached'),
+    cfg.FloatOpt('coprhd_task_poll_initial_delay',
+                 default=None,
+                 min=0,
+                 help='Delay in seconds before the first poll of a CoprHD '
+                 'task. Default depends on the type of the operation'),
+    cfg.FloatOpt('coprhd_task_poll_backoff',
+                 default=None,
+                 min=1,
+                 help='Factor the delay between the polls of a CoprHD task '
+                 'grows by. Default depends on the type of the operation'),
+    cfg.FloatOpt('coprhd_task_poll_max_delay',
+                 default=None,
+                 min=0,
+                 help='Maximum delay in seconds between the polls of a '
+                 'CoprHD task. Default depends on the type of the '
+                 'operation'),
+    cfg.BoolOpt('coprhd_task_tracker',
+                default=True,
+                help='Poll the pending CoprHD tasks of all operations '
+                'together from one background thread'),
+    cfg.FloatOpt('coprhd_attach_poll_interval',
+                 default=0.2,
+                 min=0.01,
+                 help='First delay in seconds between the checks for the '
+                 'LUN of an attached volume, it doubles up to 2 seconds'),
+    cfg.IntOpt('coprhd_attach_poll_timeout',
+               default=100,
+               min=0,
+               help='Time in seconds to wait for the LUN of an attached '
+               'volume to be reported by CoprHD'),
+    cfg.FloatOpt('coprhd_attach_batch_window',
+                 default=0,
+                 min=0,
+                 help='Time in seconds to collect the concurrent attaches '
+                 'to one export group into a single update, 0 disables '
+                 'the batching'),
+    cfg.FloatOpt('coprhd_detach_batch_window',
+                 default=0,
+                 min=0,
+                 help='Time in seconds to collect the concurrent detaches '
+                 'from one export group into a single update, 0 disables '
+                 'the batching'),
+    cfg.IntOpt('coprhd_export_batch_max_size',
+               default=64,
+               min=1,
+               help='Maximum number of volumes in a batched update of an '
+               'export group'),
+    cfg.IntOpt('coprhd_itl_cache_ttl',
+               default=10,
+               min=0,
+               help='Time in seconds to cache the ITL maps of volumes and '
+               'initiators, 0 disables the caching'),
+    cfg.BoolOpt('coprhd_fc_full_mesh_zoning',
+                default=False,
+                help='Zone every FC initiator of a host with every target '
+                'of the volume, instead of the initiator and target pairs '
+                'exported by CoprHD'),
+    cfg.IntOpt('coprhd_stats_refresh_interval',
+               default=60,
+               min=0,
+               help='Interval in seconds to refresh the volume stats in the '
+               'background, 0 collects them on each stats report'),
+    cfg.IntOpt('coprhd_stats_refresh_timeout',
+               default=30,
+               min=1,
+               help='Time in seconds after which a refresh of the volume '
+               'stats is given up'),
+    cfg.IntOpt('coprhd_auth_token_lifetime',
+               default=3600,
+               min=60,
+               help='Age in seconds after which the CoprHD auth token is '
+               'renewed in the background'),
+    cfg.StrOpt('coprhd_auth_token_cache_dir',
+               default=None,
+               help='Directory to save the CoprHD auth token in, so that it '
+               'is reused after a restart. The token file is only readable '
+               'by the cinder-volume user')
 ]
 
 CONF = cfg.CONF
@@ -130,6 +266,9 @@ class EMCCoprHDDriverCommon(object):
 
     OPENSTACK_TAG = 'OpenStack'
 
+    # attributes the Cinder id can be tagged with, see _find_tagged_resource
+    TAG_ID_SCHEMES = ('id', 'obj_id')
+
     def __init__(self, protocol, default_backend_name, configuration=None):
         self.AUTHENTICATED = False
         self.protocol = protocol
@@ -138,6 +277,9 @@ class EMCCoprHDDriverCommon(object):
 
         self.init_coprhd_api_components()
 
+        # time from the start of an attach until the LUN is known
+        self.attach_latency = coprhd_utils.LatencyRecorder()
+
         self.stats = {'driver_version': '3.0.0.0',
                       'free_capacity_gb': 'unknown',
                       'reserved_percentage': '0',
@@ -150,36 +292,143 @@ class EMCCoprHDDriverCommon(object):
 
     def init_coprhd_api_components(self):
 
-        coprhd_utils.AUTH_TOKEN = None
+        # pooled keep-alive HTTP transport shared by all api objects of
+        # this backend
+        self.transport = coprhd_utils.CoprHDTransport(
+            self.configuration.coprhd_hostname,
+            self.configuration.coprhd_port,
+            pool_size=self.configuration.coprhd_http_pool_size,
+            connect_timeout=self.configuration.coprhd_http_connect_timeout,
+            read_timeout=self.configuration.coprhd_http_read_timeout,
+            keepalive=self.configuration.coprhd_http_keepalive,
+            coalesce_gets=self.configuration.coprhd_http_coalesce_gets)
+        self.transport.fan_out = coprhd_utils.FanOut(
+            self.configuration.coprhd_fanout_concurrency)
+        self.transport.token_manager = coprhd_auth.TokenManager(
+            coprhd_auth.Authentication(
+                self.configuration.coprhd_hostname,
+                self.configuration.coprhd_port,
+                self.transport),
+            self.configuration.coprhd_username,
+            self.configuration.coprhd_password,
+            self.configuration.coprhd_auth_token_lifetime,
+            self._get_token_cache_file())
+        self.transport.poll_schedules = coprhd_utils.get_poll_schedules(
+            initial=self.configuration.coprhd_task_poll_initial_delay,
+            factor=self.configuration.coprhd_task_poll_backoff,
+            ceiling=self.configuration.coprhd_task_poll_max_delay)
+        if self.configuration.coprhd_task_tracker:
+            self.transport.task_tracker = coprhd_utils.TaskTracker(
+                self.transport, self.transport.poll_schedules)
 
         # instantiate coprhd api objects for later use
         self.volume_obj = coprhd_vol.Volume(
             self.configuration.coprhd_hostname,
-            self.configuration.coprhd_port)
+            self.configuration.coprhd_port,
+            self.transport)
+
+        # Cinder id to CoprHD resource lookups
+        self.resource_cache = coprhd_utils.ExpiringLRUCache(
+            self.configuration.coprhd_resource_cache_size,
+            self.configuration.coprhd_resource_cache_ttl)
+        self.tag_schemes = {}
+
+        # index of volume names, used by all api objects to resolve volumes
+        self.transport.volume_catalog = coprhd_vol.VolumeCatalog(
+            self.volume_obj)
 
         self.exportgroup_obj = coprhd_eg.ExportGroup(
             self.configuration.coprhd_hostname,
-            self.configuration.coprhd_port)
+            self.configuration.coprhd_port,
+            self.transport)
 
         self.host_obj = coprhd_host.Host(
             self.configuration.coprhd_hostname,
-            self.configuration.coprhd_port)
+            self.configuration.coprhd_port,
+            self.transport)
+
+        self.initiator_index = coprhd_host.InitiatorIndex(
+            self.host_obj,
+            self.configuration.coprhd_tenant,
+            self.configuration.coprhd_resource_cache_ttl)
+
+        self.exportgroup_index = coprhd_eg.ExportGroupIndex(
+            self.exportgroup_obj,
+            self.configuration.coprhd_project,
+            self.configuration.coprhd_tenant,
+            self.configuration.coprhd_resource_cache_ttl)
+
+        self.attach_poll_schedule = coprhd_utils.PollSchedule(
+            self.configuration.coprhd_attach_poll_interval, 2.0,
+            ATTACH_POLL_MAX_INTERVAL)
+        self.attach_poll_timeout = (
+            self.configuration.coprhd_attach_poll_timeout)
+
+        # ITL maps by volume and by initiators, see get_exports_by_initiators
+        self.itl_cache = coprhd_utils.ITLCache(
+            self.configuration.coprhd_resource_cache_size,
+            self.configuration.coprhd_itl_cache_ttl)
+
+        self.stats_refresher = None
+        interval = self.configuration.coprhd_stats_refresh_interval
+        if interval:
+            self.stats_refresher = coprhd_utils.BackgroundRefresher(
+                lambda: dict(self.update_volume_stats()), interval,
+                self.configuration.coprhd_stats_refresh_timeout,
+                interval * STATS_STALE_INTERVALS)
+
+        # creations of export groups in progress, by host name
+        self.exportgroup_flight = coprhd_utils.SingleFlight()
+
+        self.attach_batcher = None
+        if self.configuration.coprhd_attach_batch_window:
+            self.attach_batcher = coprhd_utils.RequestBatcher(
+                self._attach_batch,
+                self.configuration.coprhd_attach_batch_window,
+                self.configuration.coprhd_export_batch_max_size)
+        self.detach_batcher = None
+        if self.configuration.coprhd_detach_batch_window:
+            self.detach_batcher = coprhd_utils.RequestBatcher(
+                self._detach_batch,
+                self.configuration.coprhd_detach_batch_window,
+                self.configuration.coprhd_export_batch_max_size)
 
         self.varray_obj = coprhd_varray.VirtualArray(
             self.configuration.coprhd_hostname,
-            self.configuration.coprhd_port)
+            self.configuration.coprhd_port,
+            self.transport)
+
+        self.vpool_obj = coprhd_vpool.VirtualPool(
+            self.configuration.coprhd_hostname,
+            self.configuration.coprhd_port,
+            self.transport)
 
         self.snapshot_obj = coprhd_snap.Snapshot(
             self.configuration.coprhd_hostname,
-            self.configuration.coprhd_port)
+            self.configuration.coprhd_port,
+            self.transport)
 
         self.consistencygroup_obj = coprhd_cg.ConsistencyGroup(
             self.configuration.coprhd_hostname,
-            self.configuration.coprhd_port)
+            self.configuration.coprhd_port,
+            self.transport)
 
         self.tag_obj = coprhd_tag.Tag(
             self.configuration.coprhd_hostname,
-            self.configuration.coprhd_port)
+            self.configuration.coprhd_port,
+            self.transport)
+
+    def _get_token_cache_file(self):
+        """Returns the file of the saved token of the backend, or None."""
+        cache_dir = self.configuration.coprhd_auth_token_cache_dir
+        if not cache_dir:
+            return None
+        # one file per CoprHD instance and user
+        key = hashlib.sha256(encodeutils.safe_encode(
+            "%s:%s:%s" % (self.configuration.coprhd_hostname,
+                          self.configuration.coprhd_port,
+                          self.configuration.coprhd_username))).hexdigest()
+        return os.path.join(cache_dir, 'coprhd-%s.token' % key[:16])
 
     def check_for_setup_error(self):
         # validate all of the coprhd_* configuration values
@@ -211,20 +460,36 @@ class EMCCoprHDDriverCommon(object):
             message = _("coprhd_varray is not set in cinder configuration")
             raise exception.VolumeBackendAPIException(data=message)
 
-    def authenticate_user(self):
-        # we should check to see if we are already authenticated before blindly
-        # doing it again
-        if self.AUTHENTICATED is False:
-            obj = coprhd_auth.Authentication(
-                self.configuration.coprhd_hostname,
-                self.configuration.coprhd_port)
+    def do_setup(self):
+        # resolve the URI of the configured tenant and project once, they
+        # are kept by the transport for all later operations
+        if (self.configuration.coprhd_tenant and
+                self.configuration.coprhd_project):
+            try:
+                self.authenticate_user()
+                coprhd_project.Project(
+                    self.configuration.coprhd_hostname,
+                    self.configuration.coprhd_port,
+                    self.transport).project_query(
+                        "%s/%s" % (self.configuration.coprhd_tenant,
+                                   self.configuration.coprhd_project))
+            except coprhd_utils.CoprHdError as e:
+                LOG.warning("Resolving the CoprHD project failed, it is"
+                            " resolved on first use: %s", e.msg)
+
+        catalog = self.transport.volume_catalog
+        if catalog is not None:
+            catalog.start_refresh(
+                self.configuration.coprhd_volume_catalog_refresh_interval)
 
-            username = self.configuration.coprhd_username
-            password = self.configuration.coprhd_password
+        if self.stats_refresher is not None:
+            self.stats_refresher.start()
 
-            coprhd_utils.AUTH_TOKEN = obj.authenticate_user(username,
-                                                            password)
-            self.AUTHENTICATED = True
+    def authenticate_user(self):
+        # the token manager of the backend logs in only when it has no
+        # valid token, once for all the concurrent callers
+        self.transport.token_manager.get_token()
+        self.AUTHENTICATED = True
 
     def create_volume(self, vol, driver, truncate_name=False):
         self.authenticate_user()
@@ -286,6 +551,7 @@ class EMCCoprHDDriverCommon(object):
             self.set_tags_for_resource(
                 coprhd_cg.ConsistencyGroup.URI_CONSISTENCY_GROUP_TAGS,
                 cg_uri, group)
+            self._cache_resource('consistencygroup', group.id, cg_uri, name)
 
         except coprhd_utils.CoprHdError as e:
             coprhd_err_msg = (_("Consistency Group %(name)s:"
@@ -309,12 +575,12 @@ class EMCCoprHDDriverCommon(object):
         try:
             if add_volumes:
                 for vol in add_volumes:
-                    vol_name = self._get_coprhd_volume_name(vol)
+                    vol_name = self._get_coprhd_volume_uri(vol)
                     add_volnames.append(vol_name)
 
             if remove_volumes:
                 for vol in remove_volumes:
-                    vol_name = self._get_coprhd_volume_name(vol)
+                    vol_name = self._get_coprhd_volume_uri(vol)
                     remove_volnames.append(vol_name)
 
             self.consistencygroup_obj.update(
@@ -347,7 +613,7 @@ class EMCCoprHDDriverCommon(object):
         try:
             for vol in volumes:
                 try:
-                    vol_name = self._get_coprhd_volume_name(vol)
+                    vol_name = self._get_coprhd_volume_uri(vol)
                     full_project_name = "%s/%s" % (
                         self.configuration.coprhd_tenant,
                         self.configuration.coprhd_project)
@@ -355,6 +621,7 @@ class EMCCoprHDDriverCommon(object):
                     self.volume_obj.delete(full_project_name, vol_name,
                                            sync=True,
                                            force_delete=True)
+                    self._uncache_resource('volume', vol.id)
 
                     update_item = {'id': vol.id,
                                    'status':
@@ -375,6 +642,7 @@ class EMCCoprHDDriverCommon(object):
                 name,
                 self.configuration.coprhd_project,
                 self.configuration.coprhd_tenant)
+            self._uncache_resource('consistencygroup', group.id)
 
             model_update = {}
             model_update['status'] = group.status
@@ -438,7 +706,8 @@ class EMCCoprHDDriverCommon(object):
                     coprhd_vol.Volume.URI_SEARCH_VOLUMES_BY_TAG.format(
                         tagname),
                     self.configuration.coprhd_hostname,
-                    self.configuration.coprhd_port)
+                    self.configuration.coprhd_port,
+                    transport=self.transport)
 
                 if not rslt:
                     continue
@@ -600,6 +869,8 @@ class EMCCoprHDDriverCommon(object):
 
         self.set_tags_for_resource(
             coprhd_vol.Volume.URI_TAG_VOLUME, vol_uri, vol, exempt_tags)
+        self._cache_resource('volume', vol.id, vol_uri, name)
+        return vol_uri
 
     @retry_wrapper
     def set_tags_for_resource(self, uri, resource_id, resource,
@@ -704,15 +975,16 @@ class EMCCoprHDDriverCommon(object):
                 self.configuration.coprhd_project,
                 self.configuration.coprhd_tenant)
 
-            self.volume_obj.clone(
-                name,
-                resource_id,
-                sync=True)
-
             full_project_name = "%s/%s" % (
                 self.configuration.coprhd_tenant,
                 self.configuration.coprhd_project)
 
+            self.volume_obj.clone(
+                name,
+                resource_id,
+                sync=True,
+                project_name=full_project_name)
+
             detachable = self.volume_obj.is_volume_detachable(
                 full_project_name, name)
             LOG.debug("Is volume detachable : %s", detachable)
@@ -768,7 +1040,7 @@ class EMCCoprHDDriverCommon(object):
     def expand_volume(self, vol, new_size):
         """expands the volume to new_size specified."""
         self.authenticate_user()
-        volume_name = self._get_coprhd_volume_name(vol)
+        volume_name = self._get_coprhd_volume_uri(vol)
         size_in_bytes = coprhd_utils.to_bytes("%sG" % new_size)
 
         try:
@@ -814,27 +1086,33 @@ class EMCCoprHDDriverCommon(object):
                                                   truncate_name)
 
         try:
-            coprhd_vol_info = self._get_coprhd_volume_name(
-                src_vol_ref, True)
-            src_snapshot_name = self._get_coprhd_snapshot_name(
-                snapshot, coprhd_vol_info['volume_uri'])
+            resource_id = self._get_provider_uri(snapshot)
+            if resource_id:
+                src_snapshot_name = resource_id
+            else:
+                coprhd_vol_info = self._get_coprhd_volume_name(
+                    src_vol_ref, True)
+                src_snapshot_name = self._get_coprhd_snapshot_name(
+                    snapshot, coprhd_vol_info['volume_uri'])
 
-            (storageres_type,
-             storageres_typename) = self.volume_obj.get_storageAttributes(
-                coprhd_vol_info['volume_name'], None, src_snapshot_name)
+                (storageres_type,
+                 storageres_typename) = self.volume_obj.get_storageAttributes(
+                    coprhd_vol_info['volume_name'], None, src_snapshot_name)
 
-            resource_id = self.volume_obj.storage_resource_query(
-                storageres_type,
-                coprhd_vol_info['volume_name'],
-                None,
-                src_snapshot_name,
-                self.configuration.coprhd_project,
-                self.configuration.coprhd_tenant)
+                resource_id = self.volume_obj.storage_resource_query(
+                    storageres_type,
+                    coprhd_vol_info['volume_name'],
+                    None,
+                    src_snapshot_name,
+                    self.configuration.coprhd_project,
+                    self.configuration.coprhd_tenant)
 
             self.volume_obj.clone(
                 new_volume_name,
                 resource_id,
-                sync=True)
+                sync=True,
+                project_name="%s/%s" % (self.configuration.coprhd_tenant,
+                                        self.configuration.coprhd_project))
 
         except coprhd_utils.CoprHdError as e:
             coprhd_err_msg = (_("Snapshot %(src_snapshot_name)s:"
@@ -870,14 +1148,16 @@ class EMCCoprHDDriverCommon(object):
     @retry_wrapper
     def delete_volume(self, vol):
         self.authenticate_user()
-        name = self._get_coprhd_volume_name(vol)
+        name = self._get_coprhd_volume_uri(vol)
         try:
             full_project_name = ("%s/%s" % (
                 self.configuration.coprhd_tenant,
                 self.configuration.coprhd_project))
             self.volume_obj.delete(full_project_name, name, sync=True)
+            self._uncache_resource('volume', vol.id)
         except coprhd_utils.CoprHdError as e:
             if e.err_code == coprhd_utils.CoprHdError.NOT_FOUND_ERR:
+                self._uncache_resource('volume', vol.id)
                 LOG.info(
                     "Volume %s"
                     " no longer exists; volume deletion is"
@@ -908,9 +1188,8 @@ class EMCCoprHDDriverCommon(object):
 
         if self.configuration.coprhd_emulate_snapshot:
             self.create_cloned_volume(snapshot, volume, truncate_name)
-            self.set_volume_tags(
+            return self.set_volume_tags(
                 snapshot, ['_volume', '_obj_volume_type'], truncate_name)
-            return
 
         try:
             snapshotname = self._get_resource_name(snapshot,
@@ -918,7 +1197,7 @@ class EMCCoprHDDriverCommon(object):
                                                    truncate_name)
             vol = snapshot.volume
 
-            volumename = self._get_coprhd_volume_name(vol)
+            volumename = self._get_coprhd_volume_uri(vol)
             projectname = self.configuration.coprhd_project
             tenantname = self.configuration.coprhd_tenant
             storageres_type = 'block'
@@ -931,23 +1210,22 @@ class EMCCoprHDDriverCommon(object):
                 tenant=tenantname)
             inactive = False
             sync = True
-            self.snapshot_obj.snapshot_create(
+            task = self.snapshot_obj.snapshot_create(
                 storageres_type,
                 storageres_typename,
                 resource_uri,
                 snapshotname,
                 inactive,
                 sync)
-
-            snapshot_uri = self.snapshot_obj.snapshot_query(
-                storageres_type,
-                storageres_typename,
-                resource_uri,
-                snapshotname)
+            # the resource of the completed task is the snapshot
+            snapshot_uri = task['resource']['id']
 
             self.set_tags_for_resource(
                 coprhd_snap.Snapshot.URI_BLOCK_SNAPSHOTS_TAG,
                 snapshot_uri, snapshot, ['_volume'])
+            self._cache_resource('snapshot', snapshot.id, snapshot_uri,
+                                 snapshotname)
+            return snapshot_uri
 
         except coprhd_utils.CoprHdError as e:
             coprhd_err_msg = (_("Snapshot: %(snapshotname)s, create failed"
@@ -979,7 +1257,7 @@ class EMCCoprHDDriverCommon(object):
 
         snapshotname = None
         try:
-            volumename = self._get_coprhd_volume_name(vol)
+            volumename = self._get_coprhd_volume_uri(vol)
             projectname = self.configuration.coprhd_project
             tenantname = self.configuration.coprhd_tenant
             storageres_type = 'block'
@@ -996,15 +1274,32 @@ class EMCCoprHDDriverCommon(object):
                     " is not found; snapshot deletion"
                     " is considered successful.", snapshotname)
             else:
-                snapshotname = self._get_coprhd_snapshot_name(
-                    snapshot, resource_uri)
-
-                self.snapshot_obj.snapshot_delete(
-                    storageres_type,
-                    storageres_typename,
-                    resource_uri,
-                    snapshotname,
-                    sync=True)
+                snapshot_uri = self._get_provider_uri(snapshot)
+                if snapshot_uri:
+                    snapshotname = snapshot_uri
+                    try:
+                        self.snapshot_obj.snapshot_delete_uri(
+                            storageres_type,
+                            resource_uri,
+                            snapshot_uri,
+                            True)
+                    except coprhd_utils.CoprHdError as e:
+                        if e.status_code != 404:
+                            raise
+                        LOG.info("Snapshot %s is not found; snapshot"
+                                 " deletion is considered successful.",
+                                 snapshotname)
+                else:
+                    snapshotname = self._get_coprhd_snapshot_name(
+                        snapshot, resource_uri)
+
+                    self.snapshot_obj.snapshot_delete(
+                        storageres_type,
+                        storageres_typename,
+                        resource_uri,
+                        snapshotname,
+                        sync=True)
+                self._uncache_resource('snapshot', snapshot.id)
         except coprhd_utils.CoprHdError as e:
             coprhd_err_msg = (_("Snapshot %s : Delete Failed\n") %
                               snapshotname)
@@ -1017,9 +1312,12 @@ class EMCCoprHDDriverCommon(object):
     def initialize_connection(self, volume, protocol, initiator_ports,
                               hostname):
 
+        watch = timeutils.StopWatch()
+        watch.start()
         try:
             self.authenticate_user()
-            volumename = self._get_coprhd_volume_name(volume)
+            # resolve the volume once, the export group is updated by URI
+            vol_uri = self._get_coprhd_volume_uri(volume)
             foundgroupname = self._find_exportgroup(initiator_ports)
             foundhostname = None
             if foundgroupname is None:
@@ -1036,37 +1334,39 @@ class EMCCoprHDDriverCommon(object):
 
                 if not foundhostname:
                     LOG.error("Auto host creation not supported")
-                # create an export group for this host
-                foundgroupname = foundhostname + 'SG'
-                # create a unique name
-                foundgroupname = foundgroupname + '-' + ''.join(
-                    random.choice(string.ascii_uppercase +
-                                  string.digits)
-                    for x in range(6))
-                self.exportgroup_obj.exportgroup_create(
-                    foundgroupname,
-                    self.configuration.coprhd_project,
-                    self.configuration.coprhd_tenant,
-                    self.configuration.coprhd_varray,
-                    'Host',
-                    foundhostname)
+                # concurrent first attaches of a host share one export group
+                foundgroupname = self.exportgroup_flight.do(
+                    foundhostname, self._create_exportgroup,
+                    foundhostname, initiator_ports)
+
+            if self.attach_batcher is not None:
+                LOG.debug("queueing the volume for the exportgroup %s: %s",
+                          foundgroupname, vol_uri)
+                itls = self.attach_batcher.submit(
+                    (foundgroupname, tuple(sorted(initiator_ports))),
+                    vol_uri)
+                self.attach_latency.record(watch.elapsed())
+                return itls
 
             LOG.debug(
-                "adding the volume to the exportgroup : %s", volumename)
+                "adding the volume %(volume)s to the exportgroup %(group)s",
+                {'volume': vol_uri, 'group': foundgroupname})
 
-            self.exportgroup_obj.exportgroup_add_volumes(
-                True,
-                foundgroupname,
-                self.configuration.coprhd_tenant,
-                None,
-                None,
-                None,
-                self.configuration.coprhd_project,
-                [volumename],
-                None,
-                None)
-
-            return self._find_device_info(volume, initiator_ports)
+            try:
+                self.exportgroup_obj.exportgroup_add_volumes_by_uri(
+                    foundgroupname, [vol_uri], True)
+            except coprhd_utils.CoprHdError:
+                with excutils.save_and_reraise_exception():
+                    # the group may no longer exist
+                    self.exportgroup_index.discard(foundgroupname)
+                    self.exportgroup_index.invalidate()
+            finally:
+                self.itl_cache.invalidate(initiator_ports=initiator_ports)
+
+            itls = self._find_device_info(volume, initiator_ports,
+                                          vol_uri)
+            self.attach_latency.record(watch.elapsed())
+            return itls
 
         except coprhd_utils.CoprHdError as e:
             raise coprhd_utils.CoprHdError(
@@ -1074,34 +1374,54 @@ class EMCCoprHDDriverCommon(object):
                 (_("Attach volume (%(name)s) to host"
                    " (%(hostname)s) initiator (%(initiatorport)s)"
                    " failed:\n%(err)s") %
-                 {'name': self._get_coprhd_volume_name(
-                     volume),
+                 {'name': volume['id'],
                   'hostname': hostname,
                   'initiatorport': initiator_ports[0],
                   'err': six.text_type(e.msg)})
             )
 
-    @retry_wrapper
     def terminate_connection(self, volume, protocol, initiator_ports,
                              hostname):
+        return self.detach_volume(volume, protocol, initiator_ports,
+                                  hostname)[0]
+
+    @retry_wrapper
+    def detach_volume(self, volume, protocol, initiator_ports, hostname):
+        """Removes a volume from the export groups of the initiators.
+
+        The ITL map of the initiators is fetched once, uncached. It gives
+        both the export groups to update and the volumes that remain
+        exported to the initiators after the detach, less the volumes that
+        the detach batcher removed together with this one.
+
+        :returns: the itls of the volume that were removed and the number
+                  of volumes still exported to the initiators
+        """
         try:
             self.authenticate_user()
-            volumename = self._get_coprhd_volume_name(volume)
-            full_project_name = ("%s/%s" % (self.configuration.coprhd_tenant,
-                                            self.configuration.coprhd_project))
-            voldetails = self.volume_obj.show(full_project_name, volumename)
-            volid = voldetails['id']
+            volid = self._get_coprhd_volume_uri(volume)
 
             # find the exportgroups
-            exports = self.volume_obj.get_exports_by_uri(volid)
+            itls = []
+            others = []
             exportgroups = set()
-            itls = exports['itl']
-            for itl in itls:
+            for itl in self._fetch_exports_by_initiators(initiator_ports):
+                if itl['device']['id'] != volid:
+                    others.append(itl)
+                    continue
+                itls.append(itl)
                 itl_port = itl['initiator']['port']
                 if itl_port in initiator_ports:
                     exportgroups.add(itl['export']['id'])
 
+            # (export group, volume) pairs removed by this detach
+            removed = set()
             for exportgroup in exportgroups:
+                if self.detach_batcher is not None:
+                    removed.update(
+                        (exportgroup, vol_uri) for vol_uri in
+                        self.detach_batcher.submit(exportgroup, volid))
+                    continue
                 self.exportgroup_obj.exportgroup_remove_volumes_by_uri(
                     exportgroup,
                     volid,
@@ -1110,25 +1430,45 @@ class EMCCoprHDDriverCommon(object):
                     None,
                     None,
                     None)
+            remaining = set(itl['device']['id'] for itl in others
+                            if (itl['export']['id'],
+                                itl['device']['id']) not in removed)
+            if exportgroups:
+                self.itl_cache.invalidate(volid, initiator_ports)
             else:
                 LOG.info(
                     "No export group found for the host: %s"
                     "; this is considered already detached.", hostname)
 
-            return itls
+            return itls, len(remaining)
 
         except coprhd_utils.CoprHdError as e:
             raise coprhd_utils.CoprHdError(
                 coprhd_utils.CoprHdError.SOS_FAILURE_ERR,
                 (_("Detaching volume %(volumename)s from host"
                    " %(hostname)s failed: %(err)s") %
-                 {'volumename': volumename,
+                 {'volumename': volume['id'],
                   'hostname': hostname,
                   'err': six.text_type(e.msg)})
             )
 
+    def _detach_batch(self, exportgroup_uri, vol_uris):
+        """Removes a batch of volumes from an export group.
+
+        Flush function of the detach batcher, returns for each of the
+        volumes the URIs of all the volumes removed, once the export group
+        has been updated.
+        """
+        LOG.debug("removing the volumes from the exportgroup %(group)s:"
+                  " %(volumes)s",
+                  {'group': exportgroup_uri, 'volumes': vol_uris})
+        self.exportgroup_obj.exportgroup_remove_volumes_by_uri(
+            exportgroup_uri, vol_uris, True)
+        removed = frozenset(vol_uris)
+        return dict((vol_uri, removed) for vol_uri in vol_uris)
+
     @retry_wrapper
-    def _find_device_info(self, volume, initiator_ports):
+    def _find_device_info(self, volume, initiator_ports, vol_uri=None):
         """Returns device_info in list of itls having the matched initiator.
 
         (there could be multiple targets, hence a list):
@@ -1151,79 +1491,170 @@ class EMCCoprHDDriverCommon(object):
                  }
                 ]
         """
-        volumename = self._get_coprhd_volume_name(volume)
-        full_project_name = ("%s/%s" % (self.configuration.coprhd_tenant,
-                                        self.configuration.coprhd_project))
-        vol_uri = self.volume_obj.volume_query(full_project_name, volumename)
+        if vol_uri is None:
+            vol_uri = self._get_coprhd_volume_uri(volume)
 
         # The itl info shall be available at the first try since now export is
-        # a synchronous call.  We are trying a few more times to accommodate
-        # any delay on filling in the itl info after the export task is
-        # completed.
+        # a synchronous call.  We keep checking on a short backoff schedule
+        # until the deadline to accommodate any delay on filling in the itl
+        # info after the export task is completed.
+
+        # a volume exported to the initiators before keeps its itls
+        cached = self.itl_cache.get_volume(vol_uri)
+        if cached:
+            itls = self._match_itls(cached, initiator_ports)
+            if itls:
+                return itls
 
-        itls = []
-        for x in range(MAX_RETRIES):
+        deadline = timeutils.StopWatch(duration=self.attach_poll_timeout)
+        deadline.start()
+        delays = self.attach_poll_schedule.delays()
+        while True:
             exports = self.volume_obj.get_exports_by_uri(vol_uri)
-            LOG.debug("Volume exports: ")
-            LOG.info(vol_uri)
-            LOG.debug(exports)
-            for itl in exports['itl']:
-                itl_port = itl['initiator']['port']
-                if itl_port in initiator_ports:
-                    found_device_number = itl['hlu']
-                    if (found_device_number is not None and
-                            found_device_number != '-1'):
-                        # 0 is a valid number for found_device_number.
-                        # Only loop if it is None or -1
-                        LOG.debug("Found Device Number: %s",
-                                  found_device_number)
-                        itls.append(itl)
+            LOG.debug("Volume %(uri)s exports: %(exports)s",
+                      {'uri': vol_uri, 'exports': exports})
+            itls = self._match_itls(exports['itl'], initiator_ports)
 
             if itls:
+                self.itl_cache.put_volume(vol_uri, exports['itl'])
                 break
-            else:
-                LOG.debug("Device Number not found yet."
-                          " Retrying after 10 seconds...")
-                eventlet.sleep(INTERVAL_10_SEC)
+            if deadline.expired():
+                break
+            LOG.debug("Device Number not found yet, retrying.")
+            eventlet.sleep(min(next(delays), deadline.leftover()))
 
-        if itls is None:
-            # No device number found after 10 tries; return an empty itl
+        if not itls:
+            # No device number found before the deadline; return an empty
+            # itl
             LOG.info(
-                "No device number has been found after 10 tries; "
-                "this likely indicates an unsuccessful attach of "
+                "No device number has been found after %(timeout)s "
+                "seconds; this likely indicates an unsuccessful attach of "
                 "volume volumename=%(volumename)s to"
                 " initiator  initiator_ports=%(initiator_ports)s",
-                {'volumename': volumename,
-                    'initiator_ports': initiator_ports})
+                {'timeout': self.attach_poll_timeout,
+                 'volumename': vol_uri,
+                 'initiator_ports': initiator_ports})
 
         return itls
 
-    def _get_coprhd_cgid(self, cgid):
-        tagname = self.OPENSTACK_TAG + ":id:" + cgid
-        rslt = coprhd_utils.search_by_tag(
-            coprhd_cg.ConsistencyGroup.URI_SEARCH_CONSISTENCY_GROUPS_BY_TAG.
-            format(tagname),
-            self.configuration.coprhd_hostname,
-            self.configuration.coprhd_port)
+    def _match_itls(self, itls, initiator_ports):
+        """Returns the itls of the initiators that have a device number."""
+        matched = []
+        for itl in itls:
+            itl_port = itl['initiator']['port']
+            if itl_port in initiator_ports:
+                found_device_number = itl['hlu']
+                if (found_device_number is not None and
+                        found_device_number != '-1'):
+                    # 0 is a valid number for found_device_number.
+                    # Only loop if it is None or -1
+                    LOG.debug("Found Device Number: %s",
+                              found_device_number)
+                    matched.append(itl)
+        return matched
+
+    def _create_exportgroup(self, hostname, initiator_ports):
+        """Creates an export group for a host, returns its URI.
+
+        Reuses the group of the initiators if it was created in between.
+        """
+        foundgroupname = self._find_exportgroup(initiator_ports)
+        if foundgroupname is not None:
+            return foundgroupname
+
+        # create an export group for this host
+        foundgroupname = hostname + 'SG'
+        # create a unique name
+        foundgroupname = foundgroupname + '-' + ''.join(
+            random.choice(string.ascii_uppercase +
+                          string.digits)
+            for x in range(6))
+        task = self.exportgroup_obj.exportgroup_create(
+            foundgroupname,
+            self.configuration.coprhd_project,
+            self.configuration.coprhd_tenant,
+            self.configuration.coprhd_varray,
+            'Host',
+            hostname)
+        foundgroupname = task['resource']['id']
+        self.exportgroup_index.add(foundgroupname, initiator_ports,
+                                   self._get_varray_uri())
+        return foundgroupname
 
-        # if the result is empty, then search with the tagname as
-        # "OpenStack:obj_id" the openstack attribute for id can be obj_id
-        # instead of id. this depends on the version
-        if rslt is None or len(rslt) == 0:
-            tagname = self.OPENSTACK_TAG + ":obj_id:" + cgid
-            rslt = coprhd_utils.search_by_tag(
-                coprhd_cg.ConsistencyGroup
-                .URI_SEARCH_CONSISTENCY_GROUPS_BY_TAG.
-                format(tagname),
-                self.configuration.coprhd_hostname,
-                self.configuration.coprhd_port)
+    def _attach_batch(self, key, vol_uris):
+        """Adds a batch of volumes to an export group.
 
-        if len(rslt) > 0:
-            rslt_cg = self.consistencygroup_obj.show(
-                rslt[0],
+        Flush function of the attach batcher, key is the export group URI
+        and the initiator ports of the attaches.
+        """
+        exportgroup_uri, initiator_ports = key
+        LOG.debug("adding the volumes to the exportgroup %(group)s:"
+                  " %(volumes)s",
+                  {'group': exportgroup_uri, 'volumes': vol_uris})
+        try:
+            self.exportgroup_obj.exportgroup_add_volumes_by_uri(
+                exportgroup_uri, vol_uris, True)
+        except coprhd_utils.CoprHdError:
+            with excutils.save_and_reraise_exception():
+                # the group may no longer exist
+                self.exportgroup_index.discard(exportgroup_uri)
+                self.exportgroup_index.invalidate()
+        finally:
+            self.itl_cache.invalidate(initiator_ports=initiator_ports)
+
+        return self._find_devices_info(vol_uris, initiator_ports)
+
+    def _find_devices_info(self, vol_uris, initiator_ports):
+        """Returns the itls of each of the volumes, by volume URI.
+
+        Like _find_device_info, with one query of the exports of the
+        initiators per check for all the volumes.
+        """
+        deadline = timeutils.StopWatch(duration=self.attach_poll_timeout)
+        deadline.start()
+        delays = self.attach_poll_schedule.delays()
+        found = dict((vol_uri, []) for vol_uri in vol_uris)
+        while True:
+            exports = self._fetch_exports_by_initiators(initiator_ports)
+            for vol_uri in found:
+                found[vol_uri] = self._match_itls(
+                    [itl for itl in exports
+                     if itl['device']['id'] == vol_uri],
+                    initiator_ports)
+
+            if all(found.values()):
+                self.itl_cache.put_initiators(initiator_ports, exports)
+                break
+            if deadline.expired():
+                break
+            LOG.debug("Device Numbers not found yet, retrying.")
+            eventlet.sleep(min(next(delays), deadline.leftover()))
+
+        missing = [vol_uri for vol_uri, itls in found.items() if not itls]
+        if missing:
+            LOG.info(
+                "No device number has been found after %(timeout)s "
+                "seconds for volumes %(volumes)s; this likely indicates an "
+                "unsuccessful attach to initiators %(initiator_ports)s",
+                {'timeout': self.attach_poll_timeout,
+                 'volumes': missing,
+                 'initiator_ports': initiator_ports})
+
+        return found
+
+    def _get_coprhd_cgid(self, cgid):
+        cg_uri = self._find_tagged_resource(
+            'consistencygroup',
+            coprhd_cg.ConsistencyGroup.URI_SEARCH_CONSISTENCY_GROUPS_BY_TAG,
+            cgid,
+            lambda uri: self.consistencygroup_obj.show(
+                uri,
                 self.configuration.coprhd_project,
-                self.configuration.coprhd_tenant)
-            return rslt_cg['id']
+                self.configuration.coprhd_tenant)['name'],
+            need_name=False)[0]
+
+        if cg_uri:
+            return cg_uri
         else:
             raise coprhd_utils.CoprHdError(
                 coprhd_utils.CoprHdError.NOT_FOUND_ERR,
@@ -1233,61 +1664,133 @@ class EMCCoprHDDriverCommon(object):
         return consisgrp.name
 
     def _get_coprhd_snapshot_name(self, snapshot, resUri):
-        tagname = self.OPENSTACK_TAG + ":id:" + snapshot['id']
-        rslt = coprhd_utils.search_by_tag(
-            coprhd_snap.Snapshot.URI_SEARCH_SNAPSHOT_BY_TAG.format(tagname),
-            self.configuration.coprhd_hostname,
-            self.configuration.coprhd_port)
-
-        # if the result is empty, then search with the tagname
-        # as "OpenStack:obj_id"
-        # as snapshots will be having the obj_id instead of just id.
-        if not rslt:
-            tagname = self.OPENSTACK_TAG + ":obj_id:" + snapshot['id']
-            rslt = coprhd_utils.search_by_tag(
-                coprhd_snap.Snapshot.URI_SEARCH_SNAPSHOT_BY_TAG.format(
-                    tagname),
-                self.configuration.coprhd_hostname,
-                self.configuration.coprhd_port)
+        snapshot_name = self._find_coprhd_snapshot(snapshot, resUri)[1]
 
-        if rslt is None or len(rslt) == 0:
+        if snapshot_name is None:
             return snapshot['name']
         else:
-            rslt_snap = self.snapshot_obj.snapshot_show_uri(
-                'block',
-                resUri,
-                rslt[0])
-            return rslt_snap['name']
-
-    def _get_coprhd_volume_name(self, vol, verbose=False):
-        tagname = self.OPENSTACK_TAG + ":id:" + vol.id
-        rslt = coprhd_utils.search_by_tag(
-            coprhd_vol.Volume.URI_SEARCH_VOLUMES_BY_TAG.format(tagname),
-            self.configuration.coprhd_hostname,
-            self.configuration.coprhd_port)
+            return snapshot_name
 
-        # if the result is empty, then search with the tagname
-        # as "OpenStack:obj_id"
-        # as snapshots will be having the obj_id instead of just id.
-        if len(rslt) == 0:
-            tagname = self.OPENSTACK_TAG + ":obj_id:" + vol.id
-            rslt = coprhd_utils.search_by_tag(
-                coprhd_vol.Volume.URI_SEARCH_VOLUMES_BY_TAG.format(tagname),
-                self.configuration.coprhd_hostname,
-                self.configuration.coprhd_port)
-
-        if len(rslt) > 0:
-            rslt_vol = self.volume_obj.show_by_uri(rslt[0])
+    def _find_coprhd_snapshot(self, snapshot, resUri, need_name=True):
+        return self._find_tagged_resource(
+            'snapshot',
+            coprhd_snap.Snapshot.URI_SEARCH_SNAPSHOT_BY_TAG,
+            snapshot['id'],
+            lambda uri: self.snapshot_obj.snapshot_show_uri(
+                'block', resUri, uri)['name'],
+            self._get_provider_uri(snapshot), need_name)
 
+    def _get_coprhd_volume_name(self, vol, verbose=False):
+        (volume_uri, volume_name) = self._find_tagged_resource(
+            'volume',
+            coprhd_vol.Volume.URI_SEARCH_VOLUMES_BY_TAG,
+            vol.id,
+            lambda uri: self.volume_obj.show_by_uri(uri)['name'],
+            self._get_provider_uri(vol))
+
+        if volume_uri:
             if verbose is True:
-                return {'volume_name': rslt_vol['name'], 'volume_uri': rslt[0]}
+                return {'volume_name': volume_name, 'volume_uri': volume_uri}
             else:
-                return rslt_vol['name']
+                return volume_name
         else:
             raise coprhd_utils.CoprHdError(
                 coprhd_utils.CoprHdError.NOT_FOUND_ERR,
                 (_("Volume %s not found") % vol['display_name']))
 
+    def _get_coprhd_volume_uri(self, vol):
+        """Returns the CoprHD URI of a Cinder volume."""
+        volume_uri = self._get_provider_uri(vol)
+        if volume_uri:
+            return volume_uri
+        return self._get_coprhd_volume_name(vol, True)['volume_uri']
+
+    def _get_provider_uri(self, resource):
+        """Returns the CoprHD URI stored in the provider_location.
+
+        Resources created by older versions of the driver have none until
+        update_provider_info has run.
+        """
+        location = getattr(resource, 'provider_location', None)
+        if location and coprhd_utils.is_uri(location):
+            return location
+        return None
+
+    def _find_tagged_resource(self, kind, search_uri, resource_id,
+                              get_name, known_uri=None, need_name=True):
+        """Maps a Cinder id to the CoprHD resource tagged with it.
+
+        Results are kept in the resource cache, misses for a shorter
+        time than hits.
+
+        :param kind: kind of the resource, volume, snapshot, ...
+        :param search_uri: tag search URI of that kind of resource
+        :param resource_id: Cinder id of the resource
+        :param get_name: function returning the name for a CoprHD URI
+        :param known_uri: CoprHD URI recorded for the resource, if any;
+                          the tag search is only done if it is stale
+        :param need_name: False if the caller only needs the URI; the
+                          name is then only fetched by a later caller
+                          that needs it
+        :returns: tuple of the CoprHD URI and name, both None if no
+                  resource is tagged with the id; the name is None as
+                  well if it was not needed
+        """
+        key = (kind, resource_id)
+        entry = self.resource_cache.get(key)
+        if entry is not None:
+            if entry[0] is None or entry[1] is not None or not need_name:
+                return entry[:2]
+            known_uri = entry[0]
+
+        if known_uri:
+            if not need_name:
+                entry = (known_uri, None, self.tag_schemes.get(kind))
+                self.resource_cache.put(key, entry)
+                return entry[:2]
+            try:
+                entry = (known_uri, get_name(known_uri),
+                         self.tag_schemes.get(kind))
+                self.resource_cache.put(key, entry)
+                return entry[:2]
+            except (coprhd_utils.CoprHdError, TypeError):
+                LOG.debug("CoprHD resource %(uri)s of %(kind)s %(id)s is"
+                          " not found, searching by tag.",
+                          {'uri': known_uri, 'kind': kind,
+                           'id': resource_id})
+
+        # the Cinder id is tagged as "OpenStack:id" or, depending on the
+        # version, as "OpenStack:obj_id"; search the scheme that matched
+        # last time first
+        preferred = self.tag_schemes.get(kind, 'id')
+        for scheme in (preferred,) + tuple(
+                s for s in self.TAG_ID_SCHEMES if s != preferred):
+            tagname = "%s:%s:%s" % (self.OPENSTACK_TAG, scheme, resource_id)
+            rslt = coprhd_utils.search_by_tag(
+                search_uri.format(tagname),
+                self.configuration.coprhd_hostname,
+                self.configuration.coprhd_port,
+                transport=self.transport)
+            if rslt:
+                self.tag_schemes[kind] = scheme
+                entry = (rslt[0], get_name(rslt[0]) if need_name else None,
+                         scheme)
+                self.resource_cache.put(key, entry)
+                return entry[:2]
+
+        self.resource_cache.put(
+            key, (None, None, None),
+            self.configuration.coprhd_resource_cache_negative_ttl)
+        return None, None
+
+    def _cache_resource(self, kind, resource_id, uri, name):
+        """Records the CoprHD resource just created for a Cinder id."""
+        self.resource_cache.put((kind, resource_id),
+                                (uri, name, self.tag_schemes.get(kind)))
+
+    def _uncache_resource(self, kind, resource_id):
+        self.resource_cache.invalidate((kind, resource_id))
+
     def _get_resource_name(self, resource,
                            max_name_cap=MAX_DEFAULT_NAME_LENGTH,
                            truncate_name=False):
@@ -1362,79 +1865,53 @@ class EMCCoprHDDriverCommon(object):
     @retry_wrapper
     def _find_exportgroup(self, initiator_ports):
         """Find export group with initiator ports same as given initiators."""
-        foundgroupname = None
-        grouplist = self.exportgroup_obj.exportgroup_list(
-            self.configuration.coprhd_project,
-            self.configuration.coprhd_tenant)
-        for groupid in grouplist:
-            groupdetails = self.exportgroup_obj.exportgroup_show(
-                groupid,
-                self.configuration.coprhd_project,
-                self.configuration.coprhd_tenant)
-            if groupdetails is not None:
-                if groupdetails['inactive']:
-                    continue
-                initiators = groupdetails['initiators']
-                if initiators is not None:
-                    inits_eg = set()
-                    for initiator in initiators:
-                        inits_eg.add(initiator['initiator_port'])
-
-                    if inits_eg <= set(initiator_ports):
-                        foundgroupname = groupdetails['name']
-                    if foundgroupname is not None:
-                        # Check the associated varray
-                        if groupdetails['varray']:
-                            varray_uri = groupdetails['varray']['id']
-                            varray_details = self.varray_obj.varray_show(
-                                varray_uri)
-                            if varray_details['name'] == (
-                                    self.configuration.coprhd_varray):
-                                LOG.debug(
-                                    "Found exportgroup %s",
-                                    foundgroupname)
-                                break
-
-                        # Not the right varray
-                        foundgroupname = None
+        foundgroup = self.exportgroup_index.find(initiator_ports,
+                                                 self._get_varray_uri())
+        if foundgroup is not None:
+            LOG.debug("Found exportgroup %s", foundgroup)
+        return foundgroup
 
-        return foundgroupname
+    def _get_varray_uri(self):
+        return self.varray_obj.varray_query(self.configuration.coprhd_varray)
 
     @retry_wrapper
     def _find_host(self, initiator_port):
         """Find the host, if exists, to which the given initiator belong."""
-        foundhostname = None
-        hosts = self.host_obj.list_all(self.configuration.coprhd_tenant)
-        for host in hosts:
-            initiators = self.host_obj.list_initiators(host['id'])
-            for initiator in initiators:
-                if initiator_port == initiator['name']:
-                    foundhostname = host['name']
-                    break
-
-            if foundhostname is not None:
-                break
+        return self.initiator_index.find(initiator_port)
 
-        return foundhostname
+    def get_exports_by_initiators(self, initiator_ports):
+        """Returns the ITL map of the initiators, cached for a short time."""
+        itls = self.itl_cache.get_initiators(initiator_ports)
+        if itls is None:
+            itls = self._fetch_exports_by_initiators(initiator_ports)
+            self.itl_cache.put_initiators(initiator_ports, itls)
+        return itls
 
     @retry_wrapper
-    def get_exports_count_by_initiators(self, initiator_ports):
-        """Fetches ITL map for a given list of initiator ports."""
+    def _fetch_exports_by_initiators(self, initiator_ports):
+        """Fetches ITL map for a given list of initiator ports.
+
+        Never coalesced, the map has to show the exports the caller has
+        just changed.
+        """
         comma_delimited_initiator_list = ",".join(initiator_ports)
         (s, h) = coprhd_utils.service_json_request(
             self.configuration.coprhd_hostname,
             self.configuration.coprhd_port, "GET",
             URI_BLOCK_EXPORTS_FOR_INITIATORS.format(
                 comma_delimited_initiator_list),
-            None)
+            None, transport=self.transport, coalesce=False)
 
         export_itl_maps = coprhd_utils.json_decode(s)
 
         if export_itl_maps is None:
-            return 0
+            return []
 
-        itls = export_itl_maps['itl']
-        return itls.__len__()
+        return export_itl_maps['itl']
+
+    def get_exports_count_by_initiators(self, initiator_ports):
+        """Returns the number of ITLs of the given initiator ports."""
+        return len(self.get_exports_by_initiators(initiator_ports))
 
     @retry_wrapper
     def update_volume_stats(self):
@@ -1445,52 +1922,162 @@ class EMCCoprHDDriverCommon(object):
         try:
             self.stats['consistencygroup_support'] = True
             self.stats['consistent_group_snapshot_enabled'] = True
-            vols = self.volume_obj.list_volumes(
-                self.configuration.coprhd_tenant +
-                "/" +
-                self.configuration.coprhd_project)
-
-            vpairs = set()
-            if len(vols) > 0:
-                for vol in vols:
-                    if vol:
-                        vpair = (vol["vpool"]["id"], vol["varray"]["id"])
-                        if vpair not in vpairs:
-                            vpairs.add(vpair)
+            vpairs = self._get_stats_vpairs()
 
             if len(vpairs) > 0:
+                # the capacity of each pair is queried concurrently
                 free_gb = 0.0
                 used_gb = 0.0
-                for vpair in vpairs:
-                    if vpair:
-                        (s, h) = coprhd_utils.service_json_request(
-                            self.configuration.coprhd_hostname,
-                            self.configuration.coprhd_port,
-                            "GET",
-                            URI_VPOOL_VARRAY_CAPACITY.format(vpair[0],
-                                                             vpair[1]),
-                            body=None)
-                        capacity = coprhd_utils.json_decode(s)
-
-                        free_gb += float(capacity["free_gb"])
-                        used_gb += float(capacity["used_gb"])
+                for capacity in self.transport.fan_out.map(
+                        self._get_vpair_capacity, vpairs):
+                    free_gb += float(capacity["free_gb"])
+                    used_gb += float(capacity["used_gb"])
 
                 self.stats['free_capacity_gb'] = free_gb
                 self.stats['total_capacity_gb'] = free_gb + used_gb
                 self.stats['reserved_percentage'] = (
                     self.configuration.reserved_percentage)
 
+            self.stats['coprhd_metrics'] = self.get_metrics()
             return self.stats
 
         except coprhd_utils.CoprHdError:
             with excutils.save_and_reraise_exception():
                 LOG.exception("Update volume stats failed")
 
+    def get_volume_stats(self):
+        """Returns the volume stats, collected in the background if enabled.
+
+        The last stats collected are returned at once, flagged with
+        coprhd_stats_stale once they are too old.
+        """
+        if self.stats_refresher is None:
+            return self.update_volume_stats()
+
+        stats, stale = self.stats_refresher.get()
+        if stats is None:
+            # no stats could be collected yet
+            return dict(self.stats, coprhd_stats_stale=True)
+        if stale:
+            LOG.warning("Reporting volume stats collected %s seconds ago",
+                        self.stats_refresher.age())
+        return dict(stats, coprhd_stats_stale=stale)
+
+    def _get_stats_vpairs(self):
+        """Returns the (vpool, varray) URI pairs to report capacity of.
+
+        These are the vpools named by the CoprHD:VPOOL extra spec of the
+        volume types of the backend in the configured varray, and the
+        pairs of the volumes already in the volume catalog.
+        """
+        varray_uri = self._get_varray_uri()
+        backend_name = self.stats['volume_backend_name']
+        vpairs = set()
+
+        ctxt = context.get_admin_context()
+        for volume_type in volume_types.get_all_types(ctxt).values():
+            specs = volume_type.get('extra_specs') or {}
+            vpool_name = specs.get('CoprHD:VPOOL')
+            if not vpool_name or specs.get(
+                    'volume_backend_name', backend_name) != backend_name:
+                continue
+            try:
+                vpairs.add((self.vpool_obj.vpool_query(vpool_name, 'block'),
+                            varray_uri))
+            except coprhd_utils.CoprHdError as e:
+                LOG.warning("Virtual pool %(vpool)s of volume type "
+                            "%(type)s not found: %(err)s",
+                            {'vpool': vpool_name,
+                             'type': volume_type.get('name'),
+                             'err': e.msg})
+
+        catalog = self.transport.volume_catalog
+        if catalog is not None:
+            for vol in catalog.volumes(self.configuration.coprhd_tenant +
+                                       "/" +
+                                       self.configuration.coprhd_project):
+                if vol.get('vpool') and vol.get('varray'):
+                    vpairs.add((vol['vpool'], vol['varray']))
+
+        return vpairs
+
+    def _get_vpair_capacity(self, vpair):
+        (s, h) = coprhd_utils.service_json_request(
+            self.configuration.coprhd_hostname,
+            self.configuration.coprhd_port,
+            "GET",
+            URI_VPOOL_VARRAY_CAPACITY.format(vpair[0], vpair[1]),
+            body=None, transport=self.transport)
+        return coprhd_utils.json_decode(s)
+
+    def get_metrics(self):
+        """Returns the internal counters of the driver for monitoring."""
+        metrics = {'transport': self.transport.get_stats(),
+                   'auth': self.transport.token_manager.get_stats(),
+                   'resource_cache': self.resource_cache.get_stats(),
+                   'tasks': self.transport.task_stats.get_stats(),
+                   'fan_out': self.transport.fan_out.get_stats(),
+                   'initiator_index': self.initiator_index.get_stats(),
+                   'exportgroup_index': self.exportgroup_index.get_stats(),
+                   'exportgroup_creation':
+                   self.exportgroup_flight.get_stats(),
+                   'attach_latency': self.attach_latency.get_stats()}
+        metrics['itl_cache'] = self.itl_cache.get_stats()
+        if self.stats_refresher is not None:
+            metrics['stats_refresh'] = self.stats_refresher.get_stats()
+        if self.attach_batcher is not None:
+            metrics['attach_batcher'] = self.attach_batcher.get_stats()
+        if self.detach_batcher is not None:
+            metrics['detach_batcher'] = self.detach_batcher.get_stats()
+        if self.transport.volume_catalog is not None:
+            metrics['volume_catalog'] = (
+                self.transport.volume_catalog.get_stats())
+        LOG.debug("CoprHD driver metrics: %s", metrics)
+        return metrics
+
+    @retry_wrapper
+    def update_provider_info(self, volumes, snapshots):
+        """Records the CoprHD URI of resources created by older versions.
+
+        Cinder only syncs the provider_id of the updates returned by
+        update_provider_info, so the provider_location is saved here.
+        """
+        self.authenticate_user()
+
+        for vol in volumes:
+            if self._get_provider_uri(vol):
+                continue
+            try:
+                vol.provider_location = self._get_coprhd_volume_uri(vol)
+                vol.save()
+            except coprhd_utils.CoprHdError:
+                LOG.warning("CoprHD volume of volume %s not found.", vol.id)
+
+        for snapshot in snapshots:
+            if self._get_provider_uri(snapshot):
+                continue
+            try:
+                if self.configuration.coprhd_emulate_snapshot:
+                    snapshot_uri = self._get_coprhd_volume_uri(snapshot)
+                else:
+                    snapshot_uri = self._find_coprhd_snapshot(
+                        snapshot,
+                        self._get_coprhd_volume_uri(snapshot.volume),
+                        need_name=False)[0]
+                if snapshot_uri:
+                    snapshot.provider_location = snapshot_uri
+                    snapshot.save()
+            except coprhd_utils.CoprHdError:
+                LOG.warning("CoprHD snapshot of snapshot %s not found.",
+                            snapshot.id)
+
+        return None, None
+
     @retry_wrapper
     def retype(self, ctxt, volume, new_type, diff, host):
         """changes the vpool type."""
         self.authenticate_user()
-        volume_name = self._get_coprhd_volume_name(volume)
+        volume_name = self._get_coprhd_volume_uri(volume)
         vpool_name = new_type['extra_specs']['CoprHD:VPOOL']
 
         try:
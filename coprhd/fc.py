@@ -49,23 +49,29 @@ class EMCCoprHDFCDriver(driver.FibreChannelDriver):
             default_backend_name=self.__class__.__name__,
             configuration=self.configuration)
 
+    def do_setup(self, context):
+        self.common.do_setup()
+
     def check_for_setup_error(self):
         self.common.check_for_setup_error()
 
     def create_volume(self, volume):
         """Creates a Volume."""
         self.common.create_volume(volume, self)
-        self.common.set_volume_tags(volume, ['_obj_volume_type'])
+        vol_uri = self.common.set_volume_tags(volume, ['_obj_volume_type'])
+        return {'provider_location': vol_uri}
 
     def create_cloned_volume(self, volume, src_vref):
         """Creates a cloned Volume."""
         self.common.create_cloned_volume(volume, src_vref)
-        self.common.set_volume_tags(volume, ['_obj_volume_type'])
+        vol_uri = self.common.set_volume_tags(volume, ['_obj_volume_type'])
+        return {'provider_location': vol_uri}
 
     def create_volume_from_snapshot(self, volume, snapshot):
         """Creates a volume from a snapshot."""
         self.common.create_volume_from_snapshot(snapshot, volume)
-        self.common.set_volume_tags(volume, ['_obj_volume_type'])
+        vol_uri = self.common.set_volume_tags(volume, ['_obj_volume_type'])
+        return {'provider_location': vol_uri}
 
     def extend_volume(self, volume, new_size):
         """expands the size of the volume."""
@@ -77,7 +83,8 @@ class EMCCoprHDFCDriver(driver.FibreChannelDriver):
 
     def create_snapshot(self, snapshot):
         """Creates a snapshot."""
-        self.common.create_snapshot(snapshot)
+        snapshot_uri = self.common.create_snapshot(snapshot)
+        return {'provider_location': snapshot_uri}
 
     def delete_snapshot(self, snapshot):
         """Deletes a snapshot."""
@@ -200,10 +207,9 @@ class EMCCoprHDFCDriver(driver.FibreChannelDriver):
         """Driver entry point to detach a volume from an instance."""
 
         init_ports = self._build_initport_list(connector)
-        itls = self.common.terminate_connection(volume, 'FC', init_ports,
-                                                connector['host'])
-
-        volumes_count = self.common.get_exports_count_by_initiators(init_ports)
+        # the volumes still exported to the initiators keep the zones
+        itls, volumes_count = self.common.detach_volume(
+            volume, 'FC', init_ports, connector['host'])
         if volumes_count > 0:
             # return empty data
             data = {'driver_volume_type': 'fibre_channel', 'data': {}}
@@ -220,10 +226,32 @@ class EMCCoprHDFCDriver(driver.FibreChannelDriver):
         return data
 
     def _build_initiator_target_map(self, itls, connector):
+        """Returns the target wwns and the targets of each initiator wwn.
+
+        Only the initiator and target pairs of the ITLs are zoned, unless
+        coprhd_fc_full_mesh_zoning is set.
+        """
+        if self.configuration.coprhd_fc_full_mesh_zoning:
+            return self._build_full_mesh_target_map(itls, connector)
 
         target_wwns = []
+        initiator_target_map = {}
         for itl in itls:
-            target_wwns.append(itl['target']['port'].replace(':', '').lower())
+            initiator = self._to_wwn(itl['initiator']['port'])
+            target = self._to_wwn(itl['target']['port'])
+            if target not in target_wwns:
+                target_wwns.append(target)
+            targets = initiator_target_map.setdefault(initiator, [])
+            if target not in targets:
+                targets.append(target)
+
+        return target_wwns, initiator_target_map
+
+    def _build_full_mesh_target_map(self, itls, connector):
+
+        target_wwns = []
+        for itl in itls:
+            target_wwns.append(self._to_wwn(itl['target']['port']))
 
         initiator_wwns = connector['wwpns']
         initiator_target_map = {}
@@ -232,6 +260,10 @@ class EMCCoprHDFCDriver(driver.FibreChannelDriver):
 
         return target_wwns, initiator_target_map
 
+    def _to_wwn(self, port):
+        """Returns a CoprHD port WWN in the format of the connector."""
+        return port.replace(':', '').lower()
+
     def _build_initport_list(self, connector):
         init_ports = []
         for i in range(len(connector['wwpns'])):
@@ -255,7 +287,11 @@ class EMCCoprHDFCDriver(driver.FibreChannelDriver):
     def update_volume_stats(self):
         """Retrieve stats info from virtual pool/virtual array."""
         LOG.debug("Updating volume stats")
-        self._stats = self.common.update_volume_stats()
+        self._stats = self.common.get_volume_stats()
+
+    def update_provider_info(self, volumes, snapshots):
+        """Records the CoprHD URI of existing volumes and snapshots."""
+        return self.common.update_provider_info(volumes, snapshots)
 
     def retype(self, ctxt, volume, new_type, diff, host):
         """Change the volume type."""
@@ -18,8 +18,13 @@ try:
     import cookielib as cookie_lib
 except ImportError:
     import http.cookiejar as cookie_lib
+import os
 import socket
+import tempfile
 
+import eventlet
+from oslo_log import log as logging
+from oslo_utils import timeutils
 import requests
 from requests import exceptions
 import six
@@ -27,12 +32,15 @@ import six
 from cinder.i18n import _
 from cinder.volume.drivers.coprhd.helpers import commoncoprhdapi as common
 
+LOG = logging.getLogger(__name__)
+
 
 class Authentication(common.CoprHDResource):
 
     # Commonly used URIs for the 'Authentication' module
     URI_SERVICES_BASE = ''
     URI_AUTHENTICATION = '/login'
+    URI_TENANT = '/tenant'
 
     HEADERS = {'Content-Type': 'application/json',
                'ACCEPT': 'application/json', 'X-EMC-REST-CLIENT': 'TRUE'}
@@ -56,6 +64,9 @@ class Authentication(common.CoprHDResource):
         APISVC_PORT = 8443  # Port on which apisvc listens to incoming requests
 
         cookiejar = cookie_lib.LWPCookieJar()
+        # the login has a session of its own, so that the cookies of the
+        # authentication service are not sent with the API requests
+        session = requests.Session()
 
         url = ('https://%(ip)s:%(port)d%(uri)s' %
                {'ip': self.ipaddr, 'port': self.port,
@@ -63,8 +74,8 @@ class Authentication(common.CoprHDResource):
 
         try:
             if self.port == APISVC_PORT:
-                login_response = requests.get(
-                    url, headers=self.HEADERS, verify=False,
+                login_response = self._login_get(
+                    session, url, headers=self.HEADERS, verify=False,
                     auth=(username, password), cookies=cookiejar,
                     allow_redirects=False, timeout=common.TIMEOUT_SEC)
                 if login_response.status_code == SEC_REDIRECT:
@@ -77,8 +88,8 @@ class Authentication(common.CoprHDResource):
                                                             " service is not"
                                                             " provided")))
                     # Make the second request
-                    login_response = requests.get(
-                        location, headers=self.HEADERS, verify=False,
+                    login_response = self._login_get(
+                        session, location, headers=self.HEADERS, verify=False,
                         cookies=cookiejar, allow_redirects=False,
                         timeout=common.TIMEOUT_SEC)
                     if (login_response.status_code !=
@@ -91,8 +102,8 @@ class Authentication(common.CoprHDResource):
                                                             " 401")))
 
                     # Now provide the credentials
-                    login_response = requests.get(
-                        location, headers=self.HEADERS,
+                    login_response = self._login_get(
+                        session, location, headers=self.HEADERS,
                         auth=(username, password), verify=False,
                         cookies=cookiejar, allow_redirects=False,
                         timeout=common.TIMEOUT_SEC)
@@ -118,10 +129,10 @@ class Authentication(common.CoprHDResource):
                                                     "%s") %
                                                   details_str))
                     # Make the final call to get the page with the token
-                    new_headers = self.HEADERS
+                    new_headers = dict(self.HEADERS)
                     new_headers[SEC_AUTHTOKEN_HEADER] = authtoken
-                    login_response = requests.get(
-                        location, headers=new_headers, verify=False,
+                    login_response = self._login_get(
+                        session, location, headers=new_headers, verify=False,
                         cookies=cookiejar, allow_redirects=False,
                         timeout=common.TIMEOUT_SEC)
                     if login_response.status_code != requests.codes['ok']:
@@ -133,16 +144,17 @@ class Authentication(common.CoprHDResource):
                                     login_response.status_code),
                                  'responsetext': login_response.text}))
             elif self.port == LB_API_PORT:
-                login_response = requests.get(
-                    url, headers=self.HEADERS, verify=False,
+                login_response = self._login_get(
+                    session, url, headers=self.HEADERS, verify=False,
                     cookies=cookiejar, allow_redirects=False)
 
                 if(login_response.status_code ==
                    requests.codes['unauthorized']):
                     # Now provide the credentials
-                    login_response = requests.get(
-                        url, headers=self.HEADERS, auth=(username, password),
-                        verify=False, cookies=cookiejar, allow_redirects=False)
+                    login_response = self._login_get(
+                        session, url, headers=self.HEADERS,
+                        auth=(username, password), verify=False,
+                        cookies=cookiejar, allow_redirects=False)
                 authtoken = None
                 if SEC_AUTHTOKEN_HEADER in login_response.headers:
                     authtoken = login_response.headers[SEC_AUTHTOKEN_HEADER]
@@ -200,9 +212,35 @@ class Authentication(common.CoprHDResource):
                 exceptions.Timeout) as e:
             raise common.CoprHdError(
                 common.CoprHdError.HTTP_ERR, six.text_type(e))
+        finally:
+            session.close()
 
         return authtoken
 
+    def _login_get(self, session, url, **kwargs):
+        kwargs.setdefault('timeout', (self.transport.connect_timeout,
+                                      self.transport.read_timeout))
+        return session.get(url, **kwargs)
+
+    def check_token(self, token):
+        """Makes a cheap REST API call to check that a token is valid.
+
+        :param token: the authtoken
+        :returns: True if CoprHD accepts the token
+        """
+        headers = dict(self.HEADERS)
+        headers['X-SDS-AUTH-TOKEN'] = token
+        try:
+            response = self.transport.request(
+                "GET", self.transport.get_url(self.URI_TENANT),
+                headers=headers, verify=False, allow_redirects=False,
+                timeout=common.TIMEOUT_SEC)
+        except (exceptions.SSLError, socket.error, exceptions.ConnectionError,
+                exceptions.Timeout) as e:
+            raise common.CoprHdError(
+                common.CoprHdError.HTTP_ERR, six.text_type(e))
+        return response.status_code == requests.codes['ok']
+
     def extract_error_detail(self, login_response):
         details_str = ""
         try:
@@ -214,3 +252,124 @@ class Authentication(common.CoprHDResource):
             return details_str
         except common.CoprHdError:
             return details_str
+
+
+class TokenManager(object):
+
+    """Auth token of a backend, shared by all of its requests.
+
+    Only one login runs at a time, concurrent callers wait for its token.
+    The token is renewed in the background once it is older than lifetime
+    seconds, and at once after CoprHD rejected it.
+
+    With a cache_file, the token is saved readable by the owner only, and
+    a saved token that CoprHD still accepts is used instead of the first
+    login, e.g. after a restart.
+    """
+
+    def __init__(self, auth, username, password, lifetime, cache_file=None):
+        """Constructor: takes the Authentication object used to log in."""
+        self.auth = auth
+        self.username = username
+        self.password = password
+        self.lifetime = lifetime
+        self.cache_file = cache_file
+        self.logins = 0
+        self.rejections = 0
+        self.cached_tokens = 0
+        self._cache_checked = cache_file is None
+        self._token = None
+        self._issued = None
+        self._renewing = False
+        self._flight = common.SingleFlight()
+
+    def get_token(self):
+        """Returns the token, logging in if there is none."""
+        token = self._token
+        if token is None:
+            return self._flight.do('login', self._login)
+
+        if self.age() > self.lifetime and not self._renewing:
+            # the current token stays in use until the new one is issued
+            self._renewing = True
+            eventlet.spawn_n(self._renew)
+        return token
+
+    def invalidate(self, token):
+        """Drops a token that CoprHD rejected."""
+        self.rejections += 1
+        if token is not None and token == self._token:
+            self._token = None
+
+    def age(self):
+        """Returns the age of the token in seconds, None if there is none."""
+        if self._issued is None:
+            return None
+        return timeutils.utcnow_ts(microsecond=True) - self._issued
+
+    def _login(self):
+        if not self._cache_checked:
+            self._cache_checked = True
+            if self._load_token():
+                return self._token
+
+        token = self.auth.authenticate_user(self.username, self.password)
+        self.logins += 1
+        self._token = token
+        self._issued = timeutils.utcnow_ts(microsecond=True)
+        if self.cache_file:
+            self._save_token(token)
+        return token
+
+    def _load_token(self):
+        try:
+            with open(self.cache_file) as f:
+                token = f.read().strip()
+            issued = os.path.getmtime(self.cache_file)
+        except (IOError, OSError):
+            return False
+
+        try:
+            if not token or not self.auth.check_token(token):
+                LOG.info("The saved CoprHD auth token is no longer valid.")
+                return False
+        except common.CoprHdError as e:
+            LOG.warning("Checking the saved CoprHD auth token failed: %s",
+                        e.msg)
+            return False
+
+        self.cached_tokens += 1
+        self._token = token
+        self._issued = issued
+        return True
+
+    def _save_token(self, token):
+        # written to a new file of this writer only and renamed, so that
+        # the token is never readable by others nor partially written;
+        # mkstemp creates the file readable by its owner only
+        tmp_file = None
+        try:
+            fd, tmp_file = tempfile.mkstemp(
+                prefix=os.path.basename(self.cache_file) + '.',
+                dir=os.path.dirname(self.cache_file))
+            with os.fdopen(fd, 'w') as f:
+                f.write(token)
+            os.rename(tmp_file, self.cache_file)
+        except (IOError, OSError) as e:
+            LOG.warning("Saving the CoprHD auth token failed: %s", e)
+            if tmp_file is not None and os.path.exists(tmp_file):
+                os.unlink(tmp_file)
+
+    def _renew(self):
+        try:
+            self._flight.do('login', self._login)
+        except common.CoprHdError as e:
+            LOG.warning("Renewing the CoprHD auth token failed: %s", e.msg)
+        finally:
+            self._renewing = False
+
+    def get_stats(self):
+        return {'logins': self.logins,
+                'rejections': self.rejections,
+                'cached_tokens': self.cached_tokens,
+                'age': self.age()}
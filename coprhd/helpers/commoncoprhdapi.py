@@ -14,18 +14,21 @@
 #    under the License.
 
 """Contains some commonly used utility methods."""
-try:
-    import cookielib as cookie_lib
-except ImportError:
-    import http.cookiejar as cookie_lib
+import collections
 import json
+import random
 import re
 import socket
+import threading
 
+import eventlet
+from oslo_log import log as logging
 import oslo_serialization
+from oslo_service import loopingcall
 from oslo_utils import timeutils
 from oslo_utils import units
 import requests
+from requests import adapters
 from requests import exceptions
 import six
 
@@ -33,60 +36,260 @@ from cinder import exception
 from cinder.i18n import _
 from cinder.volume.drivers.coprhd.helpers import urihelper
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+LOG = logging.getLogger(__name__)
 
 PROD_NAME = 'storageos'
 
 TIMEOUT_SEC = 20  # 20 SECONDS
 
+# Defaults for the pooled HTTP transport
+DEFAULT_POOL_SIZE = 10
+DEFAULT_READ_TIMEOUT = 300
+
+# Defaults for the lookup caches
+DEFAULT_CACHE_SIZE = 1000
+DEFAULT_CACHE_TTL = 600
+
+# Default number of concurrent requests of a FanOut
+DEFAULT_FANOUT_CONCURRENCY = 8
+
 global AUTH_TOKEN
 AUTH_TOKEN = None
 
 TASK_TIMEOUT = 300
 
 URI_TASKS_BY_OPID = '/vdc/tasks/{0}'
-
-
-def _decode_list(data):
-    rv = []
-    for item in data:
-        if isinstance(item, six.text_type):
-            item = item.encode('utf-8')
-        elif isinstance(item, list):
-            item = _decode_list(item)
-        elif isinstance(item, dict):
-            item = _decode_dict(item)
-        rv.append(item)
-    return rv
-
-
-def _decode_dict(data):
-    rv = {}
-    for key, value in data.items():
-        if isinstance(key, six.text_type):
-            key = key.encode('utf-8')
-        if isinstance(value, six.text_type):
-            value = value.encode('utf-8')
-        elif isinstance(value, list):
-            value = _decode_list(value)
-        elif isinstance(value, dict):
-            value = _decode_dict(value)
-        rv[key] = value
-    return rv
+URI_TASKS_BULK = '/vdc/tasks/bulk'
+
+# Poll schedule of the tasks of each component type: first delay, growth
+# factor and ceiling of the delay, in seconds. Exports include zoning and
+# masking on the array and take longer than the other operations.
+POLL_SCHEDULE_DEFAULTS = {
+    'block': (1.0, 1.5, 5.0),
+    'consistencygroup': (1.0, 1.5, 5.0),
+    'export': (2.0, 1.5, 10.0),
+    'volume': (1.0, 1.5, 5.0),
+}
+POLL_JITTER = 0.2
+
+
+def _to_native(data):
+    """Encodes the unicode strings of decoded JSON to UTF-8, in one pass."""
+    if isinstance(data, six.text_type):
+        return data.encode('utf-8')
+    if isinstance(data, list):
+        return [_to_native(item) for item in data]
+    if isinstance(data, dict):
+        return dict((_to_native(key), _to_native(value))
+                    for key, value in data.items())
+    return data
 
 
 def json_decode(rsp):
-    """Used to decode the JSON encoded response."""
+    """Used to decode the JSON encoded response.
+
+    Uses orjson when it is installed. The strings are native str: on
+    Python 2 they are encoded to UTF-8 once the whole response is parsed.
+    """
 
     try:
-        o = json.loads(rsp, object_hook=_decode_dict)
+        if orjson is not None:
+            o = orjson.loads(rsp)
+        else:
+            o = json.loads(rsp)
     except ValueError:
         raise CoprHdError(CoprHdError.VALUE_ERR,
                           (_("Failed to recognize JSON payload:\n[%s]") % rsp))
+    if six.PY2:
+        o = _to_native(o)
     return o
 
 
+class CoprHDTransport(object):
+
+    """Per-backend HTTP transport for the CoprHD REST API.
+
+    Owns a pooled, keep-alive requests.Session so that consecutive REST
+    calls reuse an established TCP/TLS connection instead of doing a new
+    handshake for every request. A GET that is identical to one already
+    in flight, same URL and headers hence same token, waits for its
+    response instead of being sent again.
+    """
+
+    # number of distinct host:port pools kept by the session; the
+    # authentication service may redirect to a second endpoint
+    POOL_CONNECTIONS = 4
+
+    def __init__(self, ipaddr, port, pool_size=DEFAULT_POOL_SIZE,
+                 connect_timeout=TIMEOUT_SEC,
+                 read_timeout=DEFAULT_READ_TIMEOUT, keepalive=True,
+                 coalesce_gets=True):
+        self.ipaddr = ipaddr
+        self.port = port
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.keepalive = keepalive
+        self.coalesce_gets = coalesce_gets
+
+        self._adapter = adapters.HTTPAdapter(
+            pool_connections=self.POOL_CONNECTIONS,
+            pool_maxsize=pool_size,
+            max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('https://', self._adapter)
+        self.session.mount('http://', self._adapter)
+
+        self._lock = threading.Lock()
+        self._request_count = 0
+        self._gets_in_flight = SingleFlight()
+
+        # lookup state shared by all api objects of the backend, set up
+        # by the driver
+        self.volume_catalog = None
+
+        # task polling, see block_until_complete
+        self.poll_schedules = get_poll_schedules()
+        self.task_stats = TaskStats()
+        self.task_tracker = None
+
+        # runs the show requests of the list-then-show lookups
+        self.fan_out = FanOut()
+
+        # auth token of the backend, see authentication.TokenManager; the
+        # module AUTH_TOKEN is sent when there is none
+        self.token_manager = None
+
+        # URIs the helpers resolved from names, e.g. of the tenant and
+        # project; dropped when CoprHD reports the resource as not found
+        self._resolved = {}
+        self._resolving = SingleFlight()
+
+    def get_url(self, uri):
+        protocol = "https://"
+        if self.port == 8080:
+            protocol = "http://"
+        return protocol + self.ipaddr + ":" + six.text_type(self.port) + uri
+
+    def request(self, http_method, url, coalesce=True, **kwargs):
+        """Sends a request through the pooled session.
+
+        :param http_method: one of GET, POST, PUT, DELETE
+        :param url: the absolute URL of the request
+        :param coalesce: False for a GET that must see the writes done by
+                the caller, it is not attached to an identical GET that
+                may have started before them
+        :returns: the requests.Response object
+        """
+        kwargs.setdefault('verify', False)
+        kwargs.setdefault('timeout', (self.connect_timeout,
+                                      self.read_timeout))
+        if not self.keepalive:
+            headers = dict(kwargs.get('headers') or {})
+            headers['Connection'] = 'close'
+            kwargs['headers'] = headers
+
+        headers = kwargs.get('headers') or {}
+        # only API requests are coalesced, not the ones of a login
+        if (http_method == 'GET' and self.coalesce_gets and coalesce and
+                headers.get('X-SDS-AUTH-TOKEN') and not kwargs.get('auth')):
+            key = (http_method, url, tuple(sorted(headers.items())))
+            return self._gets_in_flight.do(key, self._send, http_method,
+                                           url, **kwargs)
+        return self._send(http_method, url, **kwargs)
+
+    def _send(self, http_method, url, **kwargs):
+        with self._lock:
+            self._request_count += 1
+
+        return self.session.request(http_method, url, **kwargs)
+
+    def resolve(self, kind, name, resolver):
+        """Returns the URI of a named resource, resolving it once.
+
+        Concurrent callers of an unresolved name share one resolver call.
+
+        :param kind: kind of the resource, e.g. tenant or project
+        :param name: name of the resource
+        :param resolver: function returning the URI for the name
+        :returns: URI of the resource
+        """
+        key = (kind, name)
+        uri = self._resolved.get(key)
+        if uri is None:
+            uri = self._resolving.do(key, self._resolve, key, resolver)
+        return uri
+
+    def _resolve(self, key, resolver):
+        uri = resolver(key[1])
+        self._resolved[key] = uri
+        return uri
+
+    def invalidate_resolved(self, uri=None):
+        """Forgets resolved URIs, they are resolved again on use.
+
+        :param uri: URI of a resource that was not found; only a resolved
+                    URI equal to it is forgotten, all of them if None
+        """
+        if uri is None:
+            self._resolved.clear()
+            return
+        for key, resolved in list(self._resolved.items()):
+            if resolved == uri:
+                self._resolved.pop(key, None)
+
+    def get_stats(self):
+        """Returns connection reuse statistics of the session pool."""
+        opened = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+
+        with self._lock:
+            requests_sent = self._request_count
+        gets = self._gets_in_flight.get_stats()
+
+        return {'requests': requests_sent,
+                'connections_opened': opened,
+                'connections_reused': max(requests_sent - opened, 0),
+                'gets_coalesced': gets['shared'],
+                'gets_in_flight': gets['running'],
+                'pool_size': self.pool_size}
+
+    def close(self):
+        self.session.close()
+
+
+_TRANSPORTS = {}
+_TRANSPORTS_LOCK = threading.Lock()
+
+
+def get_transport(ipaddr, port):
+    """Returns the shared transport of a CoprHD endpoint.
+
+    Used by callers that are not given the transport of a backend. The
+    transport is created with default settings on first use.
+    """
+    key = (ipaddr, port)
+    with _TRANSPORTS_LOCK:
+        transport = _TRANSPORTS.get(key)
+        if transport is None:
+            transport = CoprHDTransport(ipaddr, port)
+            _TRANSPORTS[key] = transport
+    return transport
+
+
 def service_json_request(ip_addr, port, http_method, uri, body,
-                         contenttype='application/json', customheaders=None):
+                         contenttype='application/json', customheaders=None,
+                         transport=None, coalesce=True,
+                         invalidate_resolved=False):
     """Used to make an HTTP request and get the response.
 
     The message body is encoded in JSON format
@@ -97,6 +300,14 @@ def service_json_request(ip_addr, port, http_method, uri, body,
     :param http_method: one of GET, POST, PUT, DELETE
     :param uri: the request URI
     :param body: the request payload
+    :param transport: CoprHDTransport of the backend; the shared
+            transport of ip_addr:port is used when not given
+    :param coalesce: False for a GET that must see the writes done by the
+            caller, see CoprHDTransport.request
+    :param invalidate_resolved: True if a 404 means that a resolved URI
+            the request refers to is stale, all resolved URIs are then
+            forgotten; otherwise only a 404 on the own URI of a resolved
+            resource forgets that one
     :returns: a tuple of two elements: (response body, response headers)
     :raises CoprHdError: in case of HTTP errors with err_code 3
     """
@@ -110,28 +321,23 @@ def service_json_request(ip_addr, port, http_method, uri, body,
     if customheaders:
         headers.update(customheaders)
 
+    if transport is None:
+        transport = get_transport(ip_addr, port)
+
     try:
-        protocol = "https://"
-        if port == 8080:
-            protocol = "http://"
-        url = protocol + ip_addr + ":" + six.text_type(port) + uri
-
-        cookiejar = cookie_lib.LWPCookieJar()
-        headers[SEC_AUTHTOKEN_HEADER] = AUTH_TOKEN
-
-        if http_method == 'GET':
-            response = requests.get(url, headers=headers, verify=False,
-                                    cookies=cookiejar)
-        elif http_method == 'POST':
-            response = requests.post(url, data=body, headers=headers,
-                                     verify=False, cookies=cookiejar)
-        elif http_method == 'PUT':
-            response = requests.put(url, data=body, headers=headers,
-                                    verify=False, cookies=cookiejar)
-        elif http_method == 'DELETE':
-
-            response = requests.delete(url, headers=headers, verify=False,
-                                       cookies=cookiejar)
+        url = transport.get_url(uri)
+
+        token = AUTH_TOKEN
+        if transport.token_manager is not None:
+            token = transport.token_manager.get_token()
+        headers[SEC_AUTHTOKEN_HEADER] = token
+
+        if http_method == 'GET' or http_method == 'DELETE':
+            response = transport.request(http_method, url, headers=headers,
+                                         coalesce=coalesce)
+        elif http_method == 'POST' or http_method == 'PUT':
+            response = transport.request(http_method, url, data=body,
+                                         headers=headers)
         else:
             raise CoprHdError(CoprHdError.HTTP_ERR,
                               (_("Unknown/Unsupported HTTP method: %s") %
@@ -151,6 +357,9 @@ def service_json_request(ip_addr, port, http_method, uri, body,
                          error_details)
         elif response.status_code == 401:
             error_msg = _("Access forbidden: Authentication required")
+            if transport.token_manager is not None:
+                # the next request logs in again
+                transport.token_manager.invalidate(token)
         elif response.status_code == 403:
             error_msg = ""
             error_details = ""
@@ -179,6 +388,12 @@ def service_json_request(ip_addr, port, http_method, uri, body,
 
         elif response.status_code == 404:
             error_msg = "Requested resource not found"
+            # a resolved URI may refer to a resource that no longer exists
+            if invalidate_resolved:
+                transport.invalidate_resolved()
+            else:
+                transport.invalidate_resolved(
+                    uri.split('?', 1)[0].rstrip('/').rsplit('/', 1)[-1])
         elif response.status_code == 405:
             error_msg = six.text_type(response.text)
         elif response.status_code == 503:
@@ -216,11 +431,12 @@ def service_json_request(ip_addr, port, http_method, uri, body,
                                   response.reason),
                               'error_msg': six.text_type(
                                   error_msg)
-                          }))
+                          }), response.status_code)
     except (CoprHdError, socket.error, exceptions.SSLError,
             exceptions.ConnectionError, exceptions.TooManyRedirects,
             exceptions.Timeout) as e:
-        raise CoprHdError(CoprHdError.HTTP_ERR, six.text_type(e))
+        raise CoprHdError(CoprHdError.HTTP_ERR, six.text_type(e),
+                          getattr(e, 'status_code', None))
     # TODO(Ravi) : Either following exception should have proper message or
     # IOError should just be combined with the above statement
     except IOError as e:
@@ -371,13 +587,14 @@ def format_err_msg_and_raise(operation_type, component,
     raise CoprHdError(error_code, formated_err_msg)
 
 
-def search_by_tag(resource_search_uri, ipaddr, port):
+def search_by_tag(resource_search_uri, ipaddr, port, transport=None):
     """Fetches the list of resources with a given tag.
 
     :param resource_search_uri: The tag based search uri
                               Example: '/block/volumes/search?tag=tagexample1'
     :param ipaddr: IP address of CoprHD host
     :param port: Port number
+    :param transport: CoprHDTransport of the backend
     """
     # check if the URI passed has both project and name parameters
     str_uri = six.text_type(resource_search_uri)
@@ -386,7 +603,7 @@ def search_by_tag(resource_search_uri, ipaddr, port):
 
         (s, h) = service_json_request(
             ipaddr, port, "GET",
-            resource_search_uri, None)
+            resource_search_uri, None, transport=transport)
 
         o = json_decode(s)
         if not o:
@@ -412,18 +629,33 @@ def block_until_complete(component_type,
                          task_id,
                          ipaddr,
                          port,
-                         synctimeout=0):
+                         synctimeout=0,
+                         transport=None):
 
     if not synctimeout:
         synctimeout = TASK_TIMEOUT
+    if transport is None:
+        transport = get_transport(ipaddr, port)
+    if transport.task_tracker is not None:
+        return _wait_with_tracker(component_type, task_id, synctimeout,
+                                  transport)
+
+    schedule = transport.poll_schedules.get(component_type)
+    if schedule is None:
+        schedule = PollSchedule(*POLL_SCHEDULE_DEFAULTS['volume'])
+    delays = schedule.delays()
+    polls = 0
+
     t = timeutils.StopWatch(duration=synctimeout)
     t.start()
     while not t.expired():
         if component_type == 'block':
-            out = show_task_opid(task_id, ipaddr, port)
+            out = show_task_opid(task_id, ipaddr, port, transport)
         else:
             out = get_task_by_resourceuri_and_taskId(
-                component_type, resource_uri, task_id, ipaddr, port)
+                component_type, resource_uri, task_id, ipaddr, port,
+                transport)
+        polls += 1
 
         if out:
             if out["state"] == "ready":
@@ -437,33 +669,382 @@ def block_until_complete(component_type,
             if out["state"] == "error":
                 # stop the timer
                 t.stop()
-                error_message = "Please see logs for more details"
-                if ("service_error" in out and
-                        "details" in out["service_error"]):
-                    error_message = out["service_error"]["details"]
-                raise CoprHdError(CoprHdError.VALUE_ERR,
-                                  (_("Task: %(task_id)s"
-                                     " is failed with"
-                                     " error: %(error_message)s") %
-                                   {'task_id': task_id,
-                                    'error_message': error_message
-                                    }))
+                transport.task_stats.record(component_type, polls,
+                                            t.elapsed(), "error")
+                _raise_task_error(task_id, out)
+
+        # yield to the other green threads until the next poll
+        eventlet.sleep(min(next(delays), max(t.leftover(), 0)))
 
     else:
-        raise CoprHdError(CoprHdError.TIME_OUT,
-                          (_("Task did not complete in %d secs."
-                             " Operation timed out. Task in CoprHD"
-                             " will continue") % synctimeout))
+        transport.task_stats.record(component_type, polls, t.elapsed(),
+                                    "timeout")
+        _raise_task_timeout(synctimeout)
+
+    transport.task_stats.record(component_type, polls, t.elapsed(),
+                                "ready")
+    return out
+
+
+def _wait_with_tracker(component_type, task_id, synctimeout, transport):
+    tracker = transport.task_tracker
+    rounds = tracker.rounds
+    t = timeutils.StopWatch()
+    t.start()
+    out = tracker.wait(task_id, synctimeout, component_type)
+    t.stop()
+    polls = tracker.rounds - rounds
+
+    if out is None:
+        transport.task_stats.record(component_type, polls, t.elapsed(),
+                                    "timeout")
+        _raise_task_timeout(synctimeout)
+    if out["state"] == "error":
+        transport.task_stats.record(component_type, polls, t.elapsed(),
+                                    "error")
+        _raise_task_error(task_id, out)
+    transport.task_stats.record(component_type, polls, t.elapsed(),
+                                "ready")
+    return out
+
+
+def _raise_task_error(task_id, out):
+    error_message = "Please see logs for more details"
+    if ("service_error" in out and
+            "details" in out["service_error"]):
+        error_message = out["service_error"]["details"]
+    raise CoprHdError(CoprHdError.VALUE_ERR,
+                      (_("Task: %(task_id)s"
+                         " is failed with"
+                         " error: %(error_message)s") %
+                       {'task_id': task_id,
+                        'error_message': error_message
+                        }))
+
+
+def _raise_task_timeout(synctimeout):
+    raise CoprHdError(CoprHdError.TIME_OUT,
+                      (_("Task did not complete in %d secs."
+                         " Operation timed out. Task in CoprHD"
+                         " will continue") % synctimeout))
+
+
+class LatencyRecorder(object):
+
+    """Keeps the latest samples of a latency to report its percentiles."""
+
+    def __init__(self, size=1000):
+        self._samples = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+
+    def get_stats(self):
+        """Returns the count and the p50, p90, p99 and max in seconds."""
+        with self._lock:
+            samples = sorted(self._samples)
+            stats = {'count': self.count}
+        if not samples:
+            return stats
+        for percentile in (50, 90, 99):
+            index = min(len(samples) - 1,
+                        int(len(samples) * percentile / 100.0))
+            stats['p%d' % percentile] = samples[index]
+        stats['max'] = samples[-1]
+        return stats
+
+
+class BackgroundRefresher(object):
+
+    """Keeps the last good result of a function, refreshed in background.
+
+    The function runs in a green thread every interval seconds and is
+    given up after timeout seconds. A failed or timed out run keeps the
+    previous result, which is stale once older than max_age seconds.
+    """
+
+    def __init__(self, func, interval, timeout, max_age):
+        self.func = func
+        self.interval = interval
+        self.timeout = timeout
+        self.max_age = max_age
+        self.failures = 0
+        self.durations = LatencyRecorder()
+        self._value = None
+        self._updated = None
+        self._refresher = None
+
+    def start(self):
+        """Starts refreshing the result every interval seconds."""
+        if self._refresher is None:
+            self._refresher = loopingcall.FixedIntervalLoopingCall(
+                self.refresh)
+            self._refresher.start(interval=self.interval,
+                                  initial_delay=self.interval)
+
+    def stop(self):
+        if self._refresher is not None:
+            self._refresher.stop()
+            self._refresher = None
+
+    def refresh(self):
+        """Runs the function once and keeps its result if it succeeds."""
+        watch = timeutils.StopWatch()
+        watch.start()
+        try:
+            with eventlet.Timeout(self.timeout):
+                value = self.func()
+        except (Exception, eventlet.Timeout) as e:
+            self.failures += 1
+            LOG.warning("Background refresh failed after %(duration).1f"
+                        " seconds: %(err)s",
+                        {'duration': watch.elapsed(), 'err': e})
+            return
+        finally:
+            self.durations.record(watch.elapsed())
+
+        self._value = value
+        self._updated = timeutils.utcnow_ts(microsecond=True)
+
+    def age(self):
+        """Returns the age in seconds of the result, None if there is none."""
+        if self._updated is None:
+            return None
+        return timeutils.utcnow_ts(microsecond=True) - self._updated
+
+    def get(self):
+        """Returns the last result and whether it is stale.
+
+        The first call waits for a refresh if there is no result yet.
+        """
+        if self._value is None:
+            self.refresh()
+        age = self.age()
+        return self._value, age is None or age > self.max_age
+
+    def get_stats(self):
+        return {'age': self.age(),
+                'failures': self.failures,
+                'durations': self.durations.get_stats()}
 
-    return
 
+class TaskTracker(object):
 
-def show_task_opid(taskid, ipaddr, port):
+    """Waits for the CoprHD tasks of all the operations of a backend.
+
+    A single green thread owns the ids of the pending tasks and polls them
+    together, with the bulk task API when CoprHD supports it. Each task
+    follows the poll schedule of its component type from the time it was
+    added; a round polls the tasks that are due. The waiter of a task is
+    woken through an event once the task has completed, so the polling
+    load depends on the poll rate and not on the number of concurrent
+    operations.
+    """
+
+    FINAL_STATES = ('ready', 'error')
+
+    def __init__(self, transport, schedules):
+        self.transport = transport
+        self.schedules = schedules
+        self.bulk_supported = True
+        self.rounds = 0
+        self._pending = {}
+        # next poll time and delay generator of each pending task
+        self._due = {}
+        self._wakeup = eventlet.event.Event()
+        self._running = False
+
+    def wait(self, task_id, timeout, component_type='volume'):
+        """Waits for a task to complete.
+
+        :param task_id: URI of the task
+        :param timeout: seconds to wait for the task
+        :param component_type: type of the resource, selects the poll
+                               schedule of the task
+        :returns: the task details, None if the task did not complete
+        """
+        task_event = self._pending.get(task_id)
+        if task_event is None:
+            task_event = eventlet.event.Event()
+            self._pending[task_id] = task_event
+            schedule = self.schedules.get(component_type)
+            if schedule is None:
+                schedule = PollSchedule(*POLL_SCHEDULE_DEFAULTS['volume'])
+            delays = schedule.delays()
+            self._due[task_id] = (
+                timeutils.utcnow_ts(microsecond=True) + next(delays),
+                delays)
+            # the new task may be due before the one waited for
+            if not self._wakeup.ready():
+                self._wakeup.send()
+        if not self._running:
+            self._running = True
+            eventlet.spawn_n(self._run)
+
+        with eventlet.Timeout(timeout, False):
+            return task_event.wait()
+        if self._pending.get(task_id) is task_event:
+            del self._pending[task_id]
+            del self._due[task_id]
+        return None
+
+    def _run(self):
+        try:
+            while self._pending:
+                now = timeutils.utcnow_ts(microsecond=True)
+                due = min(entry[0] for entry in self._due.values())
+                if due > now:
+                    with eventlet.Timeout(due - now, False):
+                        self._wakeup.wait()
+                    self._wakeup = eventlet.event.Event()
+                    continue
+
+                task_ids = [task_id
+                            for task_id, entry in self._due.items()
+                            if entry[0] <= now]
+                self._poll(task_ids)
+                now = timeutils.utcnow_ts(microsecond=True)
+                for task_id in task_ids:
+                    if task_id in self._due:
+                        delays = self._due[task_id][1]
+                        self._due[task_id] = (now + next(delays), delays)
+        finally:
+            self._running = False
+
+    def _poll(self, task_ids):
+        if not task_ids:
+            return
+        self.rounds += 1
+        try:
+            tasks = self._query(task_ids)
+        except CoprHdError as e:
+            LOG.warning("Polling %(count)d CoprHD tasks failed: %(err)s",
+                        {'count': len(task_ids), 'err': e.msg})
+            return
+
+        for task in tasks:
+            if task and task.get('state') in self.FINAL_STATES:
+                task_event = self._pending.pop(task['id'], None)
+                if task_event is not None:
+                    self._due.pop(task['id'], None)
+                    task_event.send(task)
+
+    def _query(self, task_ids):
+        if self.bulk_supported:
+            try:
+                return self._query_bulk(task_ids)
+            except CoprHdError as e:
+                # older CoprHD versions do not have the bulk task API,
+                # other errors are retried with it on the next round
+                if e.status_code not in (404, 405):
+                    raise
+                LOG.info("CoprHD has no bulk task API, tasks are polled"
+                         " one by one.")
+                self.bulk_supported = False
+        return self._query_each(task_ids)
+
+    def _query_bulk(self, task_ids):
+        body = oslo_serialization.jsonutils.dumps({'id': task_ids})
+        (s, h) = service_json_request(self.transport.ipaddr,
+                                      self.transport.port, "POST",
+                                      URI_TASKS_BULK, body,
+                                      transport=self.transport)
+        o = json_decode(s)
+        if not o or 'task' not in o:
+            return []
+        return get_list(o, 'task')
+
+    def _query_each(self, task_ids):
+        tasks = []
+        for task_id in task_ids:
+            # a task that cannot be queried does not hold up the others
+            try:
+                tasks.append(show_task_opid(task_id, self.transport.ipaddr,
+                                            self.transport.port,
+                                            self.transport))
+            except CoprHdError as e:
+                LOG.warning("Polling CoprHD task %(task)s failed: %(err)s",
+                            {'task': task_id, 'err': e.msg})
+        return tasks
+
+
+class PollSchedule(object):
+
+    """Delays between the polls of a CoprHD task.
+
+    The first delay is initial seconds, every further one is factor times
+    longer up to ceiling. Each delay is randomized by +/- jitter so that
+    the polls of concurrent tasks spread out.
+    """
+
+    def __init__(self, initial, factor, ceiling, jitter=POLL_JITTER):
+        self.initial = initial
+        self.factor = factor
+        self.ceiling = ceiling
+        self.jitter = jitter
+
+    def delays(self):
+        """Generates the delays in seconds, without end."""
+        delay = self.initial
+        while True:
+            yield delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+            delay = min(delay * self.factor, self.ceiling)
+
+
+def get_poll_schedules(initial=None, factor=None, ceiling=None):
+    """Returns the poll schedules of the component types.
+
+    Starts from POLL_SCHEDULE_DEFAULTS; the given values override the
+    defaults of every component type.
+    """
+    schedules = {}
+    for component_type, defaults in POLL_SCHEDULE_DEFAULTS.items():
+        schedules[component_type] = PollSchedule(
+            defaults[0] if initial is None else initial,
+            defaults[1] if factor is None else factor,
+            defaults[2] if ceiling is None else ceiling)
+    return schedules
+
+
+class TaskStats(object):
+
+    """Poll counts and durations of the tasks waited for, per type."""
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, component_type, polls, duration, state):
+        with self._lock:
+            stats = self._stats.setdefault(
+                component_type, {'tasks': 0, 'polls': 0, 'errors': 0,
+                                 'timeouts': 0, 'total_duration': 0.0,
+                                 'max_duration': 0.0})
+            stats['tasks'] += 1
+            stats['polls'] += polls
+            stats['total_duration'] += duration
+            stats['max_duration'] = max(stats['max_duration'], duration)
+            if state == "error":
+                stats['errors'] += 1
+            elif state == "timeout":
+                stats['timeouts'] += 1
+
+    def get_stats(self):
+        with self._lock:
+            return dict((component_type, dict(stats))
+                        for component_type, stats in self._stats.items())
+
+
+def show_task_opid(taskid, ipaddr, port, transport=None):
     (s, h) = service_json_request(
         ipaddr, port,
         "GET",
         URI_TASKS_BY_OPID.format(taskid),
-        None)
+        None, transport=transport)
     if (not s):
         return None
     o = json_decode(s)
@@ -471,20 +1052,364 @@ def show_task_opid(taskid, ipaddr, port):
 
 
 def get_task_by_resourceuri_and_taskId(component_type, resource_uri,
-                                       task_id, ipaddr, port):
+                                       task_id, ipaddr, port, transport=None):
     """Returns the single task details."""
 
     task_uri_constant = urihelper.singletonURIHelperInstance.getUri(
         component_type, "task")
     (s, h) = service_json_request(
         ipaddr, port, "GET",
-        task_uri_constant.format(resource_uri, task_id), None)
+        task_uri_constant.format(resource_uri, task_id), None,
+        transport=transport)
     if not s:
         return None
     o = json_decode(s)
     return o
 
 
+class ExpiringLRUCache(object):
+
+    """Thread safe LRU cache whose entries expire after a time to live.
+
+    Holds at most maxsize entries, the least recently used one is evicted
+    first. None is not a valid value as get returns it on a miss. If given,
+    on_remove is called with the key of every entry that is dropped
+    because it expired, was evicted or was invalidated.
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL,
+                 on_remove=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_remove = on_remove
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns the cached value of key, None if missing or expired."""
+        now = timeutils.utcnow_ts(microsecond=True)
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None or item[1] <= now:
+                self.misses += 1
+                expired = item is not None
+            else:
+                # re-insert to mark the entry as most recently used
+                self._data[key] = item
+                self.hits += 1
+                return item[0]
+        if expired:
+            self._removed([key])
+        return None
+
+    def put(self, key, value, ttl=None):
+        """Caches value for ttl seconds, the cache default if not given."""
+        if ttl is None:
+            ttl = self.ttl
+        expires = timeutils.utcnow_ts(microsecond=True) + ttl
+        evicted = []
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False)[0])
+        self._removed(evicted)
+
+    def invalidate(self, key=None):
+        """Drops key from the cache, or every entry if key is None."""
+        with self._lock:
+            if key is None:
+                removed = list(self._data)
+                self._data.clear()
+            elif self._data.pop(key, None) is not None:
+                removed = [key]
+            else:
+                removed = []
+        self._removed(removed)
+
+    def _removed(self, keys):
+        if self.on_remove is not None:
+            for key in keys:
+                self.on_remove(key)
+
+    def get_stats(self):
+        with self._lock:
+            return {'size': len(self._data),
+                    'hits': self.hits,
+                    'misses': self.misses}
+
+
+class ITLCache(object):
+
+    """ITL maps fetched from CoprHD, by volume URI and by initiator set.
+
+    The driver invalidates the maps its own export changes affect. The
+    entries expire after ttl seconds, which bounds how long a change made
+    outside the driver goes unnoticed.
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL):
+        self._cache = ExpiringLRUCache(maxsize, ttl, self._forget)
+        # keys of the cached initiator set entries, by initiator port
+        self._keys_by_port = collections.defaultdict(set)
+
+    def get_volume(self, vol_uri):
+        """Returns the cached ITLs of a volume, None on a miss."""
+        return self._cache.get(('volume', vol_uri))
+
+    def put_volume(self, vol_uri, itls):
+        self._cache.put(('volume', vol_uri), itls)
+
+    def get_initiators(self, initiator_ports):
+        """Returns the cached ITLs of the initiators, None on a miss."""
+        return self._cache.get(('initiators', frozenset(initiator_ports)))
+
+    def put_initiators(self, initiator_ports, itls):
+        key = ('initiators', frozenset(initiator_ports))
+        for port in key[1]:
+            self._keys_by_port[port].add(key)
+        self._cache.put(key, itls)
+
+    def invalidate(self, vol_uri=None, initiator_ports=()):
+        """Drops the ITLs of a volume and of every set of the ports."""
+        if vol_uri is not None:
+            self._cache.invalidate(('volume', vol_uri))
+        for port in initiator_ports:
+            for key in list(self._keys_by_port.get(port, ())):
+                self._cache.invalidate(key)
+                # the entry may have expired unseen, with no callback
+                self._forget(key)
+
+    def get_stats(self):
+        return self._cache.get_stats()
+
+    def _forget(self, key):
+        if key[0] != 'initiators':
+            return
+        for port in key[1]:
+            keys = self._keys_by_port.get(port)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_port[port]
+
+
+class RequestBatcher(object):
+
+    """Merges the requests made for the same key within a short window.
+
+    The first request for a key opens a batch, which is flushed window
+    seconds later, or once it holds max_size items, by calling
+    flush(key, items) in a green thread. flush returns a dict with the
+    result of each item; a result that is an exception is raised to the
+    callers of that item only. If flush raises, every caller of the batch
+    gets the error.
+    """
+
+    def __init__(self, flush, window, max_size=None):
+        self.flush = flush
+        self.window = window
+        self.max_size = max_size
+        self.batches = 0
+        self.items = 0
+        self._open = {}
+
+    def submit(self, key, item):
+        """Adds item to the batch of key and waits for its result."""
+        batch = self._open.get(key)
+        if batch is None:
+            batch = []
+            self._open[key] = batch
+            eventlet.spawn_after(self.window, self._flush_open, key, batch)
+        waiter = eventlet.event.Event()
+        batch.append((item, waiter))
+        if self.max_size and len(batch) >= self.max_size:
+            # closed at once, the next requests open a new batch
+            del self._open[key]
+            eventlet.spawn_n(self._flush, key, batch)
+
+        result = waiter.wait()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _flush_open(self, key, batch):
+        if self._open.get(key) is not batch:
+            # already flushed because it was full
+            return
+        del self._open[key]
+        self._flush(key, batch)
+
+    def _flush(self, key, batch):
+        items = []
+        for item, waiter in batch:
+            if item not in items:
+                items.append(item)
+        self.batches += 1
+        self.items += len(batch)
+        LOG.debug("Flushing a batch of %(count)d requests for %(key)s",
+                  {'count': len(items), 'key': key})
+        try:
+            results = self.flush(key, items)
+        except Exception as e:
+            results = dict((item, e) for item in items)
+
+        for item, waiter in batch:
+            waiter.send(results.get(item))
+
+    def get_stats(self):
+        return {'batches': self.batches,
+                'items': self.items,
+                'pending': sum(len(batch) for batch in self._open.values())}
+
+
+class SingleFlight(object):
+
+    """Runs a function once for all of its concurrent callers of a key.
+
+    The first caller for a key runs the function. The callers that come
+    while it runs wait for it and get its result, or its error. If the
+    first caller is interrupted, e.g. by its own eventlet.Timeout, the
+    others get a CoprHdError.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        """Calls func(*args, **kwargs) unless it is running for key."""
+        call = self._calls.get(key)
+        if call is not None:
+            self.shared += 1
+            return call.wait()
+
+        call = eventlet.event.Event()
+        self._calls[key] = call
+        self.calls += 1
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            del self._calls[key]
+            call.send(exc=e)
+            raise
+        except BaseException as e:
+            del self._calls[key]
+            call.send(exc=CoprHdError(
+                CoprHdError.SOS_FAILURE_ERR,
+                (_("The shared call was interrupted: %r") % e)))
+            raise
+        del self._calls[key]
+        call.send(result)
+        return result
+
+    def get_stats(self):
+        return {'calls': self.calls,
+                'shared': self.shared,
+                'running': len(self._calls)}
+
+
+class FanOut(object):
+
+    """Runs a function over many items on a bounded pool of green threads.
+
+    The helpers that list resources and then show each of them use it to
+    send the show requests concurrently rather than one after the other.
+    An error does not stop the other items; all the errors are raised
+    together once every item is done.
+    """
+
+    def __init__(self, concurrency=DEFAULT_FANOUT_CONCURRENCY):
+        self.concurrency = concurrency
+        self.runs = 0
+        self.calls = 0
+        self.errors = 0
+        self.early_exits = 0
+
+    def map(self, func, items):
+        """Returns func(item) for all the items, in the order of the items.
+
+        :raises CoprHdError: when func failed for any of the items
+        """
+        items = list(items)
+        results, errors = self._run(func, items)
+        self._raise_errors(errors, len(items))
+        return results
+
+    def find(self, func, items, match):
+        """Returns the first func(item) result accepted by match, or None.
+
+        No further item is started once a result matches. The errors are
+        only raised when no result matches.
+        """
+        items = list(items)
+        results, errors = self._run(func, items, match)
+        for result in results:
+            if result is not None and match(result):
+                return result
+        self._raise_errors(errors, len(items))
+        return None
+
+    def _run(self, func, items, match=None):
+        results = [None] * len(items)
+        errors = []
+        found = []
+        started = []
+        pending = iter(enumerate(items))
+
+        def worker():
+            for index, item in pending:
+                if found:
+                    return
+                started.append(index)
+                self.calls += 1
+                try:
+                    results[index] = func(item)
+                except Exception as e:
+                    self.errors += 1
+                    errors.append(e)
+                    continue
+                if (match is not None and results[index] is not None and
+                        match(results[index])):
+                    found.append(index)
+
+        self.runs += 1
+        pool = eventlet.GreenPool(self.concurrency)
+        for _i in range(min(self.concurrency, len(items))):
+            pool.spawn_n(worker)
+        pool.waitall()
+        if found and len(started) < len(items):
+            self.early_exits += 1
+        return results, errors
+
+    @staticmethod
+    def _raise_errors(errors, count):
+        if not errors:
+            return
+        if len(errors) == 1:
+            raise errors[0]
+
+        err_codes = set(getattr(e, 'err_code', None) for e in errors)
+        if len(err_codes) == 1 and None not in err_codes:
+            err_code = err_codes.pop()
+        else:
+            err_code = CoprHdError.SOS_FAILURE_ERR
+        raise CoprHdError(err_code, (_(
+            "%(failed)d of %(count)d requests failed: %(errors)s") %
+            {'failed': len(errors), 'count': count,
+             'errors': '; '.join(six.text_type(e) for e in errors)}))
+
+    def get_stats(self):
+        return {'concurrency': self.concurrency,
+                'runs': self.runs,
+                'calls': self.calls,
+                'errors': self.errors,
+                'early_exits': self.early_exits}
+
+
 class CoprHdError(exception.VolumeBackendAPIException):
 
     """Custom exception class used to report logical errors.
@@ -492,6 +1417,7 @@ class CoprHdError(exception.VolumeBackendAPIException):
     Attributes:
         err_code - String error code
         msg - String text
+        status_code - HTTP status of the failed request, if any
     """
     SOS_FAILURE_ERR = 1
     CMD_LINE_ERR = 2
@@ -502,9 +1428,10 @@ class CoprHdError(exception.VolumeBackendAPIException):
     MAX_COUNT_REACHED = 6
     TIME_OUT = 7
 
-    def __init__(self, err_code, msg):
+    def __init__(self, err_code, msg, status_code=None):
         self.err_code = err_code
         self.msg = msg
+        self.status_code = status_code
 
     def __str__(self):
         return repr(self.msg)
@@ -512,10 +1439,15 @@ class CoprHdError(exception.VolumeBackendAPIException):
 
 class CoprHDResource(object):
 
-    def __init__(self, ipaddr, port):
+    def __init__(self, ipaddr, port, transport=None):
         """Constructor: takes IP address and port of the CoprHD instance.
 
-        These are needed to make http requests for REST API
+        These are needed to make http requests for REST API. The optional
+        transport is the pooled CoprHDTransport of the backend; the shared
+        transport of ipaddr:port is used when it is not given.
         """
         self.ipaddr = ipaddr
         self.port = port
+        if transport is None:
+            transport = get_transport(ipaddr, port)
+        self.transport = transport
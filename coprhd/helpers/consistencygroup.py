@@ -42,13 +42,14 @@ class ConsistencyGroup(common.CoprHDResource):
         """
         if tenant is None:
             tenant = ""
-        projobj = project.Project(self.ipaddr, self.port)
+        projobj = project.Project(self.ipaddr, self.port, self.transport)
         fullproj = tenant + "/" + project_name
         projuri = projobj.project_query(fullproj)
 
         (s, h) = common.service_json_request(
             self.ipaddr, self.port, "GET",
-            self.URI_CONSISTENCY_GROUPS_SEARCH.format(projuri), None)
+            self.URI_CONSISTENCY_GROUPS_SEARCH.format(projuri), None,
+            transport=self.transport)
         o = common.json_decode(s)
         if not o:
             return []
@@ -71,7 +72,8 @@ class ConsistencyGroup(common.CoprHDResource):
         uri = self.consistencygroup_query(name, project, tenant)
         (s, h) = common.service_json_request(
             self.ipaddr, self.port, "GET",
-            self.URI_CONSISTENCY_GROUPS_INSTANCE.format(uri), None)
+            self.URI_CONSISTENCY_GROUPS_INSTANCE.format(uri), None,
+            transport=self.transport)
         o = common.json_decode(s)
         if o['inactive']:
             return None
@@ -89,10 +91,11 @@ class ConsistencyGroup(common.CoprHDResource):
             return name
 
         uris = self.list(project, tenant)
-        for uri in uris:
-            congroup = self.show(uri, project, tenant)
-            if congroup and congroup['name'] == name:
-                return congroup['id']
+        congroup = self.transport.fan_out.find(
+            lambda uri: self.show(uri, project, tenant), uris,
+            lambda congroup: congroup['name'] == name)
+        if congroup:
+            return congroup['id']
         raise common.CoprHdError(common.CoprHdError.NOT_FOUND_ERR,
                                  (_("Consistency Group %s: not found") % name))
 
@@ -103,7 +106,8 @@ class ConsistencyGroup(common.CoprHDResource):
             return (
                 common.block_until_complete("consistencygroup", resource["id"],
                                             result["id"], self.ipaddr,
-                                            self.port, synctimeout)
+                                            self.port, synctimeout,
+                                            transport=self.transport)
             )
         else:
             raise common.CoprHdError(
@@ -126,7 +130,8 @@ class ConsistencyGroup(common.CoprHDResource):
                 if tenant is None:
                     tenant = ""
                 fullproj = tenant + "/" + project_name
-                projobj = project.Project(self.ipaddr, self.port)
+                projobj = project.Project(self.ipaddr, self.port,
+                                          self.transport)
                 projuri = projobj.project_query(fullproj)
 
                 parms = {'name': name, 'project': projuri, }
@@ -134,7 +139,7 @@ class ConsistencyGroup(common.CoprHDResource):
 
                 (s, h) = common.service_json_request(
                     self.ipaddr, self.port, "POST",
-                    self.URI_CONSISTENCY_GROUP, body)
+                    self.URI_CONSISTENCY_GROUP, body, transport=self.transport)
 
                 o = common.json_decode(s)
                 return o
@@ -163,7 +168,7 @@ class ConsistencyGroup(common.CoprHDResource):
             self.ipaddr, self.port,
             "POST",
             self.URI_CONSISTENCY_GROUPS_DEACTIVATE.format(uri) + params,
-            None)
+            None, transport=self.transport)
         return
 
     def update(self, uri, project, tenant, add_volumes, remove_volumes,
@@ -190,7 +195,7 @@ class ConsistencyGroup(common.CoprHDResource):
         add_voluris = []
         remove_voluris = []
         from cinder.volume.drivers.coprhd.helpers.volume import Volume
-        volobj = Volume(self.ipaddr, self.port)
+        volobj = Volume(self.ipaddr, self.port, self.transport)
         if add_volumes:
             for volname in add_volumes:
                 full_project_name = tenant + "/" + project
@@ -211,7 +216,7 @@ class ConsistencyGroup(common.CoprHDResource):
         (s, h) = common.service_json_request(
             self.ipaddr, self.port, "PUT",
             self.URI_CONSISTENCY_GROUPS_INSTANCE.format(uri),
-            body)
+            body, transport=self.transport)
 
         o = common.json_decode(s)
         if sync:
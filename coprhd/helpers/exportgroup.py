@@ -14,6 +14,7 @@
 #    under the License.
 
 import oslo_serialization
+from oslo_utils import timeutils
 
 from cinder.i18n import _
 from cinder.volume.drivers.coprhd.helpers import commoncoprhdapi as common
@@ -26,6 +27,7 @@ from cinder.volume.drivers.coprhd.helpers import volume
 class ExportGroup(common.CoprHDResource):
 
     URI_EXPORT_GROUP = "/block/exports"
+    URI_EXPORT_GROUPS_BULK = URI_EXPORT_GROUP + "/bulk"
     URI_EXPORT_GROUPS_SHOW = URI_EXPORT_GROUP + "/{0}"
     URI_EXPORT_GROUP_SEARCH = '/block/exports/search'
     URI_EXPORT_GROUP_UPDATE = '/block/exports/{0}'
@@ -43,6 +45,31 @@ class ExportGroup(common.CoprHDResource):
         o = self.send_json_request(exportgroup_uri, parms)
         return self.check_for_sync(o, sync, synctimeout)
 
+    def exportgroup_add_volumes_by_uri(self, exportgroup_uri,
+                                       volume_id_list, sync=False,
+                                       synctimeout=0, luns=None):
+        """Add volumes to the exportgroup, given the uris of volume.
+
+        :param luns: optional LUN of each volume, by volume uri
+        """
+
+        parms = {}
+
+        parms['volume_changes'] = self._add_list(volume_id_list, luns)
+        o = self.send_json_request(exportgroup_uri, parms)
+        return self.check_for_sync(o, sync, synctimeout)
+
+    def _add_list(self, uris, luns=None):
+        if not isinstance(uris, list):
+            uris = [uris]
+        entries = []
+        for uri in uris:
+            entry = {'id': uri}
+            if luns and luns.get(uri) is not None:
+                entry['lun'] = luns[uri]
+            entries.append(entry)
+        return {'add': entries}
+
     def _remove_list(self, uris):
         resChanges = {}
         if not isinstance(uris, list):
@@ -55,7 +82,8 @@ class ExportGroup(common.CoprHDResource):
         body = oslo_serialization.jsonutils.dumps(param)
         (s, h) = common.service_json_request(
             self.ipaddr, self.port, "PUT",
-            self.URI_EXPORT_GROUP_UPDATE.format(exportgroup_uri), body)
+            self.URI_EXPORT_GROUP_UPDATE.format(exportgroup_uri), body,
+            transport=self.transport)
         return common.json_decode(s)
 
     def check_for_sync(self, result, sync, synctimeout=0):
@@ -65,7 +93,8 @@ class ExportGroup(common.CoprHDResource):
                 return (
                     common.block_until_complete("export", resource["id"],
                                                 result["id"], self.ipaddr,
-                                                self.port, synctimeout)
+                                                self.port, synctimeout,
+                                                transport=self.transport)
                 )
             else:
                 raise common.CoprHdError(
@@ -83,7 +112,7 @@ class ExportGroup(common.CoprHDResource):
         """
         if tenant is None:
             tenant = ""
-        projobj = project.Project(self.ipaddr, self.port)
+        projobj = project.Project(self.ipaddr, self.port, self.transport)
         fullproj = tenant + "/" + project_name
         projuri = projobj.project_query(fullproj)
 
@@ -95,7 +124,8 @@ class ExportGroup(common.CoprHDResource):
             uri += '?project=' + projuri
 
         (s, h) = common.service_json_request(self.ipaddr, self.port, "GET",
-                                             uri, None)
+                                             uri, None,
+                                             transport=self.transport)
         o = common.json_decode(s)
         if not o:
             return []
@@ -107,6 +137,22 @@ class ExportGroup(common.CoprHDResource):
 
         return exportgroups
 
+    def exportgroup_show_bulk(self, uris):
+        """Makes REST API call to retrieve the details of export groups.
+
+        :param uris: list of export group UUIDs
+        :returns: list of the details of the active export groups
+        """
+        body = oslo_serialization.jsonutils.dumps({'id': list(uris)})
+        (s, h) = common.service_json_request(self.ipaddr, self.port, "POST",
+                                             self.URI_EXPORT_GROUPS_BULK,
+                                             body, transport=self.transport)
+        o = common.json_decode(s)
+        if not o or 'exportgroup' not in o:
+            return []
+        return [group for group in common.get_list(o, 'exportgroup')
+                if not group.get('inactive')]
+
     def exportgroup_show(self, name, project, tenant, varray=None):
         """This function displays the Export group with details.
 
@@ -118,14 +164,15 @@ class ExportGroup(common.CoprHDResource):
         varrayuri = None
         if varray:
             varrayObject = virtualarray.VirtualArray(
-                self.ipaddr, self.port)
+                self.ipaddr, self.port, self.transport)
             varrayuri = varrayObject.varray_query(varray)
         uri = self.exportgroup_query(name, project, tenant, varrayuri)
         (s, h) = common.service_json_request(
             self.ipaddr,
             self.port,
             "GET",
-            self.URI_EXPORT_GROUPS_SHOW.format(uri), None)
+            self.URI_EXPORT_GROUPS_SHOW.format(uri), None,
+            transport=self.transport)
         o = common.json_decode(s)
         if o['inactive']:
             return None
@@ -152,11 +199,12 @@ class ExportGroup(common.CoprHDResource):
                     tenant = ""
 
                 fullproj = tenant + "/" + project_name
-                projObject = project.Project(self.ipaddr, self.port)
+                projObject = project.Project(self.ipaddr, self.port,
+                                             self.transport)
                 projuri = projObject.project_query(fullproj)
 
                 varrayObject = virtualarray.VirtualArray(
-                    self.ipaddr, self.port)
+                    self.ipaddr, self.port, self.transport)
                 nhuri = varrayObject.varray_query(varray)
 
                 parms = {
@@ -167,7 +215,8 @@ class ExportGroup(common.CoprHDResource):
                 }
 
                 if exportgrouptype and export_destination:
-                    host_obj = host.Host(self.ipaddr, self.port)
+                    host_obj = host.Host(self.ipaddr, self.port,
+                                         self.transport)
                     host_uri = host_obj.query_by_name(export_destination)
                     parms['hosts'] = [host_uri]
 
@@ -175,7 +224,8 @@ class ExportGroup(common.CoprHDResource):
                 (s, h) = common.service_json_request(self.ipaddr,
                                                      self.port, "POST",
                                                      self.URI_EXPORT_GROUP,
-                                                     body)
+                                                     body,
+                                                     transport=self.transport)
 
                 o = common.json_decode(s)
                 return o
@@ -229,7 +279,7 @@ class ExportGroup(common.CoprHDResource):
         :param minpaths          : Minimum number of paths
         :param pathsperinitiator : Paths per initiator
         :param projectname       : name of project
-        :param volumenames       : names of volumes that needs
+        :param volumenames       : names or uris of volumes that needs
                                to be added to exportgroup
         :param cg                : consistency group
         :param synctimeout       : Query for task status for "synctimeout" secs
@@ -241,7 +291,7 @@ class ExportGroup(common.CoprHDResource):
         varrayuri = None
         if varray:
             varrayObject = virtualarray.VirtualArray(
-                self.ipaddr, self.port)
+                self.ipaddr, self.port, self.transport)
             varrayuri = varrayObject.varray_query(varray)
 
         exportgroup_uri = self.exportgroup_query(exportgroupname,
@@ -276,8 +326,12 @@ class ExportGroup(common.CoprHDResource):
 
         """
         copyEntries = []
-        volumeObject = volume.Volume(self.ipaddr, self.port)
+        volumeObject = volume.Volume(self.ipaddr, self.port, self.transport)
         for copy in resources:
+            if resType == "volumes" and common.is_uri(copy):
+                # already resolved, there is no lun in a uri
+                copyEntries.append({'id': copy})
+                continue
             copyParam = []
             try:
                 copyParam = copy.split(":")
@@ -301,3 +355,123 @@ class ExportGroup(common.CoprHDResource):
                 copy['lun'] = copyParam[1]
             copyEntries.append(copy)
         return copyEntries
+
+
+class ExportGroupIndex(object):
+
+    """Index of the export groups of a project by initiators and varray.
+
+    Keyed by the frozenset of the initiator ports of a group and the URI
+    of its varray. The index is loaded with the bulk export group API and
+    reloaded after ttl seconds, or after a group was found to be stale.
+    The driver adds the groups it creates. A reload builds a new index
+    and swaps it in once complete, concurrent callers wait for it.
+    """
+
+    # number of export groups fetched per bulk request
+    BULK_SIZE = 500
+
+    def __init__(self, exportgroup_obj, project_name, tenant_name,
+                 ttl=common.DEFAULT_CACHE_TTL):
+        self.exportgroup_obj = exportgroup_obj
+        self.project_name = project_name
+        self.tenant_name = tenant_name
+        self.ttl = ttl
+        self._keys = {}
+        self._groups = {}
+        self._watch = None
+        self._flight = common.SingleFlight()
+        # groups added or discarded while a load runs, applied to the
+        # loaded index
+        self._changes = None
+        self.hits = 0
+        self.misses = 0
+
+    def find(self, initiator_ports, varray_uri):
+        """Returns the export group of a set of initiators on a varray.
+
+        A group matches if all its initiators are among initiator_ports;
+        one with exactly these initiators is preferred.
+
+        :param initiator_ports: ports of the initiators of the host
+        :param varray_uri: URI of the virtual array of the group
+        :returns: URI of the export group, None if there is none
+        """
+        if self._watch is None or self._watch.expired():
+            self._flight.do('load', self.load)
+
+        ports = frozenset(initiator_ports)
+        uri = self._keys.get((ports, varray_uri))
+        if uri is None:
+            for group_uri, key in self._groups.items():
+                if key[1] == varray_uri and key[0] <= ports:
+                    uri = group_uri
+                    break
+
+        if uri is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return uri
+
+    def load(self):
+        """Loads the export groups of the project."""
+        self._changes = []
+        try:
+            uris = self.exportgroup_obj.exportgroup_list(self.project_name,
+                                                         self.tenant_name)
+            keys = {}
+            groups = {}
+            for i in range(0, len(uris), self.BULK_SIZE):
+                for group in self.exportgroup_obj.exportgroup_show_bulk(
+                        uris[i:i + self.BULK_SIZE]):
+                    ports = [initiator['initiator_port']
+                             for initiator in group.get('initiators') or []]
+                    varray_uri = (group.get('varray') or {}).get('id')
+                    self._add(keys, groups, group['id'], ports, varray_uri)
+
+            for change in self._changes:
+                if len(change) == 1:
+                    self._discard(keys, groups, *change)
+                else:
+                    self._add(keys, groups, *change)
+        finally:
+            self._changes = None
+
+        self._keys, self._groups = keys, groups
+        self._watch = timeutils.StopWatch(duration=self.ttl)
+        self._watch.start()
+
+    def add(self, uri, initiator_ports, varray_uri):
+        """Indexes an export group."""
+        if self._changes is not None:
+            self._changes.append((uri, initiator_ports, varray_uri))
+        self._add(self._keys, self._groups, uri, initiator_ports,
+                  varray_uri)
+
+    def discard(self, uri):
+        """Drops an export group from the index."""
+        if self._changes is not None:
+            self._changes.append((uri,))
+        self._discard(self._keys, self._groups, uri)
+
+    @classmethod
+    def _add(cls, keys, groups, uri, initiator_ports, varray_uri):
+        cls._discard(keys, groups, uri)
+        key = (frozenset(initiator_ports), varray_uri)
+        groups[uri] = key
+        keys.setdefault(key, uri)
+
+    @staticmethod
+    def _discard(keys, groups, uri):
+        key = groups.pop(uri, None)
+        if key is not None and keys.get(key) == uri:
+            del keys[key]
+
+    def invalidate(self):
+        self._watch = None
+
+    def get_stats(self):
+        return {'export_groups': len(self._groups),
+                'hits': self.hits,
+                'misses': self.misses}
@@ -13,6 +13,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import oslo_serialization
+from oslo_utils import timeutils
+
 from cinder.i18n import _
 from cinder.volume.drivers.coprhd.helpers import commoncoprhdapi as common
 from cinder.volume.drivers.coprhd.helpers import tenant
@@ -24,6 +27,9 @@ class Host(common.CoprHDResource):
     URI_HOST_DETAILS = "/compute/hosts/{0}"
     URI_HOST_LIST_INITIATORS = "/compute/hosts/{0}/initiators"
     URI_COMPUTE_HOST = "/compute/hosts"
+    URI_INITIATORS = "/compute/initiators"
+    URI_INITIATORS_BULK = URI_INITIATORS + "/bulk"
+    URI_INITIATORS_SEARCH = URI_INITIATORS + "/search?initiator_port={0}"
 
     def query_by_name(self, host_name, tenant_name=None):
         """Search host matching host_name and tenant if tenant_name provided.
@@ -54,7 +60,7 @@ class Host(common.CoprHDResource):
         (s, h) = common.service_json_request(
             self.ipaddr, self.port, "GET",
             Host.URI_HOST_LIST_INITIATORS.format(hostUri),
-            None)
+            None, transport=self.transport)
         o = common.json_decode(s)
 
         if not o or "initiator" not in o:
@@ -65,7 +71,7 @@ class Host(common.CoprHDResource):
     def list_all(self, tenant_name):
         """Gets the ids and self links for all compute elements."""
         restapi = self.URI_COMPUTE_HOST
-        tenant_obj = tenant.Tenant(self.ipaddr, self.port)
+        tenant_obj = tenant.Tenant(self.ipaddr, self.port, self.transport)
         if tenant_name is None:
             tenant_uri = tenant_obj.tenant_getid()
         else:
@@ -76,7 +82,7 @@ class Host(common.CoprHDResource):
             self.ipaddr, self.port,
             "GET",
             restapi,
-            None)
+            None, transport=self.transport)
         o = common.json_decode(s)
         return o['host']
 
@@ -84,10 +90,135 @@ class Host(common.CoprHDResource):
         """Makes REST API call to retrieve Host details based on its UUID."""
         (s, h) = common.service_json_request(self.ipaddr, self.port, "GET",
                                              Host.URI_HOST_DETAILS.format(uri),
-                                             None)
+                                             None, transport=self.transport)
         o = common.json_decode(s)
         inactive = common.get_node_value(o, 'inactive')
 
         if inactive:
             return None
         return o
+
+    def list_initiator_uris(self):
+        """Returns the UUIDs of all the initiators."""
+        (s, h) = common.service_json_request(self.ipaddr, self.port, "GET",
+                                             Host.URI_INITIATORS_BULK,
+                                             None, transport=self.transport)
+        o = common.json_decode(s)
+        if not o or "id" not in o:
+            return []
+        return common.get_list(o, 'id')
+
+    def show_initiators_bulk(self, uris):
+        """Makes REST API call to retrieve the details of many initiators.
+
+        :param uris: list of initiator UUIDs
+        :returns: list of the details of the active initiators
+        """
+        body = oslo_serialization.jsonutils.dumps({'id': list(uris)})
+        (s, h) = common.service_json_request(self.ipaddr, self.port, "POST",
+                                             Host.URI_INITIATORS_BULK,
+                                             body, transport=self.transport)
+        o = common.json_decode(s)
+        if not o or "initiator" not in o:
+            return []
+        return [initiator for initiator in common.get_list(o, 'initiator')
+                if not initiator.get('inactive')]
+
+    def search_initiators(self, initiator_port):
+        """Returns the details of the initiators with the given port."""
+        (s, h) = common.service_json_request(
+            self.ipaddr, self.port, "GET",
+            Host.URI_INITIATORS_SEARCH.format(initiator_port),
+            None, transport=self.transport)
+        o = common.json_decode(s)
+        if not o or "resource" not in o:
+            return []
+        uris = [resource['id']
+                for resource in common.get_node_value(o, 'resource')]
+        if not uris:
+            return []
+        return self.show_initiators_bulk(uris)
+
+
+class InitiatorIndex(object):
+
+    """Index of the initiator ports of the CoprHD hosts of a tenant.
+
+    Maps every port to the name of its host, so that the host of a port
+    is found without listing the initiators of each host. The index is
+    built with the bulk initiator API and rebuilt after ttl seconds;
+    callers that find it expired at the same time share one rebuild. A
+    port that is not indexed is searched for and added, so hosts
+    registered in between are found as well.
+    """
+
+    # number of initiators fetched per bulk request
+    BULK_SIZE = 500
+
+    def __init__(self, host_obj, tenant_name, ttl=common.DEFAULT_CACHE_TTL):
+        self.host_obj = host_obj
+        self.tenant_name = tenant_name
+        self.ttl = ttl
+        self._ports = {}
+        self._hosts = {}
+        self._watch = None
+        self._flight = common.SingleFlight()
+        self.hits = 0
+        self.misses = 0
+
+    def find(self, initiator_port):
+        """Returns the name of the host of an initiator port.
+
+        :param initiator_port: WWPN or IQN of the initiator
+        :returns: name of the host, None if no host of the tenant has
+                  the port
+        """
+        if self._watch is None or self._watch.expired():
+            self._flight.do('load', self.load)
+        host_name = self._ports.get(initiator_port)
+        if host_name is not None:
+            self.hits += 1
+            return host_name
+
+        self.misses += 1
+        # the host may have been registered after the index was built
+        self._hosts = self._list_hosts()
+        for initiator in self.host_obj.search_initiators(initiator_port):
+            host_name = self._hosts.get(self._host_id(initiator))
+            if host_name is not None:
+                self._ports[initiator_port] = host_name
+                return host_name
+        return None
+
+    def load(self):
+        """Builds the index of the initiators of the hosts of the tenant."""
+        hosts = self._list_hosts()
+        uris = self.host_obj.list_initiator_uris()
+        ports = {}
+        for i in range(0, len(uris), self.BULK_SIZE):
+            for initiator in self.host_obj.show_initiators_bulk(
+                    uris[i:i + self.BULK_SIZE]):
+                host_name = hosts.get(self._host_id(initiator))
+                if host_name is not None:
+                    ports[initiator['initiator_port']] = host_name
+
+        self._hosts = hosts
+        self._ports = ports
+        self._watch = timeutils.StopWatch(duration=self.ttl)
+        self._watch.start()
+
+    def invalidate(self):
+        self._watch = None
+
+    def get_stats(self):
+        return {'ports': len(self._ports),
+                'hits': self.hits,
+                'misses': self.misses}
+
+    def _list_hosts(self):
+        return dict((host['id'], host['name'])
+                    for host in self.host_obj.list_all(self.tenant_name))
+
+    @staticmethod
+    def _host_id(initiator):
+        return (initiator.get('host') or {}).get('id')
@@ -34,20 +34,22 @@ class Project(common.CoprHDResource):
         """
         if common.is_uri(name):
             return name
+        return self.transport.resolve('project', name, self._project_query)
+
+    def _project_query(self, name):
         (tenant_name, project_name) = common.get_parent_child_from_xpath(name)
 
-        tenant_obj = tenant.Tenant(self.ipaddr, self.port)
+        tenant_obj = tenant.Tenant(self.ipaddr, self.port, self.transport)
 
         tenant_uri = tenant_obj.tenant_query(tenant_name)
         projects = self.project_list(tenant_uri)
         if projects:
-            for project in projects:
-                if project:
-                    project_detail = self.project_show_by_uri(
-                        project['id'])
-                    if(project_detail and
-                       project_detail['name'] == project_name):
-                        return project_detail['id']
+            project_detail = self.transport.fan_out.find(
+                self.project_show_by_uri,
+                [project['id'] for project in projects if project],
+                lambda detail: detail['name'] == project_name)
+            if project_detail:
+                return project_detail['id']
         raise common.CoprHdError(common.CoprHdError.NOT_FOUND_ERR, (_(
                                  "Project: %s not found") % project_name))
 
@@ -57,12 +59,13 @@ class Project(common.CoprHDResource):
         :param tenant_name: Name of the tenant
         :returns: List of project UUIDs in JSON response payload
         """
-        tenant_obj = tenant.Tenant(self.ipaddr, self.port)
+        tenant_obj = tenant.Tenant(self.ipaddr, self.port, self.transport)
         tenant_uri = tenant_obj.tenant_query(tenant_name)
         (s, h) = common.service_json_request(self.ipaddr, self.port, "GET",
                                              Project.URI_PROJECT_LIST.format(
                                                  tenant_uri),
-                                             None)
+                                             None, transport=self.transport,
+                                             invalidate_resolved=True)
         o = common.json_decode(s)
 
         if "project" in o:
@@ -79,7 +82,7 @@ class Project(common.CoprHDResource):
         (s, h) = common.service_json_request(self.ipaddr, self.port,
                                              "GET",
                                              Project.URI_PROJECT.format(uri),
-                                             None)
+                                             None, transport=self.transport)
         o = common.json_decode(s)
         inactive = common.get_node_value(o, 'inactive')
         if inactive:
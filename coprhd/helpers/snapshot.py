@@ -55,7 +55,8 @@ class Snapshot(common.CoprHDResource):
         (s, h) = common.service_json_request(
             self.ipaddr, self.port,
             "GET",
-            Snapshot.URI_SNAPSHOT_LIST.format(otype, otypename, ouri), None)
+            Snapshot.URI_SNAPSHOT_LIST.format(otype, otypename, ouri), None,
+            transport=self.transport)
         o = common.json_decode(s)
         return o['snapshot']
 
@@ -75,30 +76,37 @@ class Snapshot(common.CoprHDResource):
                 Snapshot.URI_CONSISTENCY_GROUPS_SNAPSHOT_INSTANCE.format(
                     resource_uri,
                     suri),
-                None)
+                None, transport=self.transport)
         else:
             (s, h) = common.service_json_request(
                 self.ipaddr, self.port,
                 "GET",
-                Snapshot.URI_SNAPSHOTS.format(otype, suri), None)
+                Snapshot.URI_SNAPSHOTS.format(otype, suri), None,
+                transport=self.transport)
 
         return common.json_decode(s)
 
     def snapshot_query(self, storageres_type,
                        storageres_typename, resuri, snapshot_name):
+        if common.is_uri(snapshot_name):
+            return snapshot_name
+
         if resuri is not None:
             uris = self.snapshot_list_uri(
                 storageres_type,
                 storageres_typename,
                 resuri)
-            for uri in uris:
-                snapshot = self.snapshot_show_uri(
+            snapshot = self.transport.fan_out.find(
+                lambda uri: self.snapshot_show_uri(
                     storageres_type,
                     resuri,
-                    uri['id'])
-                if (False == common.get_node_value(snapshot, 'inactive') and
-                        snapshot['name'] == snapshot_name):
-                    return snapshot['id']
+                    uri['id']),
+                uris,
+                lambda snapshot: (
+                    False == common.get_node_value(snapshot, 'inactive') and
+                    snapshot['name'] == snapshot_name))
+            if snapshot:
+                return snapshot['id']
 
         raise common.CoprHdError(
             common.CoprHdError.SOS_FAILURE_ERR,
@@ -118,12 +126,13 @@ class Snapshot(common.CoprHDResource):
         resUri = None
         resourceObj = None
         if Snapshot.BLOCK == storageres_type and volume_name is not None:
-            resourceObj = volume.Volume(self.ipaddr, self.port)
+            resourceObj = volume.Volume(self.ipaddr, self.port, self.transport)
             resUri = resourceObj.volume_query(resourcepath, volume_name)
         elif Snapshot.BLOCK == storageres_type and cg_name is not None:
             resourceObj = consistencygroup.ConsistencyGroup(
                 self.ipaddr,
-                self.port)
+                self.port,
+                self.transport)
             resUri = resourceObj.consistencygroup_query(
                 cg_name,
                 project,
@@ -184,7 +193,8 @@ class Snapshot(common.CoprHDResource):
         (s, h) = common.service_json_request(
             self.ipaddr, self.port,
             "POST",
-            Snapshot.URI_SNAPSHOT_LIST.format(otype, typename, ouri), body)
+            Snapshot.URI_SNAPSHOT_LIST.format(otype, typename, ouri), body,
+            transport=self.transport)
         o = common.json_decode(s)
 
         task = o["task"][0]
@@ -194,7 +204,8 @@ class Snapshot(common.CoprHDResource):
                 common.block_until_complete(
                     otype,
                     task['resource']['id'],
-                    task["id"], self.ipaddr, self.port, synctimeout)
+                    task["id"], self.ipaddr, self.port, synctimeout,
+                    transport=self.transport)
             )
         else:
             return o
@@ -219,7 +230,7 @@ class Snapshot(common.CoprHDResource):
                 "POST",
                 Snapshot.URI_RESOURCE_DEACTIVATE.format(
                     Snapshot.URI_BLOCK_SNAPSHOTS.format(suri)),
-                None)
+                None, transport=self.transport)
         elif resource_uri.find("BlockConsistencyGroup") > 0:
 
             (s, h) = common.service_json_request(
@@ -228,7 +239,7 @@ class Snapshot(common.CoprHDResource):
                 Snapshot.URI_CONSISTENCY_GROUPS_SNAPSHOT_DEACTIVATE.format(
                     resource_uri,
                     suri),
-                None)
+                None, transport=self.transport)
         o = common.json_decode(s)
         task = o["task"][0]
 
@@ -237,7 +248,8 @@ class Snapshot(common.CoprHDResource):
                 common.block_until_complete(
                     otype,
                     task['resource']['id'],
-                    task["id"], self.ipaddr, self.port, synctimeout)
+                    task["id"], self.ipaddr, self.port, synctimeout,
+                    transport=self.transport)
             )
         else:
             return o
@@ -33,7 +33,8 @@ class Tag(common.CoprHDResource):
         body = oslo_serialization.jsonutils.dumps(params)
 
         (s, h) = common.service_json_request(self.ipaddr, self.port, "PUT",
-                                             uri.format(resource_id), body)
+                                             uri.format(resource_id), body,
+                                             transport=self.transport)
         o = common.json_decode(s)
         return o
 
@@ -46,7 +47,7 @@ class Tag(common.CoprHDResource):
                                              self.port,
                                              "GET",
                                              resource_uri,
-                                             None)
+                                             None, transport=self.transport)
 
         allTags = []
         o = common.json_decode(s)
@@ -32,7 +32,9 @@ class Tenant(common.CoprHDResource):
 
         if common.is_uri(label):
             return label
+        return self.transport.resolve('tenant', label, self._tenant_query)
 
+    def _tenant_query(self, label):
         tenant_id = self.tenant_getid()
 
         if not label:
@@ -61,7 +63,8 @@ class Tenant(common.CoprHDResource):
 
     def tenant_getid(self):
         (s, h) = common.service_json_request(self.ipaddr, self.port,
-                                             "GET", Tenant.URI_TENANT, None)
+                                             "GET", Tenant.URI_TENANT, None,
+                                             transport=self.transport)
 
         o = common.json_decode(s)
         return o['id']
@@ -82,7 +85,8 @@ class Tenant(common.CoprHDResource):
                                ("id" in tenantdtls['parent_tenant']))):
             (s, h) = common.service_json_request(
                 self.ipaddr, self.port,
-                "GET", self.URI_TENANTS_SUBTENANT.format(uri), None)
+                "GET", self.URI_TENANTS_SUBTENANT.format(uri), None,
+                transport=self.transport)
 
             o = common.json_decode(s)
             return o['subtenant']
@@ -94,7 +98,7 @@ class Tenant(common.CoprHDResource):
         """Makes REST API call to retrieve tenant details based on UUID."""
         (s, h) = common.service_json_request(self.ipaddr, self.port, "GET",
                                              Tenant.URI_TENANTS.format(uri),
-                                             None)
+                                             None, transport=self.transport)
 
         o = common.json_decode(s)
         if 'inactive' in o and o['inactive']:
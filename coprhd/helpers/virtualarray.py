@@ -28,13 +28,16 @@ class VirtualArray(common.CoprHDResource):
         """Returns the UID of the varray specified by the name."""
         if common.is_uri(name):
             return name
+        return self.transport.resolve('varray', name, self._varray_query)
 
+    def _varray_query(self, name):
         uris = self.varray_list()
 
-        for uri in uris:
-            varray = self.varray_show(uri)
-            if varray and varray['name'] == name:
-                return varray['id']
+        varray = self.transport.fan_out.find(
+            self.varray_show, uris,
+            lambda varray: varray['name'] == name)
+        if varray:
+            return varray['id']
 
         raise common.CoprHdError(common.CoprHdError.NOT_FOUND_ERR,
                                  (_("varray %s: not found") % name))
@@ -53,7 +56,7 @@ class VirtualArray(common.CoprHDResource):
             vdcrestapi = VirtualArray.URI_VIRTUALARRAY
         (s, h) = common.service_json_request(
             self.ipaddr, self.port, "GET",
-            vdcrestapi, None)
+            vdcrestapi, None, transport=self.transport)
 
         o = common.json_decode(s)
 
@@ -70,7 +73,7 @@ class VirtualArray(common.CoprHDResource):
         (s, h) = common.service_json_request(
             self.ipaddr, self.port, "GET",
             VirtualArray.URI_VIRTUALARRAY_URI.format(uri),
-            None)
+            None, transport=self.transport)
 
         o = common.json_decode(s)
         if 'inactive' in o and o['inactive'] is True:
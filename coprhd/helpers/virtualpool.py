@@ -37,7 +37,8 @@ class VirtualPool(common.CoprHDResource):
         (s, h) = common.service_json_request(
             self.ipaddr, self.port,
             "GET",
-            self.URI_VPOOL_SHOW.format(vpooltype, uri), None)
+            self.URI_VPOOL_SHOW.format(vpooltype, uri), None,
+            transport=self.transport)
 
         o = common.json_decode(s)
         if o['inactive']:
@@ -57,10 +58,15 @@ class VirtualPool(common.CoprHDResource):
         """
         if common.is_uri(name):
             return name
+        return self.transport.resolve(
+            'vpool/' + vpooltype, name,
+            lambda vpool_name: self._vpool_query(vpool_name, vpooltype))
 
+    def _vpool_query(self, name, vpooltype):
         (s, h) = common.service_json_request(
             self.ipaddr, self.port, "GET",
-            self.URI_VPOOL_SEARCH.format(vpooltype, name), None)
+            self.URI_VPOOL_SEARCH.format(vpooltype, name), None,
+            transport=self.transport)
 
         o = common.json_decode(s)
         if len(o['resource']) > 0:
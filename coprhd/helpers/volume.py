@@ -13,7 +13,11 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import threading
+
+from oslo_log import log as logging
 import oslo_serialization
+from oslo_service import loopingcall
 from oslo_utils import units
 import six
 
@@ -24,6 +28,8 @@ from cinder.volume.drivers.coprhd.helpers import project
 from cinder.volume.drivers.coprhd.helpers import virtualarray
 from cinder.volume.drivers.coprhd.helpers import virtualpool
 
+LOG = logging.getLogger(__name__)
+
 
 class Volume(common.CoprHDResource):
 
@@ -31,6 +37,7 @@ class Volume(common.CoprHDResource):
     URI_SEARCH_VOLUMES = '/block/volumes/search?project={0}'
     URI_SEARCH_VOLUMES_BY_TAG = '/block/volumes/search?tag={0}'
     URI_VOLUMES = '/block/volumes'
+    URI_VOLUMES_BULK = URI_VOLUMES + '/bulk'
     URI_VOLUME = URI_VOLUMES + '/{0}'
     URI_VOLUME_EXPORTS = URI_VOLUME + '/exports'
     URI_BULK_DELETE = URI_VOLUMES + '/deactivate'
@@ -57,6 +64,11 @@ class Volume(common.CoprHDResource):
     BLOCK = 'block'
     SNAPSHOTS = 'snapshots'
 
+    @property
+    def catalog(self):
+        """The VolumeCatalog of the backend, None if it is not enabled."""
+        return self.transport.volume_catalog
+
     # Lists volumes in a project
     def list_volumes(self, project):
         """Makes REST API call to list volumes under a project.
@@ -66,23 +78,19 @@ class Volume(common.CoprHDResource):
         """
 
         volume_uris = self.search_volumes(project)
-        volumes = []
-        for uri in volume_uris:
-            volume = self.show_by_uri(uri)
-            if volume:
-                volumes.append(volume)
-        return volumes
+        volumes = self.transport.fan_out.map(self.show_by_uri, volume_uris)
+        return [volume for volume in volumes if volume]
 
     def search_volumes(self, project_name):
 
-        proj = project.Project(self.ipaddr, self.port)
+        proj = project.Project(self.ipaddr, self.port, self.transport)
         project_uri = proj.project_query(project_name)
 
         (s, h) = common.service_json_request(self.ipaddr, self.port,
                                              "GET",
                                              Volume.URI_SEARCH_VOLUMES.format(
                                                  project_uri),
-                                             None)
+                                             None, transport=self.transport)
         o = common.json_decode(s)
         if not o:
             return []
@@ -104,13 +112,30 @@ class Volume(common.CoprHDResource):
         (s, h) = common.service_json_request(self.ipaddr, self.port,
                                              "GET",
                                              Volume.URI_VOLUME.format(uri),
-                                             None)
+                                             None, transport=self.transport)
         o = common.json_decode(s)
         inactive = common.get_node_value(o, 'inactive')
         if inactive:
             return None
         return o
 
+    def show_bulk(self, uris):
+        """Makes REST API call to retrieve the details of many volumes.
+
+        :param uris: list of volume UUIDs
+        :returns: list of the details of the active volumes
+        """
+        body = oslo_serialization.jsonutils.dumps({'id': list(uris)})
+        (s, h) = common.service_json_request(self.ipaddr, self.port,
+                                             "POST",
+                                             Volume.URI_VOLUMES_BULK,
+                                             body, transport=self.transport)
+        o = common.json_decode(s)
+        if not o or 'volume' not in o:
+            return []
+        return [volume for volume in common.get_list(o, 'volume')
+                if not volume.get('inactive')]
+
     # Creates a volume given label, project, vpool and size
     def create(self, project_name, label, size, varray, vpool,
                sync, consistencygroup, synctimeout=0):
@@ -130,13 +155,15 @@ class Volume(common.CoprHDResource):
         :returns: Created task details in JSON response payload
         """
 
-        proj_obj = project.Project(self.ipaddr, self.port)
+        proj_obj = project.Project(self.ipaddr, self.port, self.transport)
         project_uri = proj_obj.project_query(project_name)
 
-        vpool_obj = virtualpool.VirtualPool(self.ipaddr, self.port)
+        vpool_obj = virtualpool.VirtualPool(self.ipaddr, self.port,
+                                            self.transport)
         vpool_uri = vpool_obj.vpool_query(vpool, "block")
 
-        varray_obj = virtualarray.VirtualArray(self.ipaddr, self.port)
+        varray_obj = virtualarray.VirtualArray(self.ipaddr, self.port,
+                                               self.transport)
         varray_uri = varray_obj.varray_query(varray)
 
         request = {
@@ -154,21 +181,38 @@ class Volume(common.CoprHDResource):
         (s, h) = common.service_json_request(self.ipaddr, self.port,
                                              "POST",
                                              Volume.URI_VOLUMES,
-                                             body)
+                                             body, transport=self.transport)
         o = common.json_decode(s)
 
         if sync:
             # check task empty
             if len(o["task"]) > 0:
                 task = o["task"][0]
-                return self.check_for_sync(task, sync, synctimeout)
+                result = self.check_for_sync(task, sync, synctimeout)
+                self._catalog_add(project_name, task, label,
+                                  vpool_uri, varray_uri)
+                return result
             else:
                 raise common.CoprHdError(
                     common.CoprHdError.SOS_FAILURE_ERR,
                     _("error: task list is empty, no task response found"))
         else:
+            if o.get("task"):
+                self._catalog_add(project_name, o["task"][0], label,
+                                  vpool_uri, varray_uri)
             return o
 
+    def _catalog_add(self, project_name, task, label, vpool_uri=None,
+                     varray_uri=None):
+        """Adds the volume created by a task to the volume catalog."""
+        if self.catalog is None or not task.get("resource"):
+            return
+        self.catalog.add(project_name,
+                         {'id': task["resource"]["id"],
+                          'name': label,
+                          'vpool': {'id': vpool_uri},
+                          'varray': {'id': varray_uri}})
+
     # Blocks the operation until the task is complete/error out/timeout
     def check_for_sync(self, result, sync, synctimeout=0):
         if sync:
@@ -177,7 +221,8 @@ class Volume(common.CoprHDResource):
                 return (
                     common.block_until_complete("volume", resource["id"],
                                                 result["id"], self.ipaddr,
-                                                self.port, synctimeout)
+                                                self.port, synctimeout,
+                                                transport=self.transport)
                 )
             else:
                 raise common.CoprHdError(
@@ -200,11 +245,17 @@ class Volume(common.CoprHDResource):
         if not full_project_name:
             raise common.CoprHdError(common.CoprHdError.NOT_FOUND_ERR,
                                      _("Project name not specified"))
-        uris = self.search_volumes(full_project_name)
-        for uri in uris:
-            volume = self.show_by_uri(uri)
-            if volume and 'name' in volume and volume['name'] == volume_name:
-                return volume['id']
+        if self.catalog is not None:
+            uri = self.catalog.find(full_project_name, volume_name)
+            if uri:
+                return uri
+        else:
+            uris = self.search_volumes(full_project_name)
+            for uri in uris:
+                volume = self.show_by_uri(uri)
+                if (volume and 'name' in volume and
+                        volume['name'] == volume_name):
+                    return volume['id']
         raise common.CoprHdError(common.CoprHdError.NOT_FOUND_ERR,
                                  (_("Volume"
                                     "%s: not found") % volume_name))
@@ -245,14 +296,15 @@ class Volume(common.CoprHDResource):
             resUri = self.volume_query(resourcepath, volume_name)
             if snapshot_name is not None:
                 from cinder.volume.drivers.coprhd.helpers import snapshot
-                snapobj = snapshot.Snapshot(self.ipaddr, self.port)
+                snapobj = snapshot.Snapshot(self.ipaddr, self.port,
+                                            self.transport)
                 resUri = snapobj.snapshot_query(storageres_type,
                                                 Volume.VOLUMES, resUri,
                                                 snapshot_name)
 
         elif Volume.BLOCK == storageres_type and cg_name is not None:
             resourceObj = consistencygroup.ConsistencyGroup(
-                self.ipaddr, self.port)
+                self.ipaddr, self.port, self.transport)
             resUri = resourceObj.consistencygroup_query(
                 cg_name,
                 project,
@@ -264,7 +316,7 @@ class Volume(common.CoprHDResource):
 
     # Creates volume(s) from given source volume
     def clone(self, new_vol_name, resource_uri,
-              sync, synctimeout=0):
+              sync, synctimeout=0, project_name=None):
         """Makes REST API call to clone volume.
 
         :param new_vol_name: name of volume
@@ -273,13 +325,17 @@ class Volume(common.CoprHDResource):
         :param synctimeout : Query for task status for "synctimeout" secs.
                                  If the task doesn't complete in synctimeout
                                  secs, an exception is thrown
+        :param project_name: full project name of the clone, the clone is
+                             added to the volume catalog of the project
         :returns: Created task details in JSON response payload
         """
         is_snapshot_clone = False
+        is_cg_clone = False
         clone_full_uri = None
 
         # consistency group
         if resource_uri.find("BlockConsistencyGroup") > 0:
+            is_cg_clone = True
             clone_full_uri = Volume.URI_CG_CLONE.format(resource_uri)
         elif resource_uri.find("BlockSnapshot") > 0:
             is_snapshot_clone = True
@@ -301,9 +357,13 @@ class Volume(common.CoprHDResource):
         (s, h) = common.service_json_request(self.ipaddr, self.port,
                                              "POST",
                                              clone_full_uri,
-                                             body)
+                                             body, transport=self.transport)
         o = common.json_decode(s)
 
+        # the tasks of a consistency group clone are not for one volume
+        if project_name and not is_cg_clone and o.get("task"):
+            self._catalog_add(project_name, o["task"][0], new_vol_name)
+
         if sync:
             task = o["task"][0]
 
@@ -312,7 +372,8 @@ class Volume(common.CoprHDResource):
                     common.block_until_complete(
                         "block",
                         task["resource"]["id"],
-                        task["id"], self.ipaddr, self.port)
+                        task["id"], self.ipaddr, self.port,
+                        transport=self.transport)
                 )
             else:
                 return self.check_for_sync(task, sync, synctimeout)
@@ -345,12 +406,13 @@ class Volume(common.CoprHDResource):
                 "POST",
                 Volume.URI_CG_CLONE_DETACH.format(
                     resource_uri,
-                    volume_uri), None)
+                    volume_uri), None, transport=self.transport)
         else:
             (s, h) = common.service_json_request(
                 self.ipaddr, self.port,
                 "POST",
-                Volume.URI_VOLUME_CLONE_DETACH.format(volume_uri), None)
+                Volume.URI_VOLUME_CLONE_DETACH.format(volume_uri), None,
+                transport=self.transport)
 
         o = common.json_decode(s)
         if sync:
@@ -377,12 +439,25 @@ class Volume(common.CoprHDResource):
                                      (_("Volume %s : not found") %
                                       six.text_type(name)))
 
-        uris = self.search_volumes(full_project_name)
-
-        for uri in uris:
-            volume = self.show_by_uri(uri)
-            if volume and 'name' in volume and volume['name'] == name:
-                return volume
+        if self.catalog is not None:
+            uri = self.catalog.find(full_project_name, name)
+            if uri:
+                try:
+                    volume = self.show_by_uri(uri)
+                except common.CoprHdError as e:
+                    if e.status_code != 404:
+                        raise
+                    volume = None
+                if volume and volume.get('name') == name:
+                    return volume
+                # the index entry is stale
+                self.catalog.discard(uri)
+        else:
+            uris = self.search_volumes(full_project_name)
+            for uri in uris:
+                volume = self.show_by_uri(uri)
+                if volume and 'name' in volume and volume['name'] == name:
+                    return volume
         raise common.CoprHdError(common.CoprHdError.NOT_FOUND_ERR,
                                  (_("Volume"
                                     " %s : not found") % six.text_type(name)))
@@ -390,7 +465,10 @@ class Volume(common.CoprHDResource):
     def expand(self, full_project_name, volume_name, new_size,
                sync=False, synctimeout=0):
 
-        volume_detail = self.show(full_project_name, volume_name)
+        if common.is_uri(volume_name):
+            volume_detail = self.show_by_uri(volume_name)
+        else:
+            volume_detail = self.show(full_project_name, volume_name)
         from decimal import Decimal
         new_size_in_gb = Decimal(Decimal(new_size) / (units.Gi))
         current_size = Decimal(volume_detail["provisioned_capacity_gb"])
@@ -410,7 +488,7 @@ class Volume(common.CoprHDResource):
                                              "POST",
                                              Volume.URI_EXPAND.format(
                                                  volume_detail["id"]),
-                                             body)
+                                             body, transport=self.transport)
         if not s:
             return None
         o = common.json_decode(s)
@@ -455,7 +533,9 @@ class Volume(common.CoprHDResource):
                                              "POST",
                                              Volume.URI_DEACTIVATE.format(
                                                  uri) + params,
-                                             None)
+                                             None, transport=self.transport)
+        if self.catalog is not None:
+            self.catalog.discard(uri)
         if not s:
             return None
         o = common.json_decode(s)
@@ -474,7 +554,8 @@ class Volume(common.CoprHDResource):
                                              "GET",
                                              Volume.URI_VOLUME_EXPORTS.format(
                                                  uri),
-                                             None)
+                                             None, transport=self.transport,
+                                             coalesce=False)
         return common.json_decode(s)
 
     # Update a volume information
@@ -499,7 +580,8 @@ class Volume(common.CoprHDResource):
             volume_uri = self.volume_query(prefix_path, item)
             volumeurilist.append(volume_uri)
 
-        vpool_obj = virtualpool.VirtualPool(self.ipaddr, self.port)
+        vpool_obj = virtualpool.VirtualPool(self.ipaddr, self.port,
+                                            self.transport)
         vpool_uri = vpool_obj.vpool_query(vpool, "block")
 
         params = {
@@ -512,7 +594,169 @@ class Volume(common.CoprHDResource):
         (s, h) = common.service_json_request(
             self.ipaddr, self.port, "POST",
             Volume.URI_VOLUME_CHANGE_VPOOL,
-            body)
+            body, transport=self.transport)
 
         o = common.json_decode(s)
         return o
+
+
+class VolumeCatalog(object):
+
+    """In-memory index of the volumes of CoprHD projects.
+
+    Maps volume names to URIs per project, so that looking up a volume by
+    name does not have to show every volume of the project. A project is
+    loaded in bulk on first use, kept current by the create and delete
+    calls of Volume, and refreshed incrementally: only the volumes that
+    are not indexed yet are fetched from CoprHD.
+    """
+
+    # number of volumes fetched per bulk request
+    BULK_SIZE = 500
+
+    def __init__(self, volume_obj):
+        """Constructor: takes the Volume object used to query CoprHD."""
+        self.volume_obj = volume_obj
+        self._projects = {}
+        self._lock = threading.Lock()
+        self._refresh_locks = {}
+        self._refresher = None
+        self.hits = 0
+        self.misses = 0
+
+    def find(self, project_name, volume_name):
+        """Returns the URI of the named volume of a project.
+
+        On a miss the project is refreshed from CoprHD once before giving
+        up, so volumes created outside of the driver are found as well.
+
+        :param project_name: full project name, tenant/project
+        :param volume_name: name of the volume
+        :returns: URI of the volume, None if it does not exist
+        """
+        uri = self._lookup(project_name, volume_name)
+        if uri is not None:
+            self.hits += 1
+            return uri
+
+        self.misses += 1
+        self.refresh(project_name)
+        return self._lookup(project_name, volume_name)
+
+    def add(self, project_name, volume):
+        """Indexes a volume of a project that is already loaded.
+
+        :param project_name: full project name, tenant/project
+        :param volume: volume details, at least the id and name
+        """
+        with self._lock:
+            entry = self._projects.get(project_name)
+            if entry is not None:
+                self._add(entry, volume)
+
+    def discard(self, uri):
+        """Drops a volume from the index."""
+        with self._lock:
+            for entry in self._projects.values():
+                self._remove(entry, uri)
+
+    def volumes(self, project_name):
+        """Returns the indexed volumes of a project, loading it if needed.
+
+        :returns: list of dicts with the id, name, vpool and varray URIs
+        """
+        if project_name not in self._projects:
+            self.refresh(project_name)
+        with self._lock:
+            entry = self._projects.get(project_name, {'volumes': {}})
+            return [dict(details, id=uri)
+                    for uri, details in entry['volumes'].items()]
+
+    def refresh(self, project_name):
+        """Synchronizes the index of a project with CoprHD.
+
+        Lists the volume URIs of the project and fetches the details of
+        the unknown ones in bulk. Volumes no longer listed are dropped.
+        """
+        with self._lock:
+            refresh_lock = self._refresh_locks.setdefault(
+                project_name, threading.Lock())
+
+        with refresh_lock:
+            with self._lock:
+                entry = self._projects.get(project_name)
+                known = set(entry['volumes']) if entry else set()
+
+            uris = set(self.volume_obj.search_volumes(project_name))
+            volumes = self._fetch(uris - known)
+
+            with self._lock:
+                entry = self._projects.setdefault(
+                    project_name, {'names': {}, 'volumes': {}})
+                for uri in known - uris:
+                    self._remove(entry, uri)
+                for volume in volumes:
+                    self._add(entry, volume)
+
+    def refresh_all(self):
+        """Refreshes all the loaded projects; used by the background task."""
+        for project_name in list(self._projects):
+            try:
+                self.refresh(project_name)
+            except Exception as e:
+                LOG.warning("Refreshing the volume catalog of project"
+                            " %(project)s failed: %(err)s",
+                            {'project': project_name,
+                             'err': six.text_type(e)})
+
+    def start_refresh(self, interval):
+        """Starts refreshing the loaded projects every interval seconds."""
+        if interval > 0 and self._refresher is None:
+            self._refresher = loopingcall.FixedIntervalLoopingCall(
+                self.refresh_all)
+            self._refresher.start(interval=interval, initial_delay=interval)
+
+    def stop_refresh(self):
+        if self._refresher is not None:
+            self._refresher.stop()
+            self._refresher = None
+
+    def get_stats(self):
+        with self._lock:
+            volumes = sum(len(entry['volumes'])
+                          for entry in self._projects.values())
+            return {'projects': len(self._projects),
+                    'volumes': volumes,
+                    'hits': self.hits,
+                    'misses': self.misses}
+
+    def _lookup(self, project_name, volume_name):
+        with self._lock:
+            entry = self._projects.get(project_name)
+            if entry is None:
+                return None
+            return entry['names'].get(volume_name)
+
+    def _fetch(self, uris):
+        uris = list(uris)
+        volumes = []
+        for i in range(0, len(uris), self.BULK_SIZE):
+            volumes.extend(
+                self.volume_obj.show_bulk(uris[i:i + self.BULK_SIZE]))
+        return volumes
+
+    @staticmethod
+    def _add(entry, volume):
+        uri = volume['id']
+        VolumeCatalog._remove(entry, uri)
+        entry['names'].setdefault(volume['name'], uri)
+        entry['volumes'][uri] = {
+            'name': volume['name'],
+            'vpool': (volume.get('vpool') or {}).get('id'),
+            'varray': (volume.get('varray') or {}).get('id')}
+
+    @staticmethod
+    def _remove(entry, uri):
+        details = entry['volumes'].pop(uri, None)
+        if details and entry['names'].get(details['name']) == uri:
+            del entry['names'][details['name']]
@@ -44,23 +44,29 @@ class EMCCoprHDISCSIDriver(driver.ISCSIDriver):
             default_backend_name=self.__class__.__name__,
             configuration=self.configuration)
 
+    def do_setup(self, context):
+        self.common.do_setup()
+
     def check_for_setup_error(self):
         self.common.check_for_setup_error()
 
     def create_volume(self, volume):
         """Creates a Volume."""
         self.common.create_volume(volume, self)
-        self.common.set_volume_tags(volume, ['_obj_volume_type'])
+        vol_uri = self.common.set_volume_tags(volume, ['_obj_volume_type'])
+        return {'provider_location': vol_uri}
 
     def create_cloned_volume(self, volume, src_vref):
         """Creates a cloned Volume."""
         self.common.create_cloned_volume(volume, src_vref)
-        self.common.set_volume_tags(volume, ['_obj_volume_type'])
+        vol_uri = self.common.set_volume_tags(volume, ['_obj_volume_type'])
+        return {'provider_location': vol_uri}
 
     def create_volume_from_snapshot(self, volume, snapshot):
         """Creates a volume from a snapshot."""
         self.common.create_volume_from_snapshot(snapshot, volume)
-        self.common.set_volume_tags(volume, ['_obj_volume_type'])
+        vol_uri = self.common.set_volume_tags(volume, ['_obj_volume_type'])
+        return {'provider_location': vol_uri}
 
     def extend_volume(self, volume, new_size):
         """expands the size of the volume."""
@@ -72,7 +78,8 @@ class EMCCoprHDISCSIDriver(driver.ISCSIDriver):
 
     def create_snapshot(self, snapshot):
         """Creates a snapshot."""
-        self.common.create_snapshot(snapshot)
+        snapshot_uri = self.common.create_snapshot(snapshot)
+        return {'provider_location': snapshot_uri}
 
     def delete_snapshot(self, snapshot):
         """Deletes a snapshot."""
@@ -172,6 +179,8 @@ class EMCCoprHDISCSIDriver(driver.ISCSIDriver):
                 itls[0]['target']['ip_address'],
                 itls[0]['target']['tcp_port'])
             properties['target_lun'] = itls[0]['hlu']
+            # every target port of the export, for multipath
+            properties.update(self._build_multipath_properties(itls))
         auth = volume.provider_auth
         if auth:
             (auth_method, auth_username, auth_secret) = auth.split()
@@ -185,6 +194,20 @@ class EMCCoprHDISCSIDriver(driver.ISCSIDriver):
             'data': properties,
         }
 
+    def _build_multipath_properties(self, itls):
+        paths = []
+        for itl in itls:
+            path = (itl['target']['port'],
+                    '%s:%s' % (itl['target']['ip_address'],
+                               itl['target']['tcp_port']),
+                    itl['hlu'])
+            if path not in paths:
+                paths.append(path)
+
+        return {'target_iqns': [path[0] for path in paths],
+                'target_portals': [path[1] for path in paths],
+                'target_luns': [path[2] for path in paths]}
+
     def terminate_connection(self, volume, connector, **kwargs):
         """Disallow connection from connector."""
 
@@ -208,7 +231,11 @@ class EMCCoprHDISCSIDriver(driver.ISCSIDriver):
     def update_volume_stats(self):
         """Retrieve stats info from virtual pool/virtual array."""
         LOG.debug("Updating volume stats")
-        self._stats = self.common.update_volume_stats()
+        self._stats = self.common.get_volume_stats()
+
+    def update_provider_info(self, volumes, snapshots):
+        """Records the CoprHD URI of existing volumes and snapshots."""
+        return self.common.update_provider_info(volumes, snapshots)
 
     def retype(self, ctxt, volume, new_type, diff, host):
         """Change the volume type."""
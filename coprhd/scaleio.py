@@ -76,6 +76,9 @@ class EMCCoprHDScaleIODriver(driver.VolumeDriver):
             default_backend_name=self.__class__.__name__,
             configuration=self.configuration)
 
+    def do_setup(self, context):
+        self.common.do_setup()
+
     def check_for_setup_error(self):
         self.common.check_for_setup_error()
         if (self.configuration.scaleio_verify_server_certificate is True and
@@ -88,9 +91,10 @@ class EMCCoprHDScaleIODriver(driver.VolumeDriver):
     def create_volume(self, volume):
         """Creates a Volume."""
         self.common.create_volume(volume, self, True)
-        self.common.set_volume_tags(volume, ['_obj_volume_type'], True)
+        vol_uri = self.common.set_volume_tags(volume, ['_obj_volume_type'],
+                                              True)
         vol_size = self._update_volume_size(int(volume.size))
-        return {'size': vol_size}
+        return {'size': vol_size, 'provider_location': vol_uri}
 
     def _update_volume_size(self, vol_size):
         """update the openstack volume size."""
@@ -103,12 +107,16 @@ class EMCCoprHDScaleIODriver(driver.VolumeDriver):
     def create_cloned_volume(self, volume, src_vref):
         """Creates a cloned Volume."""
         self.common.create_cloned_volume(volume, src_vref, True)
-        self.common.set_volume_tags(volume, ['_obj_volume_type'], True)
+        vol_uri = self.common.set_volume_tags(volume, ['_obj_volume_type'],
+                                              True)
+        return {'provider_location': vol_uri}
 
     def create_volume_from_snapshot(self, volume, snapshot):
         """Creates a volume from a snapshot."""
         self.common.create_volume_from_snapshot(snapshot, volume, True)
-        self.common.set_volume_tags(volume, ['_obj_volume_type'], True)
+        vol_uri = self.common.set_volume_tags(volume, ['_obj_volume_type'],
+                                              True)
+        return {'provider_location': vol_uri}
 
     def extend_volume(self, volume, new_size):
         """expands the size of the volume."""
@@ -120,7 +128,8 @@ class EMCCoprHDScaleIODriver(driver.VolumeDriver):
 
     def create_snapshot(self, snapshot):
         """Creates a snapshot."""
-        self.common.create_snapshot(snapshot, True)
+        snapshot_uri = self.common.create_snapshot(snapshot, True)
+        return {'provider_location': snapshot_uri}
 
     def delete_snapshot(self, snapshot):
         """Deletes a snapshot."""
@@ -296,7 +305,7 @@ class EMCCoprHDScaleIODriver(driver.VolumeDriver):
     def update_volume_stats(self):
         """Retrieve stats info from virtual pool/virtual array."""
         LOG.debug("Updating volume stats")
-        self._stats = self.common.update_volume_stats()
+        self._stats = self.common.get_volume_stats()
 
     def _get_client_id(self, server_ip, server_port, server_username,
                        server_password, sdc_ip):
@@ -365,6 +374,10 @@ class EMCCoprHDScaleIODriver(driver.VolumeDriver):
             return res
         return response
 
+    def update_provider_info(self, volumes, snapshots):
+        """Records the CoprHD URI of existing volumes and snapshots."""
+        return self.common.update_provider_info(volumes, snapshots)
+
     def retype(self, ctxt, volume, new_type, diff, host):
         """Change the volume type."""
         return self.common.retype(ctxt, volume, new_type, diff, host)
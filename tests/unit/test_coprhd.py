@@ -13,6 +13,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import json
+import os
+import stat
+
+import eventlet
+import fixtures
 import mock
 
 from cinder import context
@@ -20,6 +26,13 @@ from cinder.objects import fields
 from cinder import test
 from cinder.volume.drivers.coprhd import common as coprhd_common
 from cinder.volume.drivers.coprhd import fc as coprhd_fc
+from cinder.volume.drivers.coprhd.helpers import (
+    authentication as coprhd_auth)
+from cinder.volume.drivers.coprhd.helpers import (
+    commoncoprhdapi as coprhd_utils)
+from cinder.volume.drivers.coprhd.helpers import exportgroup as coprhd_eg
+from cinder.volume.drivers.coprhd.helpers import host as coprhd_host
+from cinder.volume.drivers.coprhd.helpers import volume as coprhd_vol
 from cinder.volume.drivers.coprhd import iscsi as coprhd_iscsi
 from cinder.volume.drivers.coprhd import scaleio as coprhd_scaleio
 from cinder.volume import volume_types
@@ -305,8 +318,13 @@ class MockedEMCCoprHDDriverCommon(coprhd_common.EMCCoprHDDriverCommon):
     def authenticate_user(self):
         pass
 
-    def get_exports_count_by_initiators(self, initiator_ports):
-        return 0
+    def _get_vpair_capacity(self, vpair):
+        return {'free_gb': '100', 'used_gb': '50'}
+
+    def _fetch_exports_by_initiators(self, initiator_ports):
+        # the test volume is the only one exported to the initiators
+        itls = self.volume_obj.get_exports_by_uri("coprhd_vol_uri")['itl']
+        return [dict(itl, device={'id': "coprhd_vol_uri"}) for itl in itls]
 
     def _get_coprhd_volume_name(self, vol, verbose=False):
         if verbose is True:
@@ -336,6 +354,15 @@ class MockedEMCCoprHDDriverCommon(coprhd_common.EMCCoprHDDriverCommon):
             'volume_type_id': "vol_type_id-for-snap"}
 
     def init_coprhd_api_components(self):
+        self.transport = Mock()
+        self.transport.get_stats.return_value = {}
+        self.transport.task_stats.get_stats.return_value = {}
+        self.transport.token_manager.get_stats.return_value = {}
+        self.transport.fan_out = coprhd_utils.FanOut()
+        self.transport.volume_catalog = None
+        self.resource_cache = coprhd_utils.ExpiringLRUCache()
+        self.tag_schemes = {}
+
         self.volume_obj = Mock()
         self.volume_obj.create.return_value = "volume_created"
         self.volume_obj.volume_query.return_value = "volume_uri"
@@ -385,12 +412,29 @@ class MockedEMCCoprHDDriverCommon(coprhd_common.EMCCoprHDDriverCommon):
             {'name': "12:34:56:78:90:12:34:56"},
             {'name': "12:34:56:78:90:54:32:11"},
             {'name': "bfdf432500000004"}]
+        self.initiator_index = Mock()
+        self.initiator_index.find.return_value = "host1"
+        self.initiator_index.get_stats.return_value = {}
+        self.exportgroup_index = Mock()
+        self.exportgroup_index.find.return_value = "exportgroup_uri"
+        self.exportgroup_index.get_stats.return_value = {}
+        self.attach_poll_schedule = coprhd_utils.PollSchedule(0.2, 2.0, 2.0)
+        self.attach_poll_timeout = 100
+        self.itl_cache = coprhd_utils.ITLCache()
+        self.stats_refresher = None
+        self.exportgroup_flight = coprhd_utils.SingleFlight()
+        self.attach_batcher = None
+        self.detach_batcher = None
 
         self.hostinitiator_obj = Mock()
         self.varray_obj = Mock()
         self.varray_obj.varray_show.return_value = varray_detail_data
+        self.vpool_obj = Mock()
+        self.vpool_obj.vpool_query.return_value = "vpool_uri"
 
         self.snapshot_obj = Mock()
+        self.snapshot_obj.snapshot_create.return_value = {
+            'resource': {'id': "snapshot_uri"}}
         mocked_snap_obj = self.snapshot_obj.return_value
         mocked_snap_obj.storageResource_query.return_value = (
             "resourceUri")
@@ -465,10 +509,32 @@ class EMCCoprHDISCSIDriverTest(test.TestCase):
         self.driver.create_volume(volume)
         self.driver.delete_volume(volume)
 
+    def test_create_volume_records_coprhd_uri(self):
+        volume = test_volume_data(self.volume_type_id)
+
+        model_update = self.driver.create_volume(volume)
+        self.assertEqual({'provider_location': 'volume_uri'}, model_update)
+
+    def test_update_provider_info(self):
+        volume = Mock(id='1', provider_location=None)
+
+        self.driver.update_provider_info([volume], [])
+        self.assertEqual('coprhd_vol_uri', volume.provider_location)
+        volume.save.assert_called_once_with()
+
     def test_get_volume_stats(self):
         vol_stats = self.driver.get_volume_stats(True)
         self.assertTrue(vol_stats['free_capacity_gb'], 'unknown')
 
+    def test_get_volume_stats_of_volume_type_vpools(self):
+        vol_stats = self.driver.get_volume_stats(True)
+
+        self.assertEqual(100.0, vol_stats['free_capacity_gb'])
+        self.assertEqual(150.0, vol_stats['total_capacity_gb'])
+        self.driver.common.vpool_obj.vpool_query.assert_called_once_with(
+            'vpool_coprhd', 'block')
+        self.assertFalse(self.driver.common.volume_obj.list_volumes.called)
+
     def test_create_volume_clone(self):
         src_volume_data = test_volume_data(self.volume_type_id)
         clone_volume_data = test_clone_volume_data(self.volume_type_id)
@@ -502,6 +568,27 @@ class EMCCoprHDISCSIDriverTest(test.TestCase):
         self.driver.delete_volume(src_vol_data)
         self.driver.delete_volume(volume_data)
 
+    def test_snapshot_uri_is_not_looked_up(self):
+        snapshot_uri = 'urn:storageos:BlockSnapshot:1111:vdc1'
+        snapshot_data = test_snapshot_data(
+            source_test_volume_data(self.volume_type_id))
+        snapshot_data.provider_location = snapshot_uri
+
+        self.driver.create_volume_from_snapshot(
+            test_volume_data(self.volume_type_id), snapshot_data)
+        self.driver.delete_snapshot(snapshot_data)
+
+        volume_obj = self.driver.common.volume_obj
+        volume_obj.clone.assert_called_once_with(mock.ANY, snapshot_uri,
+                                                 sync=True,
+                                                 project_name=mock.ANY)
+        self.assertFalse(volume_obj.storage_resource_query.called)
+        snapshot_obj = self.driver.common.snapshot_obj
+        snapshot_obj.snapshot_delete_uri.assert_called_once_with(
+            'block', mock.ANY, snapshot_uri, True)
+        self.assertFalse(snapshot_obj.snapshot_query.called)
+        self.assertFalse(snapshot_obj.snapshot_list_uri.called)
+
     def test_extend_volume(self):
         volume_data = test_volume_data(self.volume_type_id)
         self.driver.create_volume(volume_data)
@@ -520,6 +607,11 @@ class EMCCoprHDISCSIDriverTest(test.TestCase):
                                         'target_portal': '10.10.10.10:22',
                                         'target_iqn':
                                         '50:00:09:73:00:18:95:19',
+                                        'target_luns': [3],
+                                        'target_portals':
+                                        ['10.10.10.10:22'],
+                                        'target_iqns':
+                                        ['50:00:09:73:00:18:95:19'],
                                         'target_discovered': False,
                                         'volume_id': '1'}}
         self.assertEqual(
@@ -528,6 +620,19 @@ class EMCCoprHDISCSIDriverTest(test.TestCase):
         self.driver.terminate_connection(volume_data, connector_data)
         self.driver.delete_volume(volume_data)
 
+    def test_multipath_properties(self):
+        itls = [{'hlu': 3, 'target': {'port': 'iqn1', 'tcp_port': '3260',
+                                      'ip_address': '10.10.10.1'}},
+                {'hlu': 3, 'target': {'port': 'iqn2', 'tcp_port': '3260',
+                                      'ip_address': '10.10.10.2'}},
+                {'hlu': 3, 'target': {'port': 'iqn1', 'tcp_port': '3260',
+                                      'ip_address': '10.10.10.1'}}]
+        self.assertEqual(
+            {'target_iqns': ['iqn1', 'iqn2'],
+             'target_portals': ['10.10.10.1:3260', '10.10.10.2:3260'],
+             'target_luns': [3, 3]},
+            self.driver._build_multipath_properties(itls))
+
     @mock.patch('cinder.volume.utils.is_group_a_cg_snapshot_type')
     def test_create_delete_empty_group(self, cg_ss_enabled):
         cg_ss_enabled.side_effect = [True, True]
@@ -594,6 +699,7 @@ class EMCCoprHDFCDriverTest(test.TestCase):
         self.configuration.coprhd_hostname = "10.10.10.10"
         self.configuration.coprhd_port = "4443"
         self.configuration.volume_backend_name = "EMCCoprHDFCDriver"
+        self.configuration.coprhd_fc_full_mesh_zoning = False
         self.configuration.coprhd_username = "user-name"
         self.configuration.coprhd_password = "password"
         self.configuration.coprhd_tenant = "tenant"
@@ -697,14 +803,9 @@ class EMCCoprHDFCDriverTest(test.TestCase):
         expected_initialize = {'driver_volume_type': 'fibre_channel',
                                'data': {'target_lun': 3,
                                         'initiator_target_map':
-                                        {'1234567890543211':
-                                         ['1234567890123456',
-                                          '1234567890123456'],
-                                         '1234567890123456':
-                                         ['1234567890123456',
-                                          '1234567890123456']},
-                                        'target_wwn': ['1234567890123456',
-                                                       '1234567890123456'],
+                                        {'1234567890123456':
+                                         ['1234567890123456']},
+                                        'target_wwn': ['1234567890123456'],
                                         'target_discovered': False,
                                         'volume_id': '1'}}
         self.assertEqual(
@@ -714,19 +815,40 @@ class EMCCoprHDFCDriverTest(test.TestCase):
             volume_data, connector_data)
         expected_terminate = {'driver_volume_type': 'fibre_channel',
                               'data': {'initiator_target_map':
-                                       {'1234567890543211':
-                                        ['1234567890123456',
-                                         '1234567890123456'],
-                                        '1234567890123456':
-                                        ['1234567890123456',
-                                         '1234567890123456']},
-                                       'target_wwn': ['1234567890123456',
-                                                      '1234567890123456']}}
+                                       {'1234567890123456':
+                                        ['1234567890123456']},
+                                       'target_wwn': ['1234567890123456']}}
         self.assertEqual(
             expected_terminate, res_terminate, 'Unexpected return data')
 
         self.driver.delete_volume(volume_data)
 
+    def test_full_mesh_initiator_target_map(self):
+        self.configuration.coprhd_fc_full_mesh_zoning = True
+        target_wwns, initiator_target_map = (
+            self.driver._build_initiator_target_map(
+                fcitl_itl_list['itl'], get_connector_data()))
+
+        self.assertEqual(['1234567890123456', '1234567890123456'],
+                         target_wwns)
+        self.assertEqual({'1234567890543211': target_wwns,
+                          '1234567890123456': target_wwns},
+                         initiator_target_map)
+
+    def test_terminate_connection_keeps_zones_of_other_volumes(self):
+        itls = self.driver.common._fetch_exports_by_initiators([])
+        itls.append(dict(itls[0], device={'id': "other_vol_uri"}))
+        self.mock_object(self.driver.common, '_fetch_exports_by_initiators',
+                         return_value=itls)
+
+        res_terminate = self.driver.terminate_connection(
+            test_volume_data(self.volume_type_id), get_connector_data())
+        self.assertEqual({'driver_volume_type': 'fibre_channel', 'data': {}},
+                         res_terminate)
+        exportgroup_obj = self.driver.common.exportgroup_obj
+        self.assertEqual(
+            1, exportgroup_obj.exportgroup_remove_volumes_by_uri.call_count)
+
     @mock.patch('cinder.volume.utils.is_group_a_cg_snapshot_type')
     def test_create_delete_empty_group(self, cg_ss_enabled):
         cg_ss_enabled.side_effect = [True, True]
@@ -979,3 +1101,969 @@ class EMCCoprHDScaleIODriverTest(test.TestCase):
             self.driver.delete_group_snapshot(ctx, group_snap_data, []))
         self.assertEqual({}, model_update, 'Unexpected return data')
         self.assertEqual([], snapshots_model_update, 'Unexpected return data')
+
+
+class CoprHDTransportTest(test.TestCase):
+
+    def setUp(self):
+        super(CoprHDTransportTest, self).setUp()
+        self.transport = coprhd_utils.CoprHDTransport(
+            "10.10.10.10", 4443, pool_size=4, connect_timeout=5,
+            read_timeout=30)
+        self.mock_object(self.transport.session, 'request')
+
+    def test_request_uses_pooled_session(self):
+        self.transport.request("GET", self.transport.get_url("/tenant"))
+        self.transport.session.request.assert_called_once_with(
+            "GET", "https://10.10.10.10:4443/tenant", verify=False,
+            timeout=(5, 30))
+        self.assertEqual(1, self.transport.get_stats()['requests'])
+
+    def test_request_without_keepalive(self):
+        self.transport.keepalive = False
+        self.transport.request("GET", "https://10.10.10.10:4443/tenant",
+                               headers={'ACCEPT': 'application/json'})
+        headers = self.transport.session.request.call_args[1]['headers']
+        self.assertEqual('close', headers['Connection'])
+
+    def _get(self, token):
+        return self.transport.request(
+            "GET", "https://10.10.10.10:4443/tenant",
+            headers={'X-SDS-AUTH-TOKEN': token})
+
+    def _slow_request(self, *args, **kwargs):
+        eventlet.sleep(0.01)
+        return Mock(status_code=200, text='{}')
+
+    def test_identical_gets_are_coalesced(self):
+        self.transport.session.request.side_effect = self._slow_request
+        waiters = [eventlet.spawn(self._get, 'token') for x in range(3)]
+        responses = [waiter.wait() for waiter in waiters]
+
+        self.assertEqual(1, self.transport.session.request.call_count)
+        self.assertIs(responses[0], responses[2])
+        self.assertEqual(2, self.transport.get_stats()['gets_coalesced'])
+
+    def test_read_after_write_is_not_coalesced(self):
+        self.transport.session.request.side_effect = self._slow_request
+        waiters = [eventlet.spawn(self.transport.request, "GET",
+                                  "https://10.10.10.10:4443/tenant",
+                                  coalesce=False,
+                                  headers={'X-SDS-AUTH-TOKEN': 'token'})
+                   for x in range(2)]
+        for waiter in waiters:
+            waiter.wait()
+
+        self.assertEqual(2, self.transport.session.request.call_count)
+
+    def test_gets_of_other_tokens_are_sent(self):
+        self.transport.session.request.side_effect = self._slow_request
+        waiters = [eventlet.spawn(self._get, token)
+                   for token in ('token1', 'token2')]
+        for waiter in waiters:
+            waiter.wait()
+
+        self.assertEqual(2, self.transport.session.request.call_count)
+        self.assertEqual(0, self.transport.get_stats()['gets_coalesced'])
+
+    def test_resolve_once_until_invalidated(self):
+        resolver = Mock(return_value='project_uri')
+        self.assertEqual('project_uri', self.transport.resolve(
+            'project', 'tenant/project', resolver))
+        self.assertEqual('project_uri', self.transport.resolve(
+            'project', 'tenant/project', resolver))
+        resolver.assert_called_once_with('tenant/project')
+
+        self.transport.invalidate_resolved()
+        self.transport.resolve('project', 'tenant/project', resolver)
+        self.assertEqual(2, resolver.call_count)
+
+    def _not_found(self, uri, **kwargs):
+        self.transport.session.request.return_value = Mock(
+            status_code=404, reason='Not Found')
+        self.assertRaises(coprhd_utils.CoprHdError,
+                          coprhd_utils.service_json_request,
+                          "10.10.10.10", 4443, "GET", uri, None,
+                          transport=self.transport, **kwargs)
+
+    def test_not_found_invalidates_resolved(self):
+        resolver = Mock(side_effect=lambda name: name + '_uri')
+        self.transport.resolve('project', 'project', resolver)
+        self.transport.resolve('tenant', 'tenant', resolver)
+
+        self._not_found("/projects/project_uri")
+        self.transport.resolve('project', 'project', resolver)
+        self.transport.resolve('tenant', 'tenant', resolver)
+        self.assertEqual(3, resolver.call_count)
+
+    def test_not_found_of_other_resource_keeps_resolved(self):
+        resolver = Mock(return_value='project_uri')
+        self.transport.resolve('project', 'tenant/project', resolver)
+
+        self._not_found("/block/volumes/volume_uri")
+        self._not_found("/projects/project_uri/acl")
+        self.transport.resolve('project', 'tenant/project', resolver)
+        resolver.assert_called_once_with('tenant/project')
+
+        self._not_found("/tenants/tenant_uri/projects",
+                        invalidate_resolved=True)
+        self.transport.resolve('project', 'tenant/project', resolver)
+        self.assertEqual(2, resolver.call_count)
+
+    def test_concurrent_resolve(self):
+        def resolver(name):
+            eventlet.sleep(0.01)
+            return 'project_uri'
+
+        resolver = Mock(side_effect=resolver)
+        waiters = [eventlet.spawn(self.transport.resolve, 'project',
+                                  'tenant/project', resolver)
+                   for x in range(3)]
+
+        self.assertEqual(['project_uri'] * 3,
+                         [waiter.wait() for waiter in waiters])
+        resolver.assert_called_once_with('tenant/project')
+
+    def test_resources_share_endpoint_transport(self):
+        tag_obj = coprhd_utils.CoprHDResource("10.10.10.20", 4443)
+        other_obj = coprhd_utils.CoprHDResource("10.10.10.20", 4443)
+        self.assertIs(tag_obj.transport, other_obj.transport)
+
+
+class JsonDecodeTest(test.TestCase):
+
+    def test_decode_native_strings(self):
+        o = coprhd_utils.json_decode(
+            '{"itl": [{"hlu": 3, "device": {"wwn": "1234567890123456"}}]}')
+        itl = o['itl'][0]
+        self.assertEqual(3, itl['hlu'])
+        self.assertEqual('1234567890123456', itl['device']['wwn'])
+        self.assertIsInstance(itl['device']['wwn'], str)
+
+    def test_decode_invalid_payload(self):
+        self.assertRaises(coprhd_utils.CoprHdError,
+                          coprhd_utils.json_decode, '<html>')
+
+
+class VolumeCatalogTest(test.TestCase):
+
+    def setUp(self):
+        super(VolumeCatalogTest, self).setUp()
+        self.volume_obj = Mock()
+        self.volume_obj.search_volumes.return_value = ['uri1', 'uri2']
+        self.volume_obj.show_bulk.return_value = [
+            {'id': 'uri1', 'name': 'vol1', 'vpool': {'id': 'vpool_uri'}},
+            {'id': 'uri2', 'name': 'vol2', 'vpool': {'id': 'vpool_uri'}}]
+        self.catalog = coprhd_vol.VolumeCatalog(self.volume_obj)
+
+    def test_find_loads_project_in_bulk(self):
+        self.assertEqual('uri2', self.catalog.find('tenant/project', 'vol2'))
+        self.assertEqual('uri1', self.catalog.find('tenant/project', 'vol1'))
+        self.volume_obj.show_bulk.assert_called_once_with(['uri1', 'uri2'])
+        self.assertFalse(self.volume_obj.show_by_uri.called)
+        stats = self.catalog.get_stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+
+    def test_refresh_fetches_only_new_volumes(self):
+        self.catalog.refresh('tenant/project')
+        self.volume_obj.search_volumes.return_value = ['uri2', 'uri3']
+        self.volume_obj.show_bulk.return_value = [
+            {'id': 'uri3', 'name': 'vol3'}]
+        self.assertEqual('uri3', self.catalog.find('tenant/project', 'vol3'))
+        self.volume_obj.show_bulk.assert_called_with(['uri3'])
+        self.assertIsNone(self.catalog.find('tenant/project', 'vol1'))
+
+    def test_add_and_discard(self):
+        self.catalog.refresh('tenant/project')
+        self.catalog.add('tenant/project', {'id': 'uri4', 'name': 'vol4'})
+        self.catalog.discard('uri1')
+        self.volume_obj.search_volumes.reset_mock()
+        self.assertEqual('uri4', self.catalog.find('tenant/project', 'vol4'))
+        self.assertFalse(self.volume_obj.search_volumes.called)
+        self.assertEqual(2, self.catalog.get_stats()['volumes'])
+
+    def test_show_of_deleted_volume(self):
+        self.catalog.refresh('tenant/project')
+        transport = coprhd_utils.CoprHDTransport("10.10.10.10", 4443)
+        transport.volume_catalog = self.catalog
+        volume = coprhd_vol.Volume("10.10.10.10", 4443, transport)
+        self.mock_object(volume, 'show_by_uri', side_effect=(
+            coprhd_utils.CoprHdError(coprhd_utils.CoprHdError.HTTP_ERR,
+                                     'HTTP code: 404', 404)))
+
+        exc = self.assertRaises(coprhd_utils.CoprHdError, volume.show,
+                                'tenant/project', 'vol1')
+        self.assertEqual(coprhd_utils.CoprHdError.NOT_FOUND_ERR, exc.err_code)
+        self.assertEqual(1, self.catalog.get_stats()['volumes'])
+
+    def test_clone_is_added(self):
+        self.catalog.refresh('tenant/project')
+        transport = coprhd_utils.CoprHDTransport("10.10.10.10", 4443)
+        transport.volume_catalog = self.catalog
+        volume = coprhd_vol.Volume("10.10.10.10", 4443, transport)
+        self.mock_object(coprhd_utils, 'service_json_request',
+                         return_value=(json.dumps(
+                             {'task': [{'id': 'task_uri',
+                                        'resource': {'id': 'uri5'}}]}),
+                             None))
+
+        volume.clone('vol5', 'urn:storageos:Volume:1', False,
+                     project_name='tenant/project')
+        self.volume_obj.search_volumes.reset_mock()
+        self.assertEqual('uri5', self.catalog.find('tenant/project', 'vol5'))
+        self.assertFalse(self.volume_obj.search_volumes.called)
+
+
+class ExpiringLRUCacheTest(test.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = coprhd_utils.ExpiringLRUCache(maxsize=2, ttl=60)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual({'size': 2, 'hits': 3, 'misses': 1},
+                         cache.get_stats())
+
+    def test_entries_expire(self):
+        cache = coprhd_utils.ExpiringLRUCache(maxsize=2, ttl=60)
+        cache.put('a', 1)
+        cache.put('b', 2, ttl=0)
+        self.assertEqual(1, cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        cache.invalidate('a')
+        self.assertIsNone(cache.get('a'))
+
+
+class TaggedResourceLookupTest(test.TestCase):
+
+    def setUp(self):
+        super(TaggedResourceLookupTest, self).setUp()
+        configuration = Mock()
+        configuration.coprhd_resource_cache_negative_ttl = 30
+        self.common = MockedEMCCoprHDDriverCommon(
+            protocol="iSCSI", default_backend_name="EMCViPRISCSIDriver",
+            configuration=configuration)
+        self.search = self.mock_object(
+            coprhd_utils, 'search_by_tag',
+            side_effect=lambda uri, *args, **kwargs: (
+                ['volume_uri'] if ':obj_id:' in uri else []))
+        self.get_name = Mock(return_value='volume_name')
+
+    def _find(self, resource_id):
+        return self.common._find_tagged_resource(
+            'volume', '/block/volumes/search?tag={0}', resource_id,
+            self.get_name)
+
+    def test_lookup_is_cached(self):
+        self.assertEqual(('volume_uri', 'volume_name'), self._find('1'))
+        self.assertEqual(('volume_uri', 'volume_name'), self._find('1'))
+        self.assertEqual(2, self.search.call_count)
+        self.get_name.assert_called_once_with('volume_uri')
+
+    def test_tag_scheme_is_learned(self):
+        self._find('1')
+        self.search.reset_mock()
+        self._find('2')
+        self.assertEqual(1, self.search.call_count)
+
+    def test_known_uri_skips_tag_search(self):
+        self.assertEqual(
+            ('urn:storageos:Volume:1', 'volume_name'),
+            self.common._find_tagged_resource(
+                'volume', '/block/volumes/search?tag={0}', '1',
+                self.get_name, 'urn:storageos:Volume:1'))
+        self.assertFalse(self.search.called)
+
+    def test_name_is_fetched_when_needed(self):
+        self.assertEqual(
+            ('urn:storageos:Volume:1', None),
+            self.common._find_tagged_resource(
+                'volume', '/block/volumes/search?tag={0}', '1',
+                self.get_name, 'urn:storageos:Volume:1', need_name=False))
+        self.assertFalse(self.get_name.called)
+        for i in range(2):
+            self.assertEqual(('urn:storageos:Volume:1', 'volume_name'),
+                             self._find('1'))
+        self.assertFalse(self.search.called)
+        self.get_name.assert_called_once_with('urn:storageos:Volume:1')
+
+    def test_miss_is_cached(self):
+        self.search.side_effect = None
+        self.search.return_value = []
+        self.assertEqual((None, None), self._find('1'))
+        self.assertEqual((None, None), self._find('1'))
+        self.assertEqual(2, self.search.call_count)
+
+
+class BlockUntilCompleteTest(test.TestCase):
+
+    def setUp(self):
+        super(BlockUntilCompleteTest, self).setUp()
+        self.transport = coprhd_utils.CoprHDTransport("10.10.10.10", 4443)
+        self.sleep = self.mock_object(coprhd_utils.eventlet, 'sleep')
+        self.show_task = self.mock_object(coprhd_utils, 'show_task_opid')
+
+    def test_polls_with_backoff(self):
+        self.transport.poll_schedules['block'] = coprhd_utils.PollSchedule(
+            1.0, 2.0, 3.0, jitter=0)
+        self.show_task.side_effect = [
+            {'state': 'pending'}, {'state': 'pending'},
+            {'state': 'pending'}, {'state': 'ready'}]
+
+        coprhd_utils.block_until_complete(
+            'block', None, 'task_id', "10.10.10.10", 4443,
+            transport=self.transport)
+
+        self.assertEqual([1.0, 2.0, 3.0],
+                         [c[0][0] for c in self.sleep.call_args_list])
+        stats = self.transport.task_stats.get_stats()['block']
+        self.assertEqual(1, stats['tasks'])
+        self.assertEqual(4, stats['polls'])
+
+    def test_task_error(self):
+        self.show_task.return_value = {
+            'state': 'error', 'service_error': {'details': 'failed'}}
+
+        self.assertRaises(coprhd_utils.CoprHdError,
+                          coprhd_utils.block_until_complete,
+                          'block', None, 'task_id', "10.10.10.10", 4443,
+                          transport=self.transport)
+        self.assertFalse(self.sleep.called)
+        self.assertEqual(
+            1, self.transport.task_stats.get_stats()['block']['errors'])
+
+
+class TaskTrackerTest(test.TestCase):
+
+    def setUp(self):
+        super(TaskTrackerTest, self).setUp()
+        self.transport = coprhd_utils.CoprHDTransport("10.10.10.10", 4443)
+        self.transport.task_tracker = coprhd_utils.TaskTracker(
+            self.transport, {'volume': coprhd_utils.PollSchedule(0, 1, 0)})
+        self.request = self.mock_object(coprhd_utils,
+                                        'service_json_request')
+
+    def _tasks(self, *states):
+        return (json.dumps({'task': [{'id': 'task%d' % i, 'state': state}
+                                     for i, state in enumerate(states)]}),
+                None)
+
+    def test_tasks_are_polled_in_bulk(self):
+        self.request.side_effect = [self._tasks('pending', 'pending'),
+                                    self._tasks('ready', 'ready')]
+        waiters = [eventlet.spawn(coprhd_utils.block_until_complete,
+                                  'volume', 'volume_uri', task_id,
+                                  "10.10.10.10", 4443,
+                                  transport=self.transport)
+                   for task_id in ('task0', 'task1')]
+        for waiter in waiters:
+            waiter.wait()
+
+        self.assertEqual(2, self.request.call_count)
+        self.assertEqual('/vdc/tasks/bulk', self.request.call_args[0][3])
+        self.assertEqual(
+            2, self.transport.task_stats.get_stats()['volume']['tasks'])
+
+    def _http_error(self, status_code):
+        return coprhd_utils.CoprHdError(coprhd_utils.CoprHdError.HTTP_ERR,
+                                        'HTTP code: %d' % status_code,
+                                        status_code)
+
+    def test_bulk_polling_survives_errors(self):
+        self.request.side_effect = [self._http_error(503),
+                                    self._tasks('ready')]
+        coprhd_utils.block_until_complete('volume', 'volume_uri', 'task0',
+                                          "10.10.10.10", 4443,
+                                          transport=self.transport)
+
+        self.assertTrue(self.transport.task_tracker.bulk_supported)
+        self.assertEqual('/vdc/tasks/bulk', self.request.call_args[0][3])
+
+    def test_tasks_are_polled_one_by_one(self):
+        def request(ipaddr, port, method, uri, body, transport=None):
+            if uri == '/vdc/tasks/bulk':
+                raise self._http_error(405)
+            if uri == '/vdc/tasks/task0':
+                raise self._http_error(500)
+            return (json.dumps({'id': 'task1', 'state': 'ready'}), None)
+
+        self.request.side_effect = request
+        tracker = self.transport.task_tracker
+        tracker._pending = {'task0': eventlet.event.Event(),
+                            'task1': eventlet.event.Event()}
+        tracker._poll(['task0', 'task1'])
+
+        self.assertFalse(tracker.bulk_supported)
+        self.assertEqual(['task0'], list(tracker._pending))
+
+    def test_tasks_follow_their_schedules(self):
+        tracker = self.transport.task_tracker
+        tracker.schedules = {
+            'volume': coprhd_utils.PollSchedule(0.01, 1, 0.01, jitter=0),
+            'export': coprhd_utils.PollSchedule(0.1, 1, 0.1, jitter=0)}
+        polled = []
+
+        def request(ipaddr, port, method, uri, body, transport=None):
+            task_ids = json.loads(body)['id']
+            polled.append(task_ids)
+            return (json.dumps({'task': [{'id': task_id, 'state': 'ready'}
+                                         for task_id in task_ids
+                                         if task_id != 'task0' or
+                                         len(polled) > 1]}), None)
+
+        self.request.side_effect = request
+        export = eventlet.spawn(tracker.wait, 'task1', 1, 'export')
+        eventlet.sleep(0)
+        # the volume task is polled after its own delay, and adding it
+        # does not restart the schedule of the pending export task
+        self.assertEqual('ready', tracker.wait('task0', 1)['state'])
+        self.assertEqual('ready', export.wait()['state'])
+        self.assertEqual([['task0'], ['task0'], ['task1']], polled)
+
+    def test_task_error(self):
+        self.request.return_value = self._tasks('error')
+        self.assertRaises(coprhd_utils.CoprHdError,
+                          coprhd_utils.block_until_complete,
+                          'volume', 'volume_uri', 'task0', "10.10.10.10",
+                          4443, transport=self.transport)
+
+
+class InitiatorIndexTest(test.TestCase):
+
+    def setUp(self):
+        super(InitiatorIndexTest, self).setUp()
+        self.host_obj = Mock()
+        self.host_obj.list_all.return_value = [
+            {'id': 'host1_id', 'name': 'host1'},
+            {'id': 'host2_id', 'name': 'host2'}]
+        self.host_obj.list_initiator_uris.return_value = ['ini1', 'ini2']
+        self.host_obj.show_initiators_bulk.return_value = [
+            {'id': 'ini1', 'initiator_port': '10:00:00:00:00:00:00:01',
+             'host': {'id': 'host1_id'}},
+            {'id': 'ini2', 'initiator_port': '10:00:00:00:00:00:00:02',
+             'host': {'id': 'other_tenant_host_id'}}]
+        self.index = coprhd_host.InitiatorIndex(self.host_obj, 'tenant')
+
+    def test_find_from_bulk_index(self):
+        self.assertEqual('host1',
+                         self.index.find('10:00:00:00:00:00:00:01'))
+        self.assertEqual('host1',
+                         self.index.find('10:00:00:00:00:00:00:01'))
+        self.host_obj.show_initiators_bulk.assert_called_once_with(
+            ['ini1', 'ini2'])
+        self.assertFalse(self.host_obj.list_initiators.called)
+        self.assertFalse(self.host_obj.search_initiators.called)
+
+    def test_miss_searches_port(self):
+        initiators = {
+            '10:00:00:00:00:00:00:02': {'host': {'id': 'other_host_id'}},
+            '10:00:00:00:00:00:00:03': {'host': {'id': 'host2_id'}}}
+        self.host_obj.search_initiators.side_effect = (
+            lambda port: [initiators[port]])
+        self.assertEqual('host2',
+                         self.index.find('10:00:00:00:00:00:00:03'))
+        self.assertIsNone(self.index.find('10:00:00:00:00:00:00:02'))
+        self.assertEqual({'ports': 2, 'hits': 0, 'misses': 2},
+                         self.index.get_stats())
+
+    def test_concurrent_reload(self):
+        self.index.load()
+        initiators = self.host_obj.show_initiators_bulk.return_value
+
+        def show_bulk(uris):
+            # the index is used while the reload waits for CoprHD
+            self.assertEqual('host1', self.index._ports.get(
+                '10:00:00:00:00:00:00:01'))
+            eventlet.sleep(0.01)
+            return initiators
+
+        self.host_obj.show_initiators_bulk.side_effect = show_bulk
+        self.index.invalidate()
+        finders = [eventlet.spawn(self.index.find,
+                                  '10:00:00:00:00:00:00:01')
+                   for x in range(2)]
+
+        self.assertEqual(['host1', 'host1'],
+                         [finder.wait() for finder in finders])
+        self.assertEqual(2, self.host_obj.show_initiators_bulk.call_count)
+        self.assertEqual(2, self.host_obj.list_initiator_uris.call_count)
+        self.assertFalse(self.host_obj.search_initiators.called)
+
+
+class ExportGroupIndexTest(test.TestCase):
+
+    def setUp(self):
+        super(ExportGroupIndexTest, self).setUp()
+        self.exportgroup_obj = Mock()
+        self.exportgroup_obj.exportgroup_list.return_value = ['eg1', 'eg2']
+        self.exportgroup_obj.exportgroup_show_bulk.return_value = [
+            {'id': 'eg1', 'varray': {'id': 'varray1'},
+             'initiators': [{'initiator_port': 'port1'},
+                            {'initiator_port': 'port2'}]},
+            {'id': 'eg2', 'varray': {'id': 'varray2'},
+             'initiators': [{'initiator_port': 'port1'}]}]
+        self.index = coprhd_eg.ExportGroupIndex(self.exportgroup_obj,
+                                                'project', 'tenant')
+
+    def test_find(self):
+        self.assertEqual('eg1', self.index.find(['port2', 'port1'],
+                                                'varray1'))
+        self.assertEqual('eg2', self.index.find(['port1', 'port3'],
+                                                'varray2'))
+        self.assertIsNone(self.index.find(['port1'], 'varray1'))
+        self.exportgroup_obj.exportgroup_show_bulk.assert_called_once_with(
+            ['eg1', 'eg2'])
+        self.assertFalse(self.exportgroup_obj.exportgroup_show.called)
+
+    def test_add_and_discard(self):
+        self.index.load()
+        self.index.add('eg3', ['port3'], 'varray1')
+        self.assertEqual('eg3', self.index.find(['port3'], 'varray1'))
+        self.index.discard('eg1')
+        self.assertIsNone(self.index.find(['port1', 'port2'], 'varray1'))
+
+    def test_concurrent_reload(self):
+        self.index.load()
+        groups = self.exportgroup_obj.exportgroup_show_bulk.return_value
+
+        def show_bulk(uris):
+            # the index is used while the reload waits for CoprHD
+            self.assertEqual('eg1', self.index._keys.get(
+                (frozenset(['port1', 'port2']), 'varray1')))
+            self.index.add('eg3', ['port3'], 'varray1')
+            eventlet.sleep(0.01)
+            return groups
+
+        self.exportgroup_obj.exportgroup_show_bulk.side_effect = show_bulk
+        self.index.invalidate()
+        finders = [eventlet.spawn(self.index.find, ['port1', 'port2'],
+                                  'varray1') for x in range(2)]
+
+        self.assertEqual(['eg1', 'eg1'],
+                         [finder.wait() for finder in finders])
+        self.assertEqual(
+            2, self.exportgroup_obj.exportgroup_show_bulk.call_count)
+        self.assertEqual('eg3', self.index.find(['port3'], 'varray1'))
+
+
+class LatencyRecorderTest(test.TestCase):
+
+    def test_percentiles(self):
+        recorder = coprhd_utils.LatencyRecorder(size=100)
+        for x in range(200):
+            recorder.record(x % 100 / 10.0)
+
+        stats = recorder.get_stats()
+        self.assertEqual(200, stats['count'])
+        self.assertEqual(5.0, stats['p50'])
+        self.assertEqual(9.0, stats['p90'])
+        self.assertEqual(9.9, stats['p99'])
+        self.assertEqual(9.9, stats['max'])
+
+
+class RequestBatcherTest(test.TestCase):
+
+    def setUp(self):
+        super(RequestBatcherTest, self).setUp()
+        self.flush = Mock(side_effect=lambda key, items: dict(
+            (item, ValueError(item) if item == 'bad' else key + item)
+            for item in items))
+        self.batcher = coprhd_utils.RequestBatcher(self.flush, 0.01)
+
+    def _submit_all(self, key, items):
+        waiters = [eventlet.spawn(self.batcher.submit, key, item)
+                   for item in items]
+        results = []
+        for waiter in waiters:
+            try:
+                results.append(waiter.wait())
+            except ValueError as e:
+                results.append(e)
+        return results
+
+    def test_requests_are_merged(self):
+        results = self._submit_all('eg1-', ['vol1', 'vol2', 'bad'])
+
+        self.flush.assert_called_once_with('eg1-', ['vol1', 'vol2', 'bad'])
+        self.assertEqual(['eg1-vol1', 'eg1-vol2'], results[:2])
+        self.assertIsInstance(results[2], ValueError)
+        self.assertEqual({'batches': 1, 'items': 3, 'pending': 0},
+                         self.batcher.get_stats())
+
+    def test_flush_error_is_raised_to_all(self):
+        self.flush.side_effect = ValueError('failed')
+        results = self._submit_all('eg1-', ['vol1', 'vol2'])
+        self.assertEqual(2, len([r for r in results
+                                 if isinstance(r, ValueError)]))
+
+    def test_full_batch_is_flushed(self):
+        self.batcher.window = 60
+        self.batcher.max_size = 2
+        self.assertEqual(['eg1-vol1', 'eg1-vol2'],
+                         self._submit_all('eg1-', ['vol1', 'vol2']))
+
+    def test_full_batch_does_not_grow(self):
+        self.batcher.max_size = 2
+        self.assertEqual(['eg1-vol1', 'eg1-vol2', 'eg1-vol3'],
+                         self._submit_all('eg1-', ['vol1', 'vol2', 'vol3']))
+        self.assertEqual([mock.call('eg1-', ['vol1', 'vol2']),
+                          mock.call('eg1-', ['vol3'])],
+                         self.flush.call_args_list)
+
+
+class ExportBatchTest(test.TestCase):
+
+    def setUp(self):
+        super(ExportBatchTest, self).setUp()
+        self.common = MockedEMCCoprHDDriverCommon(
+            protocol="FC", default_backend_name="EMCViPRFCDriver",
+            configuration=Mock())
+        self.common.exportgroup_obj = Mock()
+        itls = [{'hlu': hlu, 'initiator': {'port': port},
+                 'device': {'id': vol_uri}}
+                for hlu, port, vol_uri in ((1, 'port1', 'vol1'),
+                                           (2, 'port1', 'vol2'),
+                                           (3, 'port9', 'vol2'))]
+        self.fetch = self.mock_object(
+            self.common, '_fetch_exports_by_initiators', return_value=itls)
+
+    def test_attach_batch(self):
+        found = self.common._attach_batch(('eg1', ('port1',)),
+                                          ['vol1', 'vol2'])
+
+        exportgroup_obj = self.common.exportgroup_obj
+        exportgroup_obj.exportgroup_add_volumes_by_uri.assert_called_once_with(
+            'eg1', ['vol1', 'vol2'], True)
+        self.assertEqual(1, self.fetch.call_count)
+        self.assertEqual([1], [itl['hlu'] for itl in found['vol1']])
+        self.assertEqual([2], [itl['hlu'] for itl in found['vol2']])
+
+    def test_detach_batch(self):
+        removed = frozenset(['vol1', 'vol2'])
+        self.assertEqual({'vol1': removed, 'vol2': removed},
+                         self.common._detach_batch('eg1', ['vol1', 'vol2']))
+        remove_volumes = (
+            self.common.exportgroup_obj.exportgroup_remove_volumes_by_uri)
+        remove_volumes.assert_called_once_with('eg1', ['vol1', 'vol2'], True)
+
+    def test_concurrent_detaches_count_remaining_volumes(self):
+        itls = [{'initiator': {'port': 'port1'}, 'export': {'id': 'eg1'},
+                 'device': {'id': vol_uri}} for vol_uri in ('vol1', 'vol2')]
+        remove_volumes = (
+            self.common.exportgroup_obj.exportgroup_remove_volumes_by_uri)
+        # the map fetched by each detach lists both volumes
+        self.fetch.return_value = itls
+        self.mock_object(self.common, '_get_coprhd_volume_uri',
+                         side_effect=lambda volume: volume)
+        self.common.detach_batcher = coprhd_utils.RequestBatcher(
+            self.common._detach_batch, 0.01)
+
+        detaches = [eventlet.spawn(self.common.detach_volume, vol_uri, 'FC',
+                                   ['port1'], 'host1')
+                    for vol_uri in ('vol1', 'vol2')]
+
+        self.assertEqual([0, 0], [detach.wait()[1] for detach in detaches])
+        self.assertEqual(1, remove_volumes.call_count)
+        self.assertEqual(2, self.fetch.call_count)
+
+
+class SingleFlightTest(test.TestCase):
+
+    def setUp(self):
+        super(SingleFlightTest, self).setUp()
+        self.flight = coprhd_utils.SingleFlight()
+
+    def _create(self, hostname):
+        eventlet.sleep(0.01)
+        return hostname + 'SG'
+
+    def test_concurrent_calls_are_shared(self):
+        create = Mock(side_effect=self._create)
+        waiters = [eventlet.spawn(self.flight.do, 'host1', create, 'host1')
+                   for x in range(3)]
+
+        self.assertEqual(['host1SG'] * 3,
+                         [waiter.wait() for waiter in waiters])
+        create.assert_called_once_with('host1')
+        self.assertEqual({'calls': 1, 'shared': 2, 'running': 0},
+                         self.flight.get_stats())
+
+    def test_error_is_shared(self):
+        create = Mock(side_effect=coprhd_utils.CoprHdError(
+            coprhd_utils.CoprHdError.SOS_FAILURE_ERR, 'failed'))
+        self.assertRaises(coprhd_utils.CoprHdError,
+                          self.flight.do, 'host1', create)
+        self.assertEqual('host1SG',
+                         self.flight.do('host1', self._create, 'host1'))
+
+    def test_leader_timeout_is_raised_to_waiters(self):
+        def leader():
+            with eventlet.Timeout(0.01):
+                self.flight.do('host1', eventlet.sleep, 1)
+
+        leading = eventlet.spawn(leader)
+        eventlet.sleep(0)
+        waiter = eventlet.spawn(self.flight.do, 'host1', eventlet.sleep, 1)
+
+        self.assertRaises(eventlet.Timeout, leading.wait)
+        self.assertRaises(coprhd_utils.CoprHdError, waiter.wait)
+        self.assertEqual({'calls': 1, 'shared': 1, 'running': 0},
+                         self.flight.get_stats())
+
+
+class FanOutTest(test.TestCase):
+
+    def setUp(self):
+        super(FanOutTest, self).setUp()
+        self.fan_out = coprhd_utils.FanOut(concurrency=2)
+        self.running = 0
+        self.max_running = 0
+
+    def _show(self, uri):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        eventlet.sleep(0.01)
+        self.running -= 1
+        if uri == 'bad_uri':
+            raise coprhd_utils.CoprHdError(
+                coprhd_utils.CoprHdError.NOT_FOUND_ERR, uri)
+        return {'id': uri, 'name': uri + '_name'}
+
+    def test_map_is_bounded_and_ordered(self):
+        uris = ['uri%d' % i for i in range(5)]
+        results = self.fan_out.map(self._show, uris)
+        self.assertEqual(uris, [result['id'] for result in results])
+        self.assertEqual(2, self.max_running)
+
+    def test_find_stops_at_match(self):
+        show = Mock(side_effect=self._show)
+        uris = ['uri%d' % i for i in range(10)]
+        result = self.fan_out.find(
+            show, uris, lambda detail: detail['name'] == 'uri1_name')
+        self.assertEqual('uri1', result['id'])
+        # the requests in flight at the match are not cancelled
+        self.assertLessEqual(show.call_count, 3)
+        self.assertEqual(1, self.fan_out.get_stats()['early_exits'])
+
+    def test_errors_are_aggregated(self):
+        uris = ['bad_uri', 'uri1', 'bad_uri']
+        exc = self.assertRaises(coprhd_utils.CoprHdError,
+                                self.fan_out.map, self._show, uris)
+        self.assertEqual(coprhd_utils.CoprHdError.NOT_FOUND_ERR,
+                         exc.err_code)
+        self.assertEqual(2, self.fan_out.get_stats()['errors'])
+
+    def test_find_ignores_errors_on_match(self):
+        result = self.fan_out.find(
+            self._show, ['bad_uri', 'uri1'],
+            lambda detail: detail['name'] == 'uri1_name')
+        self.assertEqual('uri1', result['id'])
+
+
+class ExportGroupTest(test.TestCase):
+
+    def setUp(self):
+        super(ExportGroupTest, self).setUp()
+        self.exportgroup_obj = coprhd_eg.ExportGroup("10.10.10.10", 4443)
+        self.request = self.mock_object(
+            self.exportgroup_obj, 'send_json_request',
+            return_value={'id': 'task_id', 'resource': {}})
+
+    def test_add_volumes_by_uri(self):
+        self.exportgroup_obj.exportgroup_add_volumes_by_uri(
+            'eg1', ['vol1', 'vol2'], luns={'vol2': 5})
+        self.request.assert_called_once_with(
+            'eg1', {'volume_changes': {'add': [{'id': 'vol1'},
+                                               {'id': 'vol2', 'lun': 5}]}})
+
+    def test_volume_uris_are_not_queried(self):
+        self.mock_object(coprhd_vol.Volume, 'volume_query')
+        self.assertEqual(
+            [{'id': 'urn:storageos:Volume:1'}],
+            self.exportgroup_obj._get_resource_lun_tuple(
+                ['urn:storageos:Volume:1'], "volumes", None, 'tenant',
+                'project', None))
+        self.assertFalse(coprhd_vol.Volume.volume_query.called)
+
+
+class ITLCacheTest(test.TestCase):
+
+    def setUp(self):
+        super(ITLCacheTest, self).setUp()
+        self.common = MockedEMCCoprHDDriverCommon(
+            protocol="FC", default_backend_name="EMCViPRFCDriver",
+            configuration=Mock())
+        self.fetch = self.mock_object(
+            self.common, '_fetch_exports_by_initiators',
+            return_value=fcitl_itl_list['itl'])
+
+    def get_exports(self, initiator_ports):
+        # the cached lookup, not the one of the mocked driver
+        return coprhd_common.EMCCoprHDDriverCommon.get_exports_by_initiators(
+            self.common, initiator_ports)
+
+    def test_initiators_map_is_cached(self):
+        self.assertEqual(2, len(self.get_exports(['port1', 'port2'])))
+        self.assertEqual(2, len(self.get_exports(['port2', 'port1'])))
+        self.assertEqual(1, self.fetch.call_count)
+        self.assertEqual({'size': 1, 'hits': 1, 'misses': 1},
+                         self.common.itl_cache.get_stats())
+
+    def test_export_change_invalidates_map(self):
+        self.get_exports(['port1', 'port2'])
+        self.common.itl_cache.put_volume('vol1', [])
+        self.common.itl_cache.invalidate('vol1', ['port2'])
+
+        self.assertIsNone(self.common.itl_cache.get_volume('vol1'))
+        self.get_exports(['port1', 'port2'])
+        self.assertEqual(2, self.fetch.call_count)
+
+    def test_port_index_is_pruned(self):
+        itl_cache = coprhd_utils.ITLCache(maxsize=2, ttl=60)
+        itl_cache.put_initiators(['port1', 'port2'], [])
+        itl_cache.put_initiators(['port2', 'port3'], [])
+        itl_cache.put_initiators(['port4'], [])
+        # the least recently used set was evicted
+        self.assertEqual(set(['port2', 'port3', 'port4']),
+                         set(itl_cache._keys_by_port))
+
+        itl_cache.invalidate(initiator_ports=['port3'])
+        self.assertEqual(['port4'], list(itl_cache._keys_by_port))
+
+    def test_port_index_drops_expired_sets(self):
+        itl_cache = coprhd_utils.ITLCache(ttl=0)
+        itl_cache.put_initiators(['port1'], [])
+        self.assertIsNone(itl_cache.get_initiators(['port1']))
+        self.assertEqual({}, itl_cache._keys_by_port)
+
+    def test_device_info_of_exported_volume_is_cached(self):
+        initiator_ports = ["12:34:56:78:90:12:34:56"]
+        self.assertEqual(2, len(self.common._find_device_info(
+            None, initiator_ports, 'vol1')))
+        self.assertEqual(2, len(self.common._find_device_info(
+            None, initiator_ports, 'vol1')))
+        get_exports_by_uri = self.common.volume_obj.get_exports_by_uri
+        self.assertEqual(1, get_exports_by_uri.call_count)
+
+
+class BackgroundRefresherTest(test.TestCase):
+
+    def setUp(self):
+        super(BackgroundRefresherTest, self).setUp()
+        self.func = Mock(return_value={'free_capacity_gb': 100})
+        self.refresher = coprhd_utils.BackgroundRefresher(
+            self.func, 60, 30, 180)
+
+    def test_first_get_refreshes(self):
+        self.assertEqual(({'free_capacity_gb': 100}, False),
+                         self.refresher.get())
+        self.refresher.get()
+        self.assertEqual(1, self.func.call_count)
+        self.assertEqual(1, self.refresher.get_stats()['durations']['count'])
+
+    def test_failure_keeps_last_result(self):
+        self.refresher.refresh()
+        self.func.side_effect = coprhd_utils.CoprHdError(
+            coprhd_utils.CoprHdError.HTTP_ERR, 'timed out')
+        self.refresher.refresh()
+
+        self.assertEqual(({'free_capacity_gb': 100}, False),
+                         self.refresher.get())
+        self.assertEqual(1, self.refresher.get_stats()['failures'])
+
+    def test_old_result_is_stale(self):
+        self.refresher.max_age = -1
+        self.refresher.refresh()
+        self.assertEqual(({'free_capacity_gb': 100}, True),
+                         self.refresher.get())
+
+
+class AuthenticationTest(test.TestCase):
+
+    def test_login_has_its_own_session(self):
+        transport = coprhd_utils.CoprHDTransport("10.10.10.10", 4443)
+        self.mock_object(transport.session, 'request')
+        session = self.mock_object(coprhd_auth.requests, 'Session')
+        session.return_value.get.return_value = Mock(
+            status_code=200, headers={'X-SDS-AUTH-TOKEN': 'token1'})
+
+        auth = coprhd_auth.Authentication("10.10.10.10", 4443, transport)
+        self.assertEqual('token1', auth.authenticate_user('user', 'password'))
+        self.assertFalse(transport.session.request.called)
+        session.return_value.close.assert_called_once_with()
+
+
+class TokenManagerTest(test.TestCase):
+
+    def setUp(self):
+        super(TokenManagerTest, self).setUp()
+        self.auth = Mock()
+        self.auth.authenticate_user.side_effect = self._login
+        self.tokens = iter(['token1', 'token2'])
+        self.manager = coprhd_auth.TokenManager(self.auth, 'user',
+                                                'password', 3600)
+
+    def _login(self, username, password):
+        eventlet.sleep(0.01)
+        return next(self.tokens)
+
+    def test_one_login_for_concurrent_callers(self):
+        waiters = [eventlet.spawn(self.manager.get_token)
+                   for x in range(3)]
+
+        self.assertEqual(['token1'] * 3,
+                         [waiter.wait() for waiter in waiters])
+        self.assertEqual(1, self.manager.logins)
+
+    def test_rejected_token_is_renewed(self):
+        self.manager.get_token()
+        self.manager.invalidate('token1')
+
+        self.assertEqual('token2', self.manager.get_token())
+        stats = self.manager.get_stats()
+        self.assertEqual(2, stats['logins'])
+        self.assertEqual(1, stats['rejections'])
+
+    def test_old_token_is_renewed_in_background(self):
+        self.manager.get_token()
+        self.manager.lifetime = -1
+
+        self.assertEqual('token1', self.manager.get_token())
+        eventlet.sleep(0.05)
+        self.assertEqual(2, self.manager.logins)
+        self.manager.lifetime = 3600
+        self.assertEqual('token2', self.manager.get_token())
+
+    def test_token_is_saved_and_reused(self):
+        cache_file = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                  'coprhd.token')
+        manager = coprhd_auth.TokenManager(self.auth, 'user', 'password',
+                                           3600, cache_file)
+        self.assertEqual('token1', manager.get_token())
+        self.assertEqual(0o600, stat.S_IMODE(os.stat(cache_file).st_mode))
+
+        self.auth.check_token.return_value = True
+        restarted = coprhd_auth.TokenManager(self.auth, 'user', 'password',
+                                             3600, cache_file)
+        self.assertEqual('token1', restarted.get_token())
+        self.auth.check_token.assert_called_once_with('token1')
+        self.assertEqual(0, restarted.logins)
+        self.assertEqual(1, restarted.cached_tokens)
+
+    def test_saves_leave_no_temp_file(self):
+        cache_dir = self.useFixture(fixtures.TempDir()).path
+        cache_file = os.path.join(cache_dir, 'coprhd.token')
+        managers = [coprhd_auth.TokenManager(self.auth, 'user', 'password',
+                                             3600, cache_file)
+                    for x in range(2)]
+        managers[0]._save_token('token1')
+        managers[1]._save_token('token2')
+
+        self.assertEqual(['coprhd.token'], os.listdir(cache_dir))
+        with open(cache_file) as f:
+            self.assertEqual('token2', f.read())
@@ -0,0 +1,134 @@
+# Copyright (c) 2016 EMC Corporation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Micro-benchmark of commoncoprhdapi.json_decode.
+
+Compares json_decode with the former decoding, which re-encoded every
+node through a recursive object_hook, on large CoprHD payloads:
+
+    python tools/json_decode_benchmark.py [recorded_response.json ...]
+
+Without arguments, a volume search with 10000 resources and an ITL list
+with 5000 entries shaped like the CoprHD responses are generated.
+"""
+
+import json
+import sys
+import timeit
+import uuid
+
+import six
+
+from cinder.volume.drivers.coprhd.helpers import commoncoprhdapi as common
+
+ROUNDS = 5
+
+
+def _legacy_decode_list(data):
+    rv = []
+    for item in data:
+        if isinstance(item, six.text_type):
+            item = item.encode('utf-8')
+        elif isinstance(item, list):
+            item = _legacy_decode_list(item)
+        elif isinstance(item, dict):
+            item = _legacy_decode_dict(item)
+        rv.append(item)
+    return rv
+
+
+def _legacy_decode_dict(data):
+    rv = {}
+    for key, value in data.items():
+        if isinstance(key, six.text_type):
+            key = key.encode('utf-8')
+        if isinstance(value, six.text_type):
+            value = value.encode('utf-8')
+        elif isinstance(value, list):
+            value = _legacy_decode_list(value)
+        elif isinstance(value, dict):
+            value = _legacy_decode_dict(value)
+        rv[key] = value
+    return rv
+
+
+def legacy_json_decode(rsp):
+    return json.loads(rsp, object_hook=_legacy_decode_dict)
+
+
+def _urn(kind):
+    return 'urn:storageos:%s:%s:vdc1' % (kind, uuid.uuid4())
+
+
+def volume_search(count=10000):
+    resources = []
+    for i in range(count):
+        uri = _urn('Volume')
+        resources.append({'id': uri,
+                          'match': 'volume-%d' % i,
+                          'link': {'rel': 'self',
+                                   'href': '/block/volumes/' + uri}})
+    return json.dumps({'resource': resources})
+
+
+def itl_list(count=5000):
+    itls = []
+    for i in range(count):
+        volume_uri = _urn('Volume')
+        itls.append({
+            'hlu': i % 256,
+            'initiator': {'id': _urn('Initiator'),
+                          'link': {'rel': 'self', 'href': '/compute/'},
+                          'port': '10:00:00:00:c9:00:%02x:%02x' % (
+                              i // 256 % 256, i % 256)},
+            'export': {'id': _urn('ExportGroup'),
+                       'name': 'hostSG-%d' % (i // 64),
+                       'link': {'rel': 'self', 'href': '/block/exports/'}},
+            'device': {'id': volume_uri,
+                       'link': {'rel': 'self',
+                                'href': '/block/volumes/' + volume_uri},
+                       'wwn': '60000970000195701573533030%04X' % i},
+            'target': {'id': _urn('StoragePort'),
+                       'link': {'rel': 'self', 'href': '/vdc/storage-ports'},
+                       'port': '50:00:09:73:00:18:95:%02x' % (i % 256),
+                       'ip_address': '10.10.10.10',
+                       'tcp_port': '3260'},
+            'san_zone_name': 'zone_%d' % i})
+    return json.dumps({'itl': itls})
+
+
+def run(name, payload):
+    legacy = min(timeit.repeat(lambda: legacy_json_decode(payload),
+                               number=1, repeat=ROUNDS))
+    current = min(timeit.repeat(lambda: common.json_decode(payload),
+                                number=1, repeat=ROUNDS))
+    print('%-24s %8d KiB  legacy %8.1f ms  json_decode %8.1f ms  x%.1f' %
+          (name, len(payload) // 1024, legacy * 1000, current * 1000,
+           legacy / current))
+
+
+def main(paths):
+    print('JSON backend: %s' % ('orjson' if common.orjson else 'json'))
+    if paths:
+        for path in paths:
+            with open(path) as f:
+                run(path, f.read())
+    else:
+        run('volume search (10000)', volume_search())
+        run('ITL list (5000)', itl_list())
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])